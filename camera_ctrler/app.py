@@ -21,8 +21,14 @@ import sys
 import json
 
 # Local imports
-from redis_utils import init_redis, CameraSnapFetcher, get_all_camera_status
+from redis_utils import init_redis, CameraSnapFetcher, get_all_camera_status, get_frame, get_frame_data, get_frame_size
+from frame_codec import as_jpeg
 from camera_manager import CameraManager
+from archive_index import ArchiveIndex
+from blocking_io import run_blocking
+from retention import RetentionService
+from stream_broadcaster import StreamHub
+from time_stamped_images import TimeStampedImages
 from config import config
 
 # Setup logging
@@ -53,6 +59,35 @@ except Exception as e:
     logger.error(f"Failed to initialize camera manager: {e}")
     sys.exit(1)
 
+def remove_empty_dir(path):
+    """刪除分段檔後，順便移除已清空的日期資料夾"""
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+# 存檔影像的時間索引；啟動時由分段檔重建，僅一個 worker 負責背景同步與保留期限清理
+archive_index = None
+try:
+    archive_index = ArchiveIndex(config.ARCHIVE_INDEX_PATH, config.ARCHIVE_DIR)
+    if archive_index.start(config.ARCHIVE_INDEX_INTERVAL):
+        logger.info("Archive index sync started")
+        archive_retention = RetentionService(
+            'archive',
+            archive_index,
+            max_age_seconds=config.RETENTION_HOURS * 3600,
+            quota_bytes=config.ARCHIVE_QUOTA_MB * 1024 * 1024,
+            deletes_per_second=config.RETENTION_DELETES_PER_SECOND,
+            interval=config.RETENTION_INTERVAL,
+            redis_client=r,
+            on_delete=remove_empty_dir,
+        )
+        # 刪檔與 SQLite 操作在原生執行緒執行，不阻塞 gevent worker
+        threading.Thread(target=run_blocking, args=(archive_retention.run,), daemon=True,
+                         name='retention-archive').start()
+except Exception as e:
+    logger.error(f"Failed to initialize archive index: {e}")
+
 
 @api.route('/camera_status')
 class CameraStatus(Resource):
@@ -78,14 +113,14 @@ class CameraStatus(Resource):
 
 @app.route('/get_snapshot/<camera_id>')
 def get_latest_frame(camera_id):
-    """獲取指定相機的最新快照"""
+    """獲取指定相機的最新快照，可用 ?rendition=<name> 取縮放影像"""
     try:
         # 驗證 camera_id
         if not camera_id or not isinstance(camera_id, str):
             logger.warning(f"Invalid camera_id: {camera_id}")
             return send_file('no_single.jpg', mimetype='image/jpeg')
             
-        image_data = r.get(f'camera_{camera_id}_latest_frame')
+        image_data = get_frame(r, camera_id, request.args.get('rendition'))
         if image_data:
             logger.debug(f"Retrieved snapshot for camera {camera_id}")
             return Response(image_data, mimetype='image/jpeg')
@@ -112,147 +147,234 @@ def get_image(image_path):
         logger.error(f"Error serving image {image_path}: {e}")
         return send_file('no_single.jpg', mimetype='image/jpeg')
 
-def generate_frames(camera_id):
-    """生成相機串流畫面"""
-    frame_key = f'camera_{camera_id}_latest_frame'
-    consecutive_failures = 0
-    max_failures = 10
-    
-    logger.info(f"Starting frame generation for camera {camera_id}")
-    
-    while consecutive_failures < max_failures:
-        try:
-            frame_data = r.get(frame_key)
-            if frame_data:
-                consecutive_failures = 0  # 重設失敗計數
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
-            else:
-                consecutive_failures += 1
-                logger.debug(f"No frame data for camera {camera_id}, failures: {consecutive_failures}")
-                
-        except Exception as e:
-            consecutive_failures += 1
-            logger.error(f"Error generating frame for camera {camera_id}: {e}")
-            
-        time.sleep(config.STREAM_SLEEP_INTERVAL)
-    
-    logger.warning(f"Stopping frame generation for camera {camera_id} after {max_failures} consecutive failures")
-
-def generate_recognized_frames(camera_id):
-    """生成帶有物件識別結果的串流畫面"""
+def render_recognized_frame(camera_id, frame_data):
+    """在帶框影像上繪製偵測區域多邊形與時間區段外的遮罩，回傳 JPEG"""
     polygons_key = f'polygons_{camera_id}'
     start_time_key = f'start_time_{camera_id}'
     end_time_key = f'end_time_{camera_id}'
-    frame_key = f'camera_{camera_id}_boxed_image'
-    
-    consecutive_failures = 0
-    max_failures = 10
-    
-    logger.info(f"Starting recognized frame generation for camera {camera_id}")
+    transform_key = f'camera_{camera_id}_boxed_transform'
+
+    frame_data = as_jpeg(frame_data)
+    if not frame_data:
+        return None
 
-    while consecutive_failures < max_failures:
+    # 將影像數據轉換成 PIL 影像格式
+    image = Image.open(io.BytesIO(frame_data)).convert("RGBA")
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))  # 建立一個空的透明圖層
+    draw = ImageDraw.Draw(overlay)
+
+    # 獲取當前時間（當地時間）
+    current_time = datetime.now()
+    current_hour = current_time.hour
+    current_minute = current_time.minute
+
+    # 獲取設定的開始和結束時間
+    start_time_str = r.get(start_time_key)
+    end_time_str = r.get(end_time_key)
+
+    in_time_interval = False
+    if start_time_str and end_time_str:
         try:
-            frame_data = r.get(frame_key)
-            
-            if frame_data:
-                consecutive_failures = 0
-                # 將影像數據轉換成 PIL 影像格式
-                image = Image.open(io.BytesIO(frame_data)).convert("RGBA")
-                overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))  # 建立一個空的透明圖層
-                draw = ImageDraw.Draw(overlay)
-
-                # 獲取當前時間（當地時間）
-                current_time = datetime.now()
-                current_hour = current_time.hour
-                current_minute = current_time.minute
-
-                # 獲取設定的開始和結束時間
-                start_time_str = r.get(start_time_key)
-                end_time_str = r.get(end_time_key)
-
-                in_time_interval = False
-                if start_time_str and end_time_str:
-                    try:
-                        start_hour, start_minute = map(int, start_time_str.decode('utf-8').split(':'))
-                        end_hour, end_minute = map(int, end_time_str.decode('utf-8').split(':'))
-
-                        # 檢查當前時間是否在設定的時間區段內
-                        start_total_minutes = start_hour * 60 + start_minute
-                        end_total_minutes = end_hour * 60 + end_minute
-                        current_total_minutes = current_hour * 60 + current_minute
-
-                        if start_total_minutes <= current_total_minutes <= end_total_minutes:
-                            in_time_interval = True
-                    except (ValueError, AttributeError) as e:
-                        logger.warning(f"Error parsing time interval for camera {camera_id}: {e}")
-                        in_time_interval = True
-                else:
-                    # 如果沒有設定時間區段，則視為不限制時間
-                    in_time_interval = True
-
-                # 加載並繪製多邊形
-                try:
-                    for key in r.scan_iter(f"{polygons_key}:*"):
-                        polygon_data = r.get(key)
-                        if polygon_data:
-                            polygon = json.loads(polygon_data)
-                            scaled_polygon = [(point['x'], point['y']) for point in polygon['points']]
-                            # 使用白色邊框，透明填充多邊形
-                            draw.polygon(scaled_polygon, outline="white", fill=(255, 255, 255, 80))
-                except Exception as e:
-                    logger.warning(f"Error drawing polygons for camera {camera_id}: {e}")
-
-                # 如果在時間區段內，對整個影像進行處理（例如，加上半透明覆蓋）
-                if in_time_interval:
-                    pass  # 如果需要，可以在這裡進行額外的處理
-                else:
-                    # 如果不在時間區段內，可能需要對影像進行不同的處理
-                    time_overlay = Image.new("RGBA", image.size, (0, 0, 0, 180))  # 深色半透明覆蓋
-                    overlay = Image.alpha_composite(overlay, time_overlay)
-
-                # 合併原影像與覆蓋圖層
-                combined_image = Image.alpha_composite(image, overlay).convert("RGB")
-
-                # 將繪製了多邊形的影像重新編碼為JPEG格式
-                img_io = io.BytesIO()
-                combined_image.save(img_io, 'JPEG')
-                img_io.seek(0)
-
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + img_io.getvalue() + b'\r\n')
-            else:
-                consecutive_failures += 1
-                logger.debug(f"No frame data for camera {camera_id}, failures: {consecutive_failures}")
-                
-        except Exception as e:
-            consecutive_failures += 1
-            logger.error(f"Error generating recognized frame for camera {camera_id}: {e}")
-            
-        time.sleep(0.1)
+            start_hour, start_minute = map(int, start_time_str.decode('utf-8').split(':'))
+            end_hour, end_minute = map(int, end_time_str.decode('utf-8').split(':'))
+
+            # 檢查當前時間是否在設定的時間區段內
+            start_total_minutes = start_hour * 60 + start_minute
+            end_total_minutes = end_hour * 60 + end_minute
+            current_total_minutes = current_hour * 60 + current_minute
+
+            if start_total_minutes <= current_total_minutes <= end_total_minutes:
+                in_time_interval = True
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Error parsing time interval for camera {camera_id}: {e}")
+            in_time_interval = True
+    else:
+        # 如果沒有設定時間區段，則視為不限制時間
+        in_time_interval = True
+
+    # 多邊形以原圖座標儲存；帶框影像若來自縮放影像，依其轉換對齊
+    scale_x, scale_y, pad_x, pad_y = 1.0, 1.0, 0, 0
+    transform = r.get(transform_key)
+    if transform:
+        try:
+            values = [float(v) for v in transform.decode('utf-8').split(',')]
+            if len(values) == 3:
+                # 舊格式 "scale,pad_x,pad_y"
+                values.insert(1, values[0])
+            scale_x, scale_y, pad_x, pad_y = values
+        except ValueError:
+            logger.warning(f"Invalid boxed image transform for camera {camera_id}: {transform}")
+
+    # 加載並繪製多邊形
+    try:
+        for key in r.scan_iter(f"{polygons_key}:*"):
+            polygon_data = r.get(key)
+            if polygon_data:
+                polygon = json.loads(polygon_data)
+                scaled_polygon = [(point['x'] * scale_x + pad_x, point['y'] * scale_y + pad_y)
+                                  for point in polygon['points']]
+                # 使用白色邊框，透明填充多邊形
+                draw.polygon(scaled_polygon, outline="white", fill=(255, 255, 255, 80))
+    except Exception as e:
+        logger.warning(f"Error drawing polygons for camera {camera_id}: {e}")
+
+    # 如果在時間區段內，對整個影像進行處理（例如，加上半透明覆蓋）
+    if in_time_interval:
+        pass  # 如果需要，可以在這裡進行額外的處理
+    else:
+        # 如果不在時間區段內，可能需要對影像進行不同的處理
+        time_overlay = Image.new("RGBA", image.size, (0, 0, 0, 180))  # 深色半透明覆蓋
+        overlay = Image.alpha_composite(overlay, time_overlay)
+
+    # 合併原影像與覆蓋圖層
+    combined_image = Image.alpha_composite(image, overlay).convert("RGB")
+
+    # 將繪製了多邊形的影像重新編碼為JPEG格式
+    img_io = io.BytesIO()
+    combined_image.save(img_io, 'JPEG')
+    return img_io.getvalue()
+
+# 每台攝影機一個廣播執行緒，由新影像通知喚醒，同一份影像分送給所有觀看者
+live_streams = StreamHub(
+    'live', r,
+    channel=lambda camera_id: f'camera_{camera_id}_frame_ready',
+    fetch=lambda camera_id: get_frame_data(r, camera_id, config.PREVIEW_RENDITION),
+    render=lambda camera_id, frame_data: as_jpeg(frame_data),
+    queue_size=config.STREAM_CLIENT_QUEUE,
+    poll_interval=config.STREAM_POLL_INTERVAL,
+    keepalive=config.STREAM_KEEPALIVE,
+)
+recognized_streams = StreamHub(
+    'recognized', r,
+    channel=lambda camera_id: f'camera_{camera_id}_boxed_ready',
+    fetch=lambda camera_id: r.get(f'camera_{camera_id}_boxed_image'),
+    render=render_recognized_frame,
+    queue_size=config.STREAM_CLIENT_QUEUE,
+    poll_interval=config.STREAM_POLL_INTERVAL,
+    keepalive=config.STREAM_KEEPALIVE,
+    # 多邊形與時間區段可能由其他 worker 修改，畫面不變時也定期重新繪製
+    rerender_interval=config.STREAM_KEEPALIVE,
+)
 
 # 辨識串流路由
 @app.route('/recognized_stream/<ID>')
 def recognized_stream(ID):
-    return Response(generate_recognized_frames(ID), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(recognized_streams.stream(ID), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 # 串流路由
 @app.route('/get_stream/<int:ID>')
 def get_stream(ID):
-    return Response(generate_frames(ID), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(live_streams.stream(ID), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+def generate_preview(camera_id):
+    """轉送 redisv1 的 fMP4 壓縮串流片段，不經解碼與 JPEG 重新編碼"""
+    init_key = f'camera_{camera_id}_preview_init'
+    stream_key = f'camera_{camera_id}_preview'
+    viewers_key = f'camera_{camera_id}_preview_viewers'
+    ttl = config.PREVIEW_VIEWER_TTL
+
+    # 登記觀看者，工作器看到後才啟動轉封裝
+    r.set(viewers_key, 1, ex=ttl)
+    deadline = time.time() + config.PREVIEW_START_TIMEOUT
+    init_segment = r.get(init_key)
+    while init_segment is None and time.time() < deadline:
+        time.sleep(0.5)
+        init_segment = r.get(init_key)
+    if init_segment is None:
+        logger.warning(f"Preview passthrough not available for camera {camera_id}")
+        return
+
+    # 從最新的片段（以關鍵影格開頭）開始播放
+    latest = r.xrevrange(stream_key, count=1)
+    if latest:
+        last_id = latest[0][0]
+        yield init_segment + latest[0][1][b'data']
+    else:
+        last_id = '$'
+        yield init_segment
+
+    last_refresh = time.time()
+    while True:
+        entries = r.xread({stream_key: last_id}, count=10, block=1000)
+        if time.time() - last_refresh >= ttl / 2:
+            r.set(viewers_key, 1, ex=ttl)
+            last_refresh = time.time()
+        for _, fragments in entries:
+            for entry_id, fields in fragments:
+                last_id = entry_id
+                yield fields[b'data']
+
+# 壓縮串流預覽路由（fMP4）
+@app.route('/get_preview/<int:ID>')
+def get_preview(ID):
+    return Response(generate_preview(ID), mimetype='video/mp4')
 
 # 快照 UI 路由
 @app.route('/snapshot_ui/<ID>')
 def snapshot_ui(ID):
-    image_key = f'camera_{ID}_latest_frame'
-    image_data = r.get(image_key)
+    image_data = get_frame(r, ID, config.PREVIEW_RENDITION)
     if image_data:
-        # 將圖片編碼為 Base64，傳遞給模板
+        # 將圖片編碼為 Base64，傳遞給模板；多邊形座標以原圖尺寸為準
         encoded_image = base64.b64encode(image_data).decode('utf-8')
-        return render_template('snapshot_ui.html', camera_id=ID, image_data=encoded_image)
+        frame_size = get_frame_size(r, ID)
+        frame_width = frame_size[0] if frame_size else 0
+        return render_template('snapshot_ui.html', camera_id=ID, image_data=encoded_image,
+                               frame_width=frame_width)
     else:
         return send_file('no_single.jpg', mimetype='image/jpeg')
 
+def query_archive(ID, start, end, limit, offset):
+    """時間範圍內的影像參照（分頁）與總數"""
+    images = TimeStampedImages(os.path.join(config.ARCHIVE_DIR, str(ID)), archive_index)
+    try:
+        refs = images.find_images_in_range(start, end, limit, offset)
+        # 索引已在上一行同步過
+        return refs, images.count_in_range(start, end, sync=False)
+    finally:
+        images.close()
+
+def read_archive_frame(ID, ts_ms):
+    """
+    單張存檔影像的 JPEG 內容，找不到時回傳 None。ts_ms 來自範圍查詢回傳的網址（四捨五入到毫秒），
+    因此在 ±0.5 ms 內取最接近的一張；網址都由已同步的範圍查詢產生，這裡不再同步索引。
+    """
+    images = TimeStampedImages(os.path.join(config.ARCHIVE_DIR, str(ID)), archive_index)
+    try:
+        refs = images.find_images_in_range((ts_ms - 0.5) / 1000, (ts_ms + 0.5) / 1000, sync=False)
+        if not refs:
+            return None
+        return images.read_image(min(refs, key=lambda ref: abs(ref.timestamp * 1000 - ts_ms)))
+    finally:
+        images.close()
+
+# 存檔影像時間範圍查詢（start/end 為 epoch 秒，limit/offset 分頁）
+@app.route('/archive/<int:ID>')
+def archive_range(ID):
+    try:
+        start = float(request.args['start'])
+        end = float(request.args.get('end', time.time()))
+        limit = min(int(request.args.get('limit', config.ARCHIVE_PAGE_LIMIT)), config.ARCHIVE_PAGE_LIMIT)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except (KeyError, ValueError):
+        return jsonify({"error": "start is required; start/end/limit/offset must be numbers"}), 400
+
+    # SQLite 查詢與分段檔讀取在原生執行緒執行，不阻塞 gevent worker
+    refs, total = run_blocking(query_archive, ID, start, end, limit, offset)
+    return jsonify({
+        "total": total,
+        "offset": offset,
+        "frames": [{"timestamp": ref.timestamp,
+                    "url": f"/archive/{ID}/{int(round(ref.timestamp * 1000))}"} for ref in refs]
+    })
+
+# 讀取單張存檔影像（ts_ms 為 epoch 毫秒）
+@app.route('/archive/<int:ID>/<int:ts_ms>')
+def archive_frame(ID, ts_ms):
+    jpeg = run_blocking(read_archive_frame, ID, ts_ms)
+    if jpeg is None:
+        return send_file('no_single.jpg', mimetype='image/jpeg')
+    return Response(jpeg, mimetype='image/jpeg')
+
 # 處理多邊形的路由
 @app.route('/rectangles/<ID>', methods=['POST', 'GET', 'DELETE'])
 def handle_polygons(ID):
@@ -0,0 +1,240 @@
+"""
+Archive Index
+Persistent SQLite index over the frame segments written by the redisv1
+workers, so time-range lookups are a B-tree range scan instead of opening
+every hourly segment in the range.
+
+Tables:
+    frames    (camera_id, ts_ms, path, offset, length), primary key (camera_id, ts_ms, path, offset)
+    segments  (path, camera_id, indexed, size) bookkeeping for incremental sync
+
+sync() only reads segments whose size changed since the last pass, and only
+the records beyond those already indexed; a missing or corrupt database is
+rebuilt from the segment files on startup. Every gunicorn worker may query
+and sync on demand; only the process holding the lock file runs the
+background loop, on a native thread (see blocking_io.py) so SQLite and file
+I/O never block a gevent worker's hub.
+"""
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from blocking_io import run_blocking
+from segment_archive import FrameRef, open_segment
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    camera_id INTEGER NOT NULL,
+    ts_ms INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (camera_id, ts_ms, path, offset)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS segments (
+    path TEXT PRIMARY KEY,
+    camera_id INTEGER NOT NULL,
+    indexed INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_by_hour ON segments (substr(path, -15));
+"""
+
+
+class ArchiveIndex:
+    """Range index over {base_dir}/{camera_id}/{YYYYMMDD}/{HH}.seg."""
+
+    def __init__(self, db_path, base_dir):
+        self.db_path = db_path
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self._lock_file = None
+        self.conn = self._connect()
+
+    def _connect(self):
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            conn.execute("PRAGMA quick_check").fetchone()
+            return conn
+        except sqlite3.DatabaseError as e:
+            # 索引可由分段檔完整重建，損毀時直接重建
+            logger.warning(f"Archive index {self.db_path} unusable ({e}); rebuilding from disk")
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            return conn
+
+    def _segment_files(self, camera_dir, since_day=None):
+        """Segment paths of a camera, limited to day folders >= since_day."""
+        try:
+            days = sorted(d for d in os.listdir(camera_dir) if d.isdigit() and (since_day is None or d >= since_day))
+        except OSError:
+            return []
+        paths = []
+        for day in days:
+            day_dir = os.path.join(camera_dir, day)
+            try:
+                paths.extend(os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir))
+                             if name.endswith('.seg'))
+            except OSError:
+                continue
+        return paths
+
+    def sync_camera(self, camera_id, full=False) -> int:
+        """Index new records of one camera; returns the number of frames added."""
+        camera_dir = os.path.join(self.base_dir, str(camera_id))
+        with self.lock:
+            known = {path: (indexed, size) for path, indexed, size in self.conn.execute(
+                "SELECT path, indexed, size FROM segments WHERE camera_id = ?", (camera_id,))}
+        # 一般同步只看最近一天起的資料夾；完整同步時掃描全部
+        since_day = None
+        if known and not full:
+            since_day = os.path.basename(os.path.dirname(max(known)))
+
+        added = 0
+        for path in self._segment_files(camera_dir, since_day):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            indexed, known_size = known.get(path, (0, -1))
+            if size == known_size:
+                continue
+            reader = open_segment(path)
+            if reader is None:
+                continue
+            try:
+                entries = reader.index[indexed:] if len(reader.index) >= indexed else reader.index
+                with self.lock, self.conn:
+                    if len(reader.index) < indexed:
+                        # 分段檔被截斷（工作器重新開啟並修剪殘缺紀錄），整檔重建
+                        self.conn.execute("DELETE FROM frames WHERE path = ?", (path,))
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO frames VALUES (?, ?, ?, ?, ?)",
+                        [(camera_id, int(ts * 1000), path, offset, length) for ts, offset, length in entries]
+                    )
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)",
+                        (path, camera_id, len(reader.index), size)
+                    )
+                added += len(entries)
+            finally:
+                reader.close()
+        return added
+
+    def camera_ids(self):
+        try:
+            return [int(name) for name in os.listdir(self.base_dir) if name.isdigit()]
+        except OSError:
+            return []
+
+    def sync(self, full=False) -> int:
+        return sum(self.sync_camera(camera_id, full) for camera_id in self.camera_ids())
+
+    def remove_segment(self, path):
+        """Drop a deleted segment from the index."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM frames WHERE path = ?", (path,))
+            self.conn.execute("DELETE FROM segments WHERE path = ?", (path,))
+
+    def prune_missing(self) -> int:
+        """Forget segments whose files were removed outside remove_segment()."""
+        with self.lock:
+            paths = [row[0] for row in self.conn.execute("SELECT path FROM segments")]
+        missing = [path for path in paths if not os.path.exists(path)]
+        for path in missing:
+            self.remove_segment(path)
+        return len(missing)
+
+    # retention.RetentionService 的索引介面：依小時由舊到新刪除整個分段檔
+
+    def oldest(self):
+        """(end of hour, path, size) of the oldest indexed segment across cameras."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path, size FROM segments ORDER BY substr(path, -15) LIMIT 1").fetchone()
+        if row is None:
+            return None
+        path, size = row
+        day, hour = path[-15:-7], path[-6:-4]
+        try:
+            hour_end = time.mktime(time.strptime(day + hour, '%Y%m%d%H')) + 3600
+        except ValueError:
+            hour_end = 0
+        return hour_end, path, size
+
+    def remove(self, path):
+        self.remove_segment(path)
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def query(self, camera_id, start_timestamp, end_timestamp, limit: Optional[int] = None,
+              offset: int = 0) -> List[FrameRef]:
+        """Frames of a camera within [start, end] (epoch seconds), oldest first, paginated."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ts_ms, path, offset, length FROM frames "
+                "WHERE camera_id = ? AND ts_ms BETWEEN ? AND ? ORDER BY ts_ms LIMIT ? OFFSET ?",
+                (camera_id, round(start_timestamp * 1000), round(end_timestamp * 1000),
+                 -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [FrameRef(ts_ms / 1000, path, off, length) for ts_ms, path, off, length in rows]
+
+    def count(self, camera_id, start_timestamp, end_timestamp) -> int:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM frames WHERE camera_id = ? AND ts_ms BETWEEN ? AND ?",
+                (camera_id, round(start_timestamp * 1000), round(end_timestamp * 1000))
+            ).fetchone()[0]
+
+    def acquire_sync_lock(self) -> bool:
+        """Non-blocking election of the process that runs the background loop."""
+        self._lock_file = open(self.db_path + '.lock', 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def run_sync_loop(self, interval, stop_event=None, prune_every=10):
+        """Background loop: full sync once (rebuild), then incremental passes."""
+        passes = 0
+        full = True
+        while stop_event is None or not stop_event.is_set():
+            try:
+                added = self.sync(full=full)
+                if full or added:
+                    logger.info(f"Archive index synced, {added} frames added")
+                passes += 1
+                if passes % prune_every == 0:
+                    self.prune_missing()
+                full = False
+            except Exception as e:
+                logger.error(f"Archive index sync failed: {e}")
+            if stop_event is not None:
+                stop_event.wait(interval)
+            else:
+                time.sleep(interval)
+
+    def start(self, interval):
+        """Start the background loop if this process wins the lock; returns whether it did."""
+        if not self.acquire_sync_lock():
+            return False
+        threading.Thread(target=run_blocking, args=(self.run_sync_loop, interval), daemon=True).start()
+        return True
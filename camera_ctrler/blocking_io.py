@@ -0,0 +1,21 @@
+"""
+Blocking I/O under gevent
+gunicorn's gevent worker monkey-patches threading, so every background
+"thread" of a web worker is a greenlet. SQLite calls and file reads do not
+yield to the hub and would stall every stream and request of that worker
+while they run. run_blocking() hands such work to gevent's native threadpool
+and lets the calling greenlet wait cooperatively; without monkey-patching
+(flask run, tests, scripts) it just calls the function.
+"""
+
+try:
+    from gevent import get_hub, monkey
+except ImportError:  # gevent 只在 gunicorn 以 gevent worker 執行時需要
+    monkey = None
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on a native thread when threading is monkey-patched."""
+    if monkey is None or not monkey.is_module_patched('threading'):
+        return fn(*args, **kwargs)
+    return get_hub().threadpool.apply(fn, args, kwargs)
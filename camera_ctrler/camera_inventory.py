@@ -0,0 +1,141 @@
+"""
+Camera Inventory
+Local copy of the web service's camera table, kept current by the change
+events the web service publishes on every create, update and delete
+(web/services/camera_events.py) instead of downloading the whole table on a
+timer:
+
+    cameras:events   {"version": n, "op": "upsert", "camera": {...}}
+                     {"version": n, "op": "delete", "id": ...}
+
+Events are applied in version order. A version gap (missed pubsub message),
+a reconnect or the periodic check falls back to a conditional
+GET /camera/cameras/all with If-None-Match, which costs a 304 when nothing
+changed.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'cameras:events'
+
+
+class CameraInventory:
+    """Cameras by id plus the inventory version they reflect."""
+
+    def __init__(self, base_url: str, redis_client=None, resync_interval: float = 60, timeout: float = 10):
+        self.url = f'{base_url}/camera/cameras/all'
+        self.r = redis_client
+        self.resync_interval = resync_interval
+        self.timeout = timeout
+        self.by_id: Dict[int, dict] = {}
+        self.version = 0
+        self.etag = None
+        self.loaded = False
+        self.last_resync = 0.0
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+        self.thread = None
+
+    def cameras(self) -> Optional[List[dict]]:
+        """Snapshot ordered by id; None until the first successful load."""
+        with self.lock:
+            if not self.loaded:
+                return None
+            return [self.by_id[camera_id] for camera_id in sorted(self.by_id)]
+
+    def wait_for_change(self, timeout: float) -> bool:
+        """Block until the inventory changed or the timeout passed; clears the flag."""
+        changed = self.changed.wait(timeout)
+        self.changed.clear()
+        return changed
+
+    def resync(self) -> bool:
+        """Conditional full GET; returns whether the inventory changed."""
+        self.last_resync = time.time()
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = requests.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            logger.error(f"Camera inventory request failed: {response.status_code}")
+            return False
+        data = response.json()
+        if not isinstance(data, list):
+            logger.error("Camera inventory response is not a list")
+            return False
+        with self.lock:
+            self.by_id = {int(camera['id']): camera for camera in data}
+            self.version = int(response.headers.get('X-Inventory-Version') or 0)
+            self.etag = response.headers.get('ETag')
+            self.loaded = True
+        logger.info(f"Camera inventory resynced: {len(data)} cameras, version {self.version}")
+        self.changed.set()
+        return True
+
+    def apply_event(self, event: dict) -> bool:
+        """Apply one change event; resyncs on a version gap. Returns whether anything changed."""
+        version = int(event['version'])
+        with self.lock:
+            if not self.loaded or version <= self.version:
+                # 尚未載入或已包含在最近一次同步中
+                return False
+            gap = version != self.version + 1
+            if not gap:
+                if event['op'] == 'delete':
+                    self.by_id.pop(int(event['id']), None)
+                else:
+                    camera = event['camera']
+                    self.by_id[int(camera['id'])] = camera
+                self.version = version
+                # 本地內容已與 ETag 不同，下次條件式 GET 需取得完整清單
+                self.etag = None
+        if gap:
+            logger.warning(f"Camera inventory version gap ({self.version} -> {version}), resyncing")
+            return self.resync()
+        self.changed.set()
+        return True
+
+    def refresh(self) -> bool:
+        """Without Redis, callers poll with the conditional GET instead of listening."""
+        try:
+            return self.resync()
+        except requests.RequestException as e:
+            logger.error(f"Camera inventory request failed: {e}")
+            return False
+
+    def listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(EVENTS_CHANNEL)
+                # 訂閱後再同步，訂閱前錯過的事件都包含在結果中
+                self.resync()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self.apply_event(json.loads(message['data']))
+                    if time.time() - self.last_resync >= self.resync_interval:
+                        self.resync()
+            except Exception as e:
+                logger.error(f"Camera inventory listener error: {e}")
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if self.thread is None and self.r is not None:
+            self.thread = threading.Thread(target=self.listen, daemon=True)
+            self.thread.start()
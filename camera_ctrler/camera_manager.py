@@ -1,106 +1,214 @@
 # camera_manager.py
 import threading
+import re
 import redis
-import requests
 import logging
-import os
 import time  # 加入 time 模組以使用 sleep
+from collections import defaultdict
 from env import SERVERIP
+from config import config
+from camera_inventory import CameraInventory
+from lease import Lease
+from shard_assignment import assign, known_workers, live_workers, worker_urls_key
 
-# 預設設置工作器 ID
-worker_id = int(os.getenv('WORKER_ID', 1))
+MANAGER_LEASE_KEY = 'camera_manager:lease'
+# 攝影機相關的鍵：camera_{camera_id}_*（影像、串流、設定）與 camera:{camera_id}（狀態 hash）
+CAMERA_KEY_PATTERN = re.compile(r'^camera[_:](\d+)(?:[_:]|$)')
+# 每個 UNLINK 指令最多帶的鍵數
+UNLINK_BATCH = 500
 
 class CameraManager:
     def __init__(self):
         self.redis_client = redis.Redis(host='redis', port=6379, db=0)
-        self.worker_id = worker_id
-        self.worker_key = f'worker_{self.worker_id}_urls'
         self.SERVERIP = SERVERIP
-        self.num_workers = 1  # 只使用 1 個工作器
-
-    def clear_old_cameras(self, current_camera_ids):
-        # 遍歷所有與攝影機相關的鍵，假設攝影機相關的鍵以 'camera_' 開頭
-        for key in self.redis_client.scan_iter("camera_*"):
-            # 從鍵名中提取攝影機 ID（假設鍵的格式為 'camera_{camera_id}_data'）
-            key_str = key.decode('utf-8')
-            camera_id = key_str.split('_')[1]
-            if int(camera_id) not in current_camera_ids:
-                # 如果攝影機 ID 不在當前資料庫中，則刪除該鍵
-                self.redis_client.delete(key)
-                logging.info(f"已從 Redis 中刪除舊攝影機資料，攝影機 ID：{camera_id}")
-
-        # 繼續刪除所有工作器的攝影機列表鍵
-        for worker_id in range(1, self.num_workers + 1):
-            worker_key = f'worker_{worker_id}_urls'
-            self.redis_client.delete(worker_key)
-            logging.info(f"已清除工作器 {worker_id} 的舊攝影機資料。")
-
-    def fetch_and_update_cameras(self, previous_camera_ids):
-        # 從伺服器獲取最新的攝影機列表
-        url = f"{self.SERVERIP}/camera/cameras/all"
-        headers = {}
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
+        # 攝影機清單由 web 服務的變更事件增量更新，條件式 GET 作為重新同步
+        self.inventory = CameraInventory(self.SERVERIP, self.redis_client, config.INVENTORY_RESYNC_INTERVAL)
+        # 最近一次取得的攝影機清單與存活工作器，租約監看執行緒據此重新分配
+        self.camera_data = None
+        self.live = {}
+        self.lock = threading.Lock()
+        # 多個 gunicorn worker 各有一個 CameraManager，只有持有租約的負責分配
+        self.leader = Lease(self.redis_client, MANAGER_LEASE_KEY, config.MANAGER_LEASE_TTL)
+
+    def read_worker_sets(self):
+        """每個工作器的攝影機集合各讀一次：{worker_id: {'id|url', ...}}"""
+        worker_ids = known_workers(self.redis_client)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.smembers(worker_urls_key(worker_id))
+        return {
+            worker_id: {member.decode('utf-8') for member in members}
+            for worker_id, members in zip(worker_ids, pipe.execute())
+        }
+
+    def stale_camera_keys(self, current_camera_ids):
+        # 一次 SCAN 找出已刪除攝影機的所有鍵，交由管線批次 UNLINK
+        stale = []
+        for key in self.redis_client.scan_iter(match="camera[_:]*", count=1000):
+            match = CAMERA_KEY_PATTERN.match(key.decode('utf-8'))
+            if match and int(match.group(1)) not in current_camera_ids:
+                stale.append(key)
+        return stale
+
+    @staticmethod
+    def camera_member(camera):
+        # 指定擷取後端時以 "<backend>+" 前綴帶給工作器，變更後端即視為 URL 變更
+        stream_url = camera['stream_url']
+        if camera.get('capture_backend'):
+            stream_url = f"{camera['capture_backend']}+{stream_url}"
+        return f"{camera['id']}|{stream_url}"
+
+    def sync_cameras(self, camera_data, workers, inventory_changed=False):
+        """
+        依存活工作器的容量以 rendezvous hashing 分配攝影機；工作器加入或離開時只移動必要的攝影機。
+        每個工作器集合只讀一次，在記憶體中算出新增、移除與變更，再以單一管線寫回。
+        inventory_changed 時一併刪除已移除攝影機的鍵並同步辨識影格率。
+        回傳攝影機集合有變動、需要通知的工作器。
+        """
+        current_camera_ids = {int(camera['id']) for camera in camera_data}
+        self.live = workers
+        if not workers:
+            logging.warning("沒有存活的工作器，攝影機維持原本的分配。")
+        owners = assign(current_camera_ids, workers)
+
+        # camera_id -> [(worker_id, 'id|url')]，目前實際由哪些工作器擷取
+        held = defaultdict(list)
+        for worker_id, members in self.read_worker_sets().items():
+            for member in members:
+                camera_id = member.split('|', 1)[0]
+                if camera_id.isdigit():
+                    held[int(camera_id)].append((worker_id, member))
+
+        adds = defaultdict(set)
+        removes = defaultdict(set)
+        pipe = self.redis_client.pipeline(transaction=False)
+        moved = 0
+        orphaned = []
+
+        for camera in camera_data:
+            camera_id = int(camera['id'])
+            worker_id = owners.get(camera_id)
+            if worker_id is None:
+                # 所有存活工作器都已滿載：從存活工作器移除以免超出容量，
+                # 失效工作器的集合保留，容量釋出或原工作器回來時再分配
+                orphaned.append(camera_id)
+                for holder, held_member in held[camera_id]:
+                    if holder in workers:
+                        removes[holder].add(held_member)
+                continue
+            member = self.camera_member(camera)
+            for holder, held_member in held[camera_id]:
+                if (holder, held_member) != (worker_id, member):
+                    removes[holder].add(held_member)
+            if (worker_id, member) not in held[camera_id]:
+                adds[worker_id].add(member)
+                if any(holder != worker_id for holder, _ in held[camera_id]):
+                    moved += 1
+                pipe.hset(f"camera:{camera_id}", "worker", worker_id)
+
+        # 從原本負責的工作器移除已刪除的攝影機
+        deleted = [camera_id for camera_id in held if camera_id not in current_camera_ids]
+        for camera_id in deleted:
+            for holder, held_member in held[camera_id]:
+                removes[holder].add(held_member)
+
+        for camera_id in orphaned:
+            pipe.hset(f"camera:{camera_id}", mapping={"worker": "", "status": "False"})
+
+        for worker_id, members in removes.items():
+            pipe.srem(worker_urls_key(worker_id), *members)
+        for worker_id, members in adds.items():
+            pipe.sadd(worker_urls_key(worker_id), *members)
+
+        stale_keys = []
+        if inventory_changed:
+            stale_keys = self.stale_camera_keys(current_camera_ids)
+            for i in range(0, len(stale_keys), UNLINK_BATCH):
+                pipe.unlink(*stale_keys[i:i + UNLINK_BATCH])
+            # 同步每台攝影機的辨識影格率，供工作器決定解碼頻率
+            for camera in camera_data:
+                target_fps_key = f"camera_{camera['id']}_target_fps"
+                analysis_fps = camera.get('analysis_fps')
+                if analysis_fps is None:
+                    pipe.delete(target_fps_key)
+                else:
+                    pipe.set(target_fps_key, analysis_fps)
+        pipe.execute()
+
+        affected_workers = set(adds) | set(removes)
+        for worker_id in sorted(affected_workers):
+            logging.info(f"工作器 {worker_id}：新增 {len(adds.get(worker_id, ()))} 個、"
+                         f"移除 {len(removes.get(worker_id, ()))} 個攝影機 URL。")
+        if moved:
+            logging.info(f"{moved} 台攝影機移至其他工作器。")
+        if deleted or stale_keys:
+            logging.info(f"已從 Redis 中刪除 {len(deleted)} 台舊攝影機，共 {len(stale_keys)} 個鍵。")
+        if orphaned:
+            logging.warning(f"工作器容量不足，{len(orphaned)} 台攝影機暫無工作器：{orphaned[:20]}")
+        return affected_workers
+
+    def notify_workers(self, worker_ids):
+        # 只通知攝影機集合有變動的工作器
+        if not worker_ids:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for worker_id in worker_ids:
+            pipe.publish(f'{worker_urls_key(worker_id)}_update', 'updated')
+        pipe.execute()
+        logging.info(f"已發布工作器 {sorted(worker_ids)} 的更新。")
+
+    def watch_leases(self):
+        """
+        每 LEASE_CHECK_INTERVAL 秒續約控制器租約並檢查工作器租約；
+        存活工作器改變時立即重新分配，攝影機中斷時間以租約 TTL 為上限。
+        """
+        while True:
             try:
-                # 假設 response.json() 返回的是列表
-                camera_data = response.json()
-                current_camera_ids = set(camera['id'] for camera in camera_data)
-                updated = False  # 標記是否有更新
-
-                if current_camera_ids != previous_camera_ids:
-                    # 如果攝影機列表有變化，更新 Redis
-                    self.clear_old_cameras(current_camera_ids)
-                    updated = True  # 標記有變更
-
-                for camera in camera_data:
-                    worker_id = int(camera['id']) % self.num_workers + 1
-                    worker_key = f'worker_{worker_id}_urls'
-                    redis_key = f"{camera['id']}|{camera['stream_url']}"
-
-                    # 若 URL 發生變化，則刪除舊的 key 並添加新的 key
-                    # 檢查攝影機是否在 Redis 中
-                    existing_urls = self.redis_client.smembers(worker_key)
-                    matching_key = next((key for key in existing_urls if key.decode().startswith(f"{camera['id']}|")), None)
-
-                    if matching_key is None or matching_key.decode() != redis_key:
-                        # 刪除舊的 key，若存在
-                        if matching_key:
-                            self.redis_client.srem(worker_key, matching_key)
-                            logging.info(f"已移除舊的攝影機 {camera['id']} URL。")
-
-                        # 添加新的 key
-                        self.redis_client.sadd(worker_key, redis_key)
-                        logging.info(f"已將攝影機 {camera['id']} 的新 URL 更新至 Redis，位於工作器 {worker_id}。")
-                        updated = True  # 標記有更新
-
-                if updated:
-                    # 發布更新事件給所有工作器
-                    for worker_id in range(1, self.num_workers + 1):
-                        worker_key = f'worker_{worker_id}_urls'
-                        self.redis_client.publish(f'{worker_key}_update', 'updated')
-                        logging.info(f"已發布工作器 {worker_id} 的更新。")
-                    
-                    # 更新之前的攝影機 ID 列表
-                    previous_camera_ids.clear()
-                    previous_camera_ids.update(current_camera_ids)
-
+                was_leader = self.leader.held
+                if self.leader.renew():
+                    if not was_leader:
+                        # 剛接手主控，分配狀態一律由 Redis 中的工作器集合重新比對
+                        with self.lock:
+                            self.live = {}
+                            self.camera_data = None
+                        self.inventory.changed.set()
+                    workers = live_workers(self.redis_client)
+                    with self.lock:
+                        if self.camera_data is not None and workers != self.live:
+                            logging.info(f"存活工作器變更：{sorted(self.live)} -> {sorted(workers)}")
+                            self.notify_workers(self.sync_cameras(self.camera_data, workers))
             except Exception as e:
-                logging.error(f"處理攝影機數據時發生錯誤: {e}")
-        else:
-            logging.error(f"請求失敗，狀態碼：{response.status_code}")
+                logging.error(f"檢查工作器租約時發生錯誤: {e}")
+            time.sleep(config.LEASE_CHECK_INTERVAL)
+
+    def update_cameras(self, camera_data):
+        try:
+            with self.lock:
+                affected_workers = self.sync_cameras(camera_data, live_workers(self.redis_client),
+                                                     inventory_changed=True)
+                self.camera_data = camera_data
+            self.notify_workers(affected_workers)
+        except Exception as e:
+            logging.error(f"處理攝影機數據時發生錯誤: {e}")
 
     def monitor_cameras(self):
-        # 定期檢查攝影機列表是否有變化
-        previous_camera_ids = set()
+        # 攝影機清單變動時（或每 5 秒檢查主控狀態時）更新分配
         while True:
-            self.fetch_and_update_cameras(previous_camera_ids)
-            time.sleep(5)  # 每 5 秒檢查一次
+            changed = self.inventory.wait_for_change(5)
+            if not self.leader.held:
+                continue
+            if changed or self.camera_data is None:
+                camera_data = self.inventory.cameras()
+                # 尚未取得清單時不動既有分配
+                if camera_data is not None:
+                    self.update_cameras(camera_data)
 
     def run(self):
-        # 啟動攝影機監控執行緒
+        # 啟動攝影機清單、攝影機監控與租約監看執行緒
+        self.inventory.start()
         thread = threading.Thread(target=self.monitor_cameras)
         thread.start()
+        threading.Thread(target=self.watch_leases, daemon=True).start()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -29,7 +29,17 @@ class CameraControllerConfig:
     MAX_RETRIES: int = int(os.getenv('CAMERA_MAX_RETRIES', '3'))
     
     # Streaming Configuration
-    STREAM_SLEEP_INTERVAL: float = float(os.getenv('STREAM_SLEEP_INTERVAL', '0.1'))
+    # MJPEG 串流由每台攝影機一個廣播執行緒在新影像通知時讀取；沒有通知時每隔此秒數輪詢一次
+    STREAM_POLL_INTERVAL: float = float(os.getenv('STREAM_POLL_INTERVAL', '1'))
+    # 每位觀看者最多暫存的影像數，慢速觀看者超過時丟棄最舊的
+    STREAM_CLIENT_QUEUE: int = int(os.getenv('STREAM_CLIENT_QUEUE', '2'))
+    # 畫面未更新時每隔此秒數重送上一張，以偵測已斷線的觀看者
+    STREAM_KEEPALIVE: float = float(os.getenv('STREAM_KEEPALIVE', '5'))
+    # 串流與快照 UI 使用的縮放影像名稱（redisv1 RENDITIONS），未發布時退回原圖
+    PREVIEW_RENDITION: str = os.getenv('PREVIEW_RENDITION', 'preview')
+    # /get_preview 等待 redisv1 啟動壓縮串流轉送（PREVIEW_PASSTHROUGH）的秒數
+    PREVIEW_START_TIMEOUT: float = float(os.getenv('PREVIEW_START_TIMEOUT', '10'))
+    PREVIEW_VIEWER_TTL: int = int(os.getenv('PREVIEW_VIEWER_TTL', '10'))
     
     # Image Processing
     IMAGE_QUALITY: int = int(os.getenv('IMAGE_QUALITY', '85'))
@@ -43,6 +53,21 @@ class CameraControllerConfig:
     ENABLE_IMAGE_SAVING: bool = os.getenv('ENABLE_IMAGE_SAVING', 'false').lower() == 'true'
     SAVE_PATH: str = os.getenv('SAVE_PATH', '/app/images')
     RETENTION_HOURS: int = int(os.getenv('IMAGE_RETENTION_HOURS', '24'))
+    # redisv1 寫入的分段檔目錄與其 SQLite 時間索引
+    ARCHIVE_DIR: str = os.getenv('ARCHIVE_DIR', '/app/image')
+    ARCHIVE_INDEX_PATH: str = os.getenv('ARCHIVE_INDEX_PATH', '/app/image/archive_index.sqlite3')
+    ARCHIVE_INDEX_INTERVAL: float = float(os.getenv('ARCHIVE_INDEX_INTERVAL', '30'))
+    ARCHIVE_PAGE_LIMIT: int = int(os.getenv('ARCHIVE_PAGE_LIMIT', '500'))
+    # 分段存檔依 RETENTION_HOURS 與容量上限（MB，0 表示不限）由最舊的小時開始刪除；
+    # 只刪除索引中的 .seg 檔，redisv1 工作器本身不清理存檔
+    ARCHIVE_QUOTA_MB: int = int(os.getenv('ARCHIVE_QUOTA_MB', '0'))
+    RETENTION_DELETES_PER_SECOND: int = int(os.getenv('RETENTION_DELETES_PER_SECOND', '20'))
+    RETENTION_INTERVAL: float = float(os.getenv('RETENTION_INTERVAL', '60'))
+    # 工作器租約的檢查間隔，以及多個控制器中主控者租約的 TTL（秒）
+    LEASE_CHECK_INTERVAL: float = float(os.getenv('LEASE_CHECK_INTERVAL', '1'))
+    MANAGER_LEASE_TTL: float = float(os.getenv('MANAGER_LEASE_TTL', '10'))
+    # 攝影機清單以變更事件更新，每隔此秒數再以條件式 GET 確認一次
+    INVENTORY_RESYNC_INTERVAL: float = float(os.getenv('INVENTORY_RESYNC_INTERVAL', '60'))
     
     # Security
     CORS_ORIGINS: list = os.getenv('CORS_ORIGINS', '*').split(',')
@@ -77,10 +102,34 @@ class CameraControllerConfig:
         if cls.CAMERA_TIMEOUT <= 0:
             errors.append("CAMERA_TIMEOUT must be positive")
         
+        if cls.STREAM_POLL_INTERVAL <= 0 or cls.STREAM_KEEPALIVE <= 0:
+            errors.append("STREAM_POLL_INTERVAL and STREAM_KEEPALIVE must be positive")
+        
+        if cls.STREAM_CLIENT_QUEUE < 1:
+            errors.append("STREAM_CLIENT_QUEUE must be at least 1")
+        
         # Validate image quality
         if not (1 <= cls.IMAGE_QUALITY <= 100):
             errors.append("IMAGE_QUALITY must be between 1 and 100")
         
+        if cls.ARCHIVE_INDEX_INTERVAL <= 0:
+            errors.append("ARCHIVE_INDEX_INTERVAL must be positive")
+        
+        if cls.ARCHIVE_PAGE_LIMIT < 1:
+            errors.append("ARCHIVE_PAGE_LIMIT must be at least 1")
+        
+        if cls.RETENTION_HOURS < 0 or cls.ARCHIVE_QUOTA_MB < 0:
+            errors.append("IMAGE_RETENTION_HOURS and ARCHIVE_QUOTA_MB must not be negative")
+        
+        if cls.RETENTION_INTERVAL <= 0:
+            errors.append("RETENTION_INTERVAL must be positive")
+        
+        if cls.LEASE_CHECK_INTERVAL <= 0 or cls.MANAGER_LEASE_TTL < 3 * cls.LEASE_CHECK_INTERVAL:
+            errors.append("MANAGER_LEASE_TTL must be at least 3 * LEASE_CHECK_INTERVAL (> 0)")
+        
+        if cls.INVENTORY_RESYNC_INTERVAL <= 0:
+            errors.append("INVENTORY_RESYNC_INTERVAL must be positive")
+        
         # Validate worker threads
         if cls.WORKER_THREADS < 1:
             errors.append("WORKER_THREADS must be at least 1")
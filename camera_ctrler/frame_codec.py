@@ -0,0 +1,131 @@
+"""
+Frame Codec
+Self-describing envelope for frames stored in Redis, with pluggable codecs so
+each key class can trade CPU for size:
+
+    jpeg   lossy, browser-friendly (default)
+    webp   lossy, smaller than JPEG at equal quality; for long-retention keys
+    raw    uncompressed pixels
+    lz4    raw pixels with LZ4 block compression; fastest for intra-datacenter
+           hops (the 'lz4' package is a pinned requirement of every service)
+
+Envelope layout (little endian, 32-byte header followed by the payload):
+    magic 'VFRM', version, codec id, dtype id, channels,
+    height, width, seq (u64), timestamp (f64 epoch seconds)
+
+Readers also accept bare JPEG/WebP values written before the envelope existed.
+"""
+
+import struct
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import cv2
+import lz4.block as lz4_block
+import numpy as np
+
+MAGIC = b'VFRM'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBIIQd')
+
+DTYPES = {1: np.dtype(np.uint8), 2: np.dtype(np.uint16), 3: np.dtype(np.float32)}
+DTYPE_IDS = {dtype: dtype_id for dtype_id, dtype in DTYPES.items()}
+
+
+class FrameHeader(NamedTuple):
+    codec: str
+    shape: Tuple[int, ...]
+    dtype: np.dtype
+    seq: int
+    timestamp: float
+
+
+class FrameCodec(NamedTuple):
+    codec_id: int
+    encode: Callable[[np.ndarray, Optional[int]], bytes]
+    decode: Callable[[bytes, Tuple[int, ...], np.dtype], np.ndarray]
+
+
+CODECS: Dict[str, FrameCodec] = {}
+CODEC_NAMES: Dict[int, str] = {}
+
+
+def register_codec(name: str, codec_id: int, encode, decode):
+    CODECS[name] = FrameCodec(codec_id, encode, decode)
+    CODEC_NAMES[codec_id] = name
+
+
+def _imencode(ext: str, flag: int, default_quality: int):
+    def encode(frame, quality):
+        ok, buffer = cv2.imencode(ext, frame, [flag, quality or default_quality])
+        if not ok:
+            raise ValueError(f"Failed to encode frame as {ext}")
+        return buffer.tobytes()
+    return encode
+
+
+def _imdecode(payload, shape, dtype):
+    return cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def _raw_decode(payload, shape, dtype):
+    return np.frombuffer(payload, dtype).reshape(shape)
+
+
+def _lz4_encode(frame, quality):
+    return lz4_block.compress(np.ascontiguousarray(frame), store_size=True)
+
+
+def _lz4_decode(payload, shape, dtype):
+    return np.frombuffer(lz4_block.decompress(payload), dtype).reshape(shape)
+
+
+register_codec('jpeg', 1, _imencode('.jpg', cv2.IMWRITE_JPEG_QUALITY, 95), _imdecode)
+register_codec('webp', 2, _imencode('.webp', cv2.IMWRITE_WEBP_QUALITY, 80), _imdecode)
+register_codec('raw', 3, lambda frame, quality: np.ascontiguousarray(frame).tobytes(), _raw_decode)
+register_codec('lz4', 4, _lz4_encode, _lz4_decode)
+
+
+def encode_frame(frame: np.ndarray, codec: str = 'jpeg', seq: int = 0,
+                 timestamp: float = 0.0, quality: Optional[int] = None) -> bytes:
+    """Encode a frame with the named codec and wrap it in the envelope."""
+    frame_codec = CODECS[codec]
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    header = HEADER.pack(MAGIC, VERSION, frame_codec.codec_id, DTYPE_IDS[frame.dtype],
+                         channels, height, width, seq, timestamp)
+    return header + frame_codec.encode(frame, quality)
+
+
+def read_header(data: bytes) -> Optional[FrameHeader]:
+    """Parse the envelope header; None for bare images and unknown versions."""
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        return None
+    _, version, codec_id, dtype_id, channels, height, width, seq, timestamp = HEADER.unpack_from(data)
+    if version != VERSION or codec_id not in CODEC_NAMES:
+        return None
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    return FrameHeader(CODEC_NAMES[codec_id], shape, DTYPES[dtype_id], seq, timestamp)
+
+
+def decode_frame(data: bytes) -> Tuple[Optional[np.ndarray], Optional[FrameHeader]]:
+    """Decode an enveloped or bare frame; returns (frame, header or None)."""
+    header = read_header(data)
+    if header is None:
+        # 舊格式：直接儲存的 JPEG/WebP
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), None
+    payload = memoryview(data)[HEADER.size:]
+    return CODECS[header.codec].decode(payload, header.shape, header.dtype), header
+
+
+def as_jpeg(data: bytes, quality: int = 85) -> Optional[bytes]:
+    """JPEG bytes for browser consumers; JPEG payloads are passed through without decoding."""
+    header = read_header(data)
+    if header is None:
+        return data
+    if header.codec == 'jpeg':
+        return data[HEADER.size:]
+    frame, _ = decode_frame(data)
+    if frame is None:
+        return None
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ok else None
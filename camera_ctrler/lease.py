@@ -0,0 +1,56 @@
+"""
+Lease
+Renewable ownership lease on a Redis key. The key holds a random token and
+expires after `ttl` seconds unless the holder renews it; renewing and
+releasing only succeed for the token that took it, so a process that lost its
+lease (paused, partitioned) cannot extend or delete someone else's.
+"""
+
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 持有者相同則延長，否則在鍵不存在時取得；回傳 1 表示持有
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class Lease:
+    """Token lease on `key`; call renew() at least every ttl / 3 seconds."""
+
+    def __init__(self, redis_client, key: str, ttl: float):
+        self.r = redis_client
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.token = uuid.uuid4().hex
+        self.held = False
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+
+    def renew(self) -> bool:
+        """Acquire or extend the lease; returns whether this process holds it."""
+        held = bool(self._renew(keys=[self.key], args=[self.token, self.ttl_ms]))
+        if held != self.held:
+            logger.info(f"Lease {self.key} {'acquired' if held else 'lost'}")
+        self.held = held
+        return held
+
+    def release(self):
+        if self.held:
+            self._release(keys=[self.key], args=[self.token])
+            self.held = False
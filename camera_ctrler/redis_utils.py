@@ -1,6 +1,8 @@
 import redis
 import os
 
+from frame_codec import as_jpeg
+
 # 初始化 Redis 連線
 def init_redis():
     redis_host = 'redis'
@@ -21,23 +23,90 @@ class CameraSnapFetcher:
             return path
         return None
 
+def camera_state_key(camera_id):
+    """攝影機即時狀態 hash 的鍵名（由 redisv1 工作器寫入）"""
+    return f'camera:{camera_id}'
+
+def scan_camera_state_keys(r):
+    """列出所有 camera:{id} 狀態 hash 的鍵，回傳 (camera_id, key) 清單"""
+    keys = []
+    for key in r.scan_iter("camera:*", count=500):
+        key_str = key.decode() if isinstance(key, bytes) else key
+        camera_id = key_str.split(':', 1)[1]
+        if camera_id.isdigit():
+            keys.append((camera_id, key))
+    return keys
+
+RENDITION_VERSION = 1
+
+def rendition_key(camera_id, name):
+    """redisv1 發布的縮放影像鍵名"""
+    return f'camera_{camera_id}_{name}_v{RENDITION_VERSION}'
+
+def get_frame_data(r, camera_id, rendition=None):
+    """最新影像的原始封裝資料；指定 rendition 時優先取縮放影像，不存在則退回原圖。"""
+    image_data = None
+    if rendition:
+        image_data = r.get(rendition_key(camera_id, rendition))
+    if not image_data:
+        image_data = r.get(f'camera_{camera_id}_latest_frame')
+    return image_data
+
+def get_frame(r, camera_id, rendition=None):
+    """
+    取得最新影像的 JPEG；指定 rendition 時優先取縮放影像，不存在則退回原圖。
+    影像以 frame_codec 封裝儲存，非 JPEG 編碼時在此轉成 JPEG 供瀏覽器使用。
+    """
+    image_data = get_frame_data(r, camera_id, rendition)
+    return as_jpeg(image_data) if image_data else None
+
+def get_frame_size(r, camera_id):
+    """原圖尺寸 (width, height)，未知時回傳 None"""
+    width, height = r.hmget(camera_state_key(camera_id), 'width', 'height')
+    if width and height:
+        return int(width), int(height)
+    return None
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
 def get_all_camera_status(r):
     status = {}
-    for key in r.keys("camera_*_status"):
-        camera_id = key.decode().split('_')[1]
-        if r.exists(f'camera_{camera_id}_status'):
-            camera_status = r.get(key)
-            last_timestamp = r.get(f'camera_{camera_id}_last_timestamp')
-            if camera_status is not None and last_timestamp is not None:
-                camera_status = camera_status.decode()
-                last_timestamp = last_timestamp.decode()
-                status[camera_id] = {
-                    "alive": camera_status,
-                    "last_image_timestamp": last_timestamp
-                }
-            else:
-                status[camera_id] = {
-                    "alive": "unknown",
-                    "last_image_timestamp": "unknown"
-                }
+    camera_keys = scan_camera_state_keys(r)
+    if not camera_keys:
+        return status
+
+    # 以 pipeline 一次取回所有攝影機的狀態 hash
+    pipe = r.pipeline(transaction=False)
+    for _, key in camera_keys:
+        pipe.hgetall(key)
+    states = pipe.execute()
+
+    for (camera_id, _), state in zip(camera_keys, states):
+        state = {_decode(k): _decode(v) for k, v in state.items()}
+        camera_status = state.get('status')
+        last_timestamp = state.get('timestamp')
+        if camera_status is not None and last_timestamp is not None:
+            status[camera_id] = {
+                "alive": camera_status,
+                "last_image_timestamp": last_timestamp,
+                "fps": state.get('fps', "unknown"),
+                "frame_age_ms": state.get('frame_age_ms', "unknown"),
+                "frozen": state.get('frozen', "unknown"),
+                "backend": state.get('backend', "unknown"),
+                "decode_ms": state.get('decode_ms', "unknown"),
+                "dropped": state.get('dropped', "unknown"),
+                "breaker": state.get('breaker', "unknown"),
+                "retry_at": state.get('retry_at', "unknown"),
+                "worker": state.get('worker', "unknown")
+            }
+        else:
+            status[camera_id] = {
+                "alive": camera_status or "unknown",
+                "last_image_timestamp": "unknown",
+                "fps": state.get('fps', "unknown"),
+                "breaker": state.get('breaker', "unknown"),
+                "retry_at": state.get('retry_at', "unknown"),
+                "worker": state.get('worker', "unknown")
+            }
     return status
@@ -0,0 +1,98 @@
+"""
+Segment Archive Reader
+Reads the per-camera, per-hour JPEG segments written by the redisv1 workers
+through mmap. The format is documented in redisv1/segment_archive.py; the
+constants below must stay in sync with it.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+SEGMENT_MAGIC = b'VFSG'
+INDEX_MAGIC = b'VFIX'
+SEGMENT_HEADER = struct.Struct('<4sH10x')
+RECORD_HEADER = struct.Struct('<Id')
+INDEX_ENTRY = struct.Struct('<dQI')
+TRAILER = struct.Struct('<QI4s')
+
+
+class FrameRef(NamedTuple):
+    """One archived frame: capture time and where its JPEG lives."""
+    timestamp: float
+    path: str
+    offset: int
+    length: int
+
+
+def segment_path(base_dir, camera_id, timestamp):
+    """與 redisv1 相同的分段檔路徑（依影像時間的當地小時）"""
+    t = time.localtime(timestamp)
+    return os.path.join(base_dir, str(camera_id), time.strftime('%Y%m%d', t), f"{time.strftime('%H', t)}.seg")
+
+
+class SegmentReader:
+    """mmap view of one segment with its (timestamp, offset, length) index."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.closed_segment = False
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.index = self._load_index()
+        self.timestamps = [entry[0] for entry in self.index]
+
+    def _load_index(self) -> List[Tuple[float, int, int]]:
+        mm = self._mm
+        if mm is None or self.size < SEGMENT_HEADER.size or mm[:4] != SEGMENT_MAGIC:
+            return []
+        if self.size >= SEGMENT_HEADER.size + TRAILER.size:
+            index_offset, count, magic = TRAILER.unpack_from(mm, self.size - TRAILER.size)
+            if magic == INDEX_MAGIC and index_offset + count * INDEX_ENTRY.size + TRAILER.size == self.size:
+                self.closed_segment = True
+                return [INDEX_ENTRY.unpack_from(mm, index_offset + i * INDEX_ENTRY.size) for i in range(count)]
+
+        # 尚未寫入索引（目前這一小時或工作器異常結束），逐筆掃描紀錄
+        entries = []
+        position = SEGMENT_HEADER.size
+        while position + RECORD_HEADER.size <= self.size:
+            length, timestamp = RECORD_HEADER.unpack_from(mm, position)
+            data_offset = position + RECORD_HEADER.size
+            if length == 0 or data_offset + length > self.size:
+                break
+            entries.append((timestamp, data_offset, length))
+            position = data_offset + length
+        return entries
+
+    def is_stale(self) -> bool:
+        """True when an open segment has grown since it was mapped."""
+        if self.closed_segment:
+            return False
+        try:
+            return os.path.getsize(self.path) != self.size
+        except OSError:
+            return True
+
+    def find_range(self, start, end) -> List[FrameRef]:
+        lo = bisect.bisect_left(self.timestamps, start)
+        hi = bisect.bisect_right(self.timestamps, end)
+        return [FrameRef(ts, self.path, offset, length) for ts, offset, length in self.index[lo:hi]]
+
+    def read(self, offset, length) -> bytes:
+        return self._mm[offset:offset + length]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+def open_segment(path) -> Optional[SegmentReader]:
+    try:
+        return SegmentReader(path)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,98 @@
+"""
+Shard Assignment
+Spreads cameras over the ingest workers that currently hold a lease
+(redisv1/worker_heartbeat.py) with weighted rendezvous hashing:
+
+    score(camera, worker) = -capacity / ln(u),  u = hash(camera, worker) in (0, 1)
+
+Each camera goes to the worker with the highest score. Adding or removing a
+worker only moves the cameras whose best score changes, i.e. the ones taken
+over by a new worker or the ones of the worker that left, and a worker with
+twice the capacity receives about twice the cameras.
+
+Capacity is also a hard cap: a camera whose preferred worker is full goes to
+its next-ranked worker with room, so the cameras of a dead worker fail over
+without overloading the survivors; cameras that fit nowhere stay unassigned
+(orphaned) until capacity frees up. When the worker's lease is back its
+cameras rank it first again and are handed back.
+"""
+
+import hashlib
+import math
+from typing import Dict, Iterable, List, Optional
+
+WORKERS_KEY = 'workers'
+
+
+def worker_state_key(worker_id) -> str:
+    return f'worker:{worker_id}'
+
+
+def worker_lease_key(worker_id) -> str:
+    return f'worker:{worker_id}:lease'
+
+
+def worker_urls_key(worker_id) -> str:
+    return f'worker_{worker_id}_urls'
+
+
+def known_workers(r) -> list:
+    """Every worker id that has ever registered, live or not."""
+    return sorted((_decode(w) for w in r.smembers(WORKERS_KEY)), key=lambda w: (len(w), w))
+
+
+def live_workers(r) -> Dict[str, int]:
+    """{worker_id: capacity} of workers whose lease has not expired."""
+    worker_ids = known_workers(r)
+    if not worker_ids:
+        return {}
+    pipe = r.pipeline(transaction=False)
+    for worker_id in worker_ids:
+        pipe.exists(worker_lease_key(worker_id))
+        pipe.hget(worker_state_key(worker_id), 'capacity')
+    results = pipe.execute()
+    workers = {}
+    for i, worker_id in enumerate(worker_ids):
+        alive, capacity = results[2 * i], results[2 * i + 1]
+        if alive:
+            workers[worker_id] = max(int(capacity or 1), 1)
+    return workers
+
+
+def _unit_hash(camera_id, worker_id) -> float:
+    digest = hashlib.blake2b(f"{camera_id}:{worker_id}".encode(), digest_size=8).digest()
+    # 映射到開區間 (0, 1)，避免 ln(0) 與 ln(1)
+    return (int.from_bytes(digest, 'big') + 1) / (2 ** 64 + 2)
+
+
+def rank_workers(camera_id, workers: Dict[str, int]) -> List[str]:
+    """Workers ordered by weighted rendezvous score for the camera, best first."""
+    return sorted(workers, key=lambda worker_id: -workers[worker_id] / math.log(_unit_hash(camera_id, worker_id)),
+                  reverse=True)
+
+
+def rendezvous_owner(camera_id, workers: Dict[str, int]) -> Optional[str]:
+    """Worker with the highest weighted score for the camera, None without workers."""
+    ranked = rank_workers(camera_id, workers)
+    return ranked[0] if ranked else None
+
+
+def assign(camera_ids: Iterable, workers: Dict[str, int]) -> Dict[int, Optional[str]]:
+    """{camera_id: worker_id}, capped at each worker's capacity; None for orphaned cameras."""
+    if not workers:
+        return {}
+    load = {worker_id: 0 for worker_id in workers}
+    owners = {}
+    # 依攝影機 ID 排序，讓每次計算（以及每個控制器）得到相同結果
+    for camera_id in sorted(camera_ids):
+        owners[camera_id] = None
+        for worker_id in rank_workers(camera_id, workers):
+            if load[worker_id] < workers[worker_id]:
+                load[worker_id] += 1
+                owners[camera_id] = worker_id
+                break
+    return owners
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
@@ -0,0 +1,188 @@
+"""
+Stream Broadcaster
+One broadcaster per camera and stream kind serves every MJPEG viewer of that
+camera in the process:
+
+    - it wakes on the producer's Pub/Sub notification (camera_{id}_frame_ready
+      from redisv1, camera_{id}_boxed_ready from object_recognition) rather
+      than sleeping, and falls back to polling every `poll_interval` seconds
+      when no notification arrives;
+    - it reads and renders each frame once and hands the same multipart chunk
+      to every viewer; when the rendering also depends on other state (the
+      recognized stream draws polygons and time windows), `rerender_interval`
+      re-renders an unchanged frame so edits show up without a new frame;
+    - each viewer has a bounded queue; when a slow client's queue is full its
+      oldest frame is dropped, so it always gets the latest picture and never
+      holds the others back;
+    - it stops when the last viewer disconnects, or after `max_failures`
+      attempts in a row without a frame. Viewers whose picture has not changed
+      for `keepalive` seconds get the last frame again, which is how a
+      disconnected client is noticed on a frozen camera.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# 廣播結束時放入佇列，通知觀看者停止
+END_OF_STREAM = None
+
+
+def multipart_chunk(jpeg: bytes) -> bytes:
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+class FrameBroadcaster(threading.Thread):
+    """Fans the frames of one camera out to its viewers."""
+
+    def __init__(self, hub: 'StreamHub', camera_id):
+        super().__init__(daemon=True, name=f"{hub.name}-broadcast-{camera_id}")
+        self.hub = hub
+        self.camera_id = camera_id
+        self.channel = hub.channel(camera_id)
+        self.subscribers = set()
+        self.last_source = None
+        self.last_chunk = None
+        self.last_render = 0.0
+
+    def add(self) -> queue.Queue:
+        client = queue.Queue(maxsize=self.hub.queue_size)
+        # 新觀看者立即收到目前的畫面
+        if self.last_chunk is not None:
+            client.put_nowait(self.last_chunk)
+        self.subscribers.add(client)
+        return client
+
+    def offer(self, client: queue.Queue, item):
+        # 慢速觀看者佇列已滿時丟棄最舊的影像，只保留最新的
+        while True:
+            try:
+                client.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def broadcast(self, item):
+        with self.hub.lock:
+            clients = list(self.subscribers)
+        for client in clients:
+            self.offer(client, item)
+
+    def rerender_due(self) -> bool:
+        interval = self.hub.rerender_interval
+        return bool(interval) and time.monotonic() - self.last_render >= interval
+
+    def run(self):
+        logger.info(f"Starting {self.hub.name} broadcast for camera {self.camera_id}")
+        pubsub = self.hub.redis.pubsub(ignore_subscribe_messages=True)
+        failures = 0
+        try:
+            pubsub.subscribe(self.channel)
+            # 先送出目前最新的影像，之後每次通知（或輪詢逾時）讀取一次
+            while failures < self.hub.max_failures:
+                # 合併累積的通知，只讀取與繪製一次
+                while pubsub.get_message(timeout=0):
+                    pass
+                try:
+                    source = self.hub.fetch(self.camera_id)
+                    if not source:
+                        failures += 1
+                    elif source != self.last_source or self.rerender_due():
+                        failures = 0
+                        self.last_source = source
+                        self.last_render = time.monotonic()
+                        jpeg = self.hub.render(self.camera_id, source)
+                        chunk = multipart_chunk(jpeg) if jpeg else None
+                        # 重新繪製的結果未改變時不重送
+                        if chunk and chunk != self.last_chunk:
+                            self.last_chunk = chunk
+                            self.broadcast(chunk)
+                except Exception as e:
+                    failures += 1
+                    logger.error(f"Error broadcasting {self.hub.name} frame for camera {self.camera_id}: {e}")
+                if self.hub.retire_if_idle(self):
+                    return
+                pubsub.get_message(timeout=self.hub.poll_interval)
+            logger.warning(f"Stopping {self.hub.name} broadcast for camera {self.camera_id} "
+                           f"after {self.hub.max_failures} attempts without a frame")
+        except Exception as e:
+            logger.error(f"{self.hub.name} broadcast for camera {self.camera_id} failed: {e}")
+        finally:
+            self.hub.retire(self)
+            self.broadcast(END_OF_STREAM)
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+            logger.info(f"Stopped {self.hub.name} broadcast for camera {self.camera_id}")
+
+
+class StreamHub:
+    """Broadcasters of one stream kind, started on the first viewer of a camera."""
+
+    def __init__(self, name: str, redis_client, channel: Callable, fetch: Callable, render: Callable,
+                 queue_size: int = 2, poll_interval: float = 1.0, max_failures: int = 10,
+                 keepalive: float = 5.0, rerender_interval: float = 0):
+        self.name = name
+        self.redis = redis_client
+        self.channel = channel
+        self.fetch = fetch
+        self.render = render
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.max_failures = max_failures
+        self.keepalive = keepalive
+        self.rerender_interval = rerender_interval
+        self.lock = threading.Lock()
+        self.broadcasters: Dict[object, FrameBroadcaster] = {}
+
+    def retire_if_idle(self, broadcaster: FrameBroadcaster) -> bool:
+        # 與 stream() 在同一把鎖下判斷，新觀看者不會加入正在結束的廣播
+        with self.lock:
+            if broadcaster.subscribers:
+                return False
+            self.retire_locked(broadcaster)
+            return True
+
+    def retire(self, broadcaster: FrameBroadcaster):
+        with self.lock:
+            self.retire_locked(broadcaster)
+
+    def retire_locked(self, broadcaster: FrameBroadcaster):
+        if self.broadcasters.get(broadcaster.camera_id) is broadcaster:
+            del self.broadcasters[broadcaster.camera_id]
+
+    def stream(self, camera_id):
+        """Generator of multipart chunks for one viewer."""
+        with self.lock:
+            broadcaster = self.broadcasters.get(camera_id)
+            if broadcaster is None:
+                broadcaster = FrameBroadcaster(self, camera_id)
+                self.broadcasters[camera_id] = broadcaster
+                broadcaster.start()
+            client = broadcaster.add()
+        last_chunk = None
+        try:
+            while True:
+                try:
+                    chunk = client.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # 畫面未更新時重送上一張，寫入失敗才能發現觀看者已斷線
+                    if last_chunk is not None:
+                        yield last_chunk
+                    continue
+                if chunk is END_OF_STREAM:
+                    return
+                last_chunk = chunk
+                yield chunk
+        finally:
+            # 觀看者斷線；最後一位離開時廣播執行緒會自行結束
+            with self.lock:
+                broadcaster.subscribers.discard(client)
@@ -0,0 +1,68 @@
+from segment_archive import (INDEX_ENTRY, INDEX_MAGIC, RECORD_HEADER, SEGMENT_HEADER, SEGMENT_MAGIC,
+                             TRAILER, FrameRef, open_segment)
+
+T0 = 1700000000.0
+FRAMES = [(T0 + i, bytes([i]) * (100 + i)) for i in range(5)]
+
+
+def build_segment(path, frames=FRAMES, footer=True):
+    """依 redisv1/segment_archive.py 的格式寫出分段檔"""
+    data = bytearray(SEGMENT_HEADER.pack(SEGMENT_MAGIC, 1))
+    index = []
+    for timestamp, jpeg in frames:
+        data += RECORD_HEADER.pack(len(jpeg), timestamp)
+        index.append((timestamp, len(data), len(jpeg)))
+        data += jpeg
+    if footer:
+        index_offset = len(data)
+        data += b''.join(INDEX_ENTRY.pack(*entry) for entry in index)
+        data += TRAILER.pack(index_offset, len(index), INDEX_MAGIC)
+    path.write_bytes(bytes(data))
+    return index
+
+
+def test_closed_segment_uses_the_footer(tmp_path):
+    path = tmp_path / '00.seg'
+    index = build_segment(path)
+    reader = open_segment(str(path))
+    assert reader.closed_segment
+    assert reader.index == index
+    assert [reader.read(offset, length) for _, offset, length in index] == [jpeg for _, jpeg in FRAMES]
+    assert not reader.is_stale()
+    reader.close()
+
+
+def test_open_segment_is_scanned(tmp_path):
+    path = tmp_path / '00.seg'
+    index = build_segment(path, footer=False)
+    # 寫到一半的紀錄不列入索引
+    with open(path, 'ab') as f:
+        f.write(RECORD_HEADER.pack(50, T0 + 10) + b'x' * 10)
+    reader = open_segment(str(path))
+    assert not reader.closed_segment
+    assert reader.index == index
+
+    with open(path, 'ab') as f:
+        f.write(b'x' * 40)
+    assert reader.is_stale()
+    reader.close()
+
+
+def test_find_range(tmp_path):
+    path = tmp_path / '00.seg'
+    index = build_segment(path)
+    reader = open_segment(str(path))
+    refs = reader.find_range(T0 + 1, T0 + 3)
+    assert refs == [FrameRef(timestamp, str(path), offset, length) for timestamp, offset, length in index[1:4]]
+    assert reader.find_range(T0 + 10, T0 + 20) == []
+    reader.close()
+
+
+def test_unreadable_segments(tmp_path):
+    assert open_segment(str(tmp_path / 'missing.seg')) is None
+    empty = tmp_path / 'empty.seg'
+    empty.write_bytes(b'')
+    assert open_segment(str(empty)).index == []
+    garbage = tmp_path / 'garbage.seg'
+    garbage.write_bytes(b'JUNK' * 8)
+    assert open_segment(str(garbage)).index == []
@@ -0,0 +1,69 @@
+from collections import Counter
+
+import pytest
+
+from shard_assignment import (WORKERS_KEY, assign, live_workers, rank_workers, rendezvous_owner,
+                              worker_lease_key, worker_state_key)
+
+CAMERAS = range(1, 601)
+
+
+def test_assignment_is_deterministic():
+    workers = {'1': 300, '2': 300, '3': 300}
+    assert assign(CAMERAS, workers) == assign(reversed(CAMERAS), dict(reversed(list(workers.items()))))
+    assert rank_workers(7, workers)[0] == rendezvous_owner(7, workers)
+
+
+def test_no_workers():
+    assert assign(CAMERAS, {}) == {}
+    assert rendezvous_owner(1, {}) is None
+
+
+def test_capacity_is_a_hard_cap():
+    owners = assign(CAMERAS, {'1': 100, '2': 250})
+    load = Counter(owners.values())
+    assert load['1'] == 100
+    assert load['2'] == 250
+    # 放不下的攝影機保持未分配
+    assert load[None] == len(CAMERAS) - 350
+
+
+def test_capacity_weights_the_share():
+    load = Counter(rendezvous_owner(camera_id, {'1': 1, '2': 2}) for camera_id in range(6000))
+    assert load['2'] / load['1'] == pytest.approx(2, rel=0.1)
+
+
+def test_adding_a_worker_only_moves_cameras_to_it():
+    before = assign(CAMERAS, {'1': 600, '2': 600})
+    after = assign(CAMERAS, {'1': 600, '2': 600, '3': 600})
+    moved = {camera_id for camera_id in CAMERAS if before[camera_id] != after[camera_id]}
+    assert moved
+    assert all(after[camera_id] == '3' for camera_id in moved)
+
+
+def test_removing_a_worker_only_moves_its_cameras():
+    workers = {'1': 600, '2': 600, '3': 600}
+    before = assign(CAMERAS, workers)
+    del workers['2']
+    after = assign(CAMERAS, workers)
+    for camera_id in CAMERAS:
+        if before[camera_id] != '2':
+            assert after[camera_id] == before[camera_id]
+
+
+def test_cameras_return_when_the_worker_comes_back():
+    workers = {'1': 600, '2': 600}
+    before = assign(CAMERAS, workers)
+    assign(CAMERAS, {'1': 600})
+    assert assign(CAMERAS, workers) == before
+
+
+def test_live_workers_skips_expired_leases():
+    fakeredis = pytest.importorskip('fakeredis')
+    r = fakeredis.FakeRedis()
+    r.sadd(WORKERS_KEY, '1', '2', '10')
+    r.hset(worker_state_key('1'), 'capacity', 20)
+    r.hset(worker_state_key('10'), 'capacity', 5)
+    r.set(worker_lease_key('1'), 'lease')
+    r.set(worker_lease_key('10'), 'lease')
+    assert live_workers(r) == {'1': 20, '10': 5}
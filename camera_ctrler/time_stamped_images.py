@@ -1,49 +1,91 @@
 import os
-from datetime import datetime, timedelta
+import threading
+
+from segment_archive import FrameRef, open_segment, segment_path
 
 class TimeStampedImages:
-    def __init__(self, folder_path):
-        self.folder_path = folder_path
-    
-    def find_images_in_range(self, start_timestamp, end_timestamp):
-        # 將傳入的時間搓轉換為 datetime 對象
-        start = datetime.fromtimestamp(start_timestamp)
-        end = datetime.fromtimestamp(end_timestamp)
-        
-        matched_files = []
-        
-        # 遍歷資料夾中的所有子資料夾
-        for item in os.listdir(self.folder_path):
-            try:
-                for foldername in os.listdir(self.folder_path+"/"+item):
-                    # 轉換子資料夾名稱，假設格式為 'YYYYMMDD_HH'
-                    folder_datetime = datetime.strptime(item+"_"+foldername, "%Y%m%d_%H")
-                    # 檢查資料夾的時間是否在指定的範圍內
-                    if start  - timedelta(hours=1) <= folder_datetime <= end + timedelta(hours=1):  # 加一小時來包含範圍內的整小時
-                        # 遍歷該子資料夾中的所有檔案
-                        full_folder_path = os.path.join(self.folder_path, item,foldername)
-                        for filename in os.listdir(full_folder_path):
-                            if filename.endswith('.jpg'):
-                                if start <= datetime.strptime(filename, "%Y%m%d%H%M%S.jpg") <= end:
-                                    file_path = os.path.join(full_folder_path, filename)
-                                    matched_files.append(file_path)
-            except ValueError:
-                # 如果子資料夾名稱不是日期時間格式，則忽略
-                continue
-        
-        return matched_files
-
-# # # 使用範例
-# folder_path = 'camera_100/image/7'
-# start_timestamp = float("1714055407.8254943") - 15
-# end_timestamp = float("1714055407.8254943") + 15
-
-# tsi = TimeStampedImages(folder_path)
-# image_paths = tsi.find_images_in_range(start_timestamp, end_timestamp)
+    """
+    以時間範圍查詢單一攝影機的存檔影像。
+
+    影像存在 redisv1 寫入的每小時分段檔（{folder_path}/{YYYYMMDD}/{HH}.seg），
+    直接由時間算出分段檔路徑，再以檔內索引二分搜尋，不需列舉目錄或解析檔名。
+    提供 ArchiveIndex 時改用持久化的 SQLite 索引查詢，跨月的長範圍查詢也不需開啟每個分段檔。
+    """
+
+    def __init__(self, folder_path, index=None):
+        # folder_path 為單一攝影機的存檔目錄，例如 frames/7
+        self.base_dir, self.camera_id = os.path.split(os.path.normpath(folder_path))
+        self.index = index
+        self.readers = {}
+        self.lock = threading.Lock()
+
+    def _reader(self, path):
+        with self.lock:
+            reader = self.readers.get(path)
+            if reader is not None and reader.is_stale():
+                # 目前這一小時的分段檔仍在追加，重新映射
+                reader.close()
+                reader = None
+            if reader is None:
+                if not os.path.exists(path):
+                    return None
+                reader = open_segment(path)
+                if reader is None:
+                    return None
+                self.readers[path] = reader
+            return reader
+
+    def _segment_paths(self, start_timestamp, end_timestamp):
+        hour = int(start_timestamp // 3600) * 3600
+        while hour <= end_timestamp:
+            yield segment_path(self.base_dir, self.camera_id, hour)
+            hour += 3600
+
+    def find_images_in_range(self, start_timestamp, end_timestamp, limit=None, offset=0, sync=True):
+        """
+        回傳時間範圍內的影像參照 FrameRef(timestamp, path, offset, length)，依時間排序，可分頁。
+        sync 為 False 時不先同步索引（例如讀取範圍查詢已回傳過的單張影像）。
+        """
+        if self.index is not None:
+            # 先補上最新寫入的紀錄，再由索引做範圍查詢
+            if sync:
+                self.index.sync_camera(int(self.camera_id))
+            return self.index.query(int(self.camera_id), start_timestamp, end_timestamp, limit, offset)
+
+        matched = []
+        for path in self._segment_paths(start_timestamp, end_timestamp):
+            reader = self._reader(path)
+            if reader is not None:
+                matched.extend(reader.find_range(start_timestamp, end_timestamp))
+            if limit is not None and len(matched) >= offset + limit:
+                break
+        return matched[offset:] if limit is None else matched[offset:offset + limit]
+
+    def count_in_range(self, start_timestamp, end_timestamp, sync=True):
+        if self.index is not None:
+            if sync:
+                self.index.sync_camera(int(self.camera_id))
+            return self.index.count(int(self.camera_id), start_timestamp, end_timestamp)
+        return len(self.find_images_in_range(start_timestamp, end_timestamp))
+
+    def read_image(self, ref: FrameRef):
+        """讀取單張影像的 JPEG 內容"""
+        reader = self._reader(ref.path)
+        if reader is None:
+            return None
+        return reader.read(ref.offset, ref.length)
+
+    def close(self):
+        with self.lock:
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
 
+# # 使用範例
+# tsi = TimeStampedImages('frames/7', ArchiveIndex('frames/archive_index.sqlite3', 'frames'))
 # starttime = '2024-04-25 15:09:10'
 # endtime = "2024-04-25 15:10:00"
 # start_timestamp = datetime.strptime(starttime, "%Y-%m-%d %H:%M:%S").timestamp()
 # end_timestamp = datetime.strptime(endtime, "%Y-%m-%d %H:%M:%S").timestamp()
-# filelist = tsi.find_images_in_range(start_timestamp, end_timestamp)
-# len(filelist)
\ No newline at end of file
+# refs = tsi.find_images_in_range(start_timestamp, end_timestamp, limit=100, offset=0)
+# jpeg = tsi.read_image(refs[0])
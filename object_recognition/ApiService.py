@@ -1,8 +1,11 @@
-import requests
+from camera_inventory import CameraInventory
 
 class ApiService:
-    def __init__(self, base_url):
+    def __init__(self, base_url, redis_client=None, resync_interval=60):
         self.base_url = base_url
+        # 有 Redis 時由變更事件增量更新攝影機清單，否則每次以條件式 GET 確認
+        self.inventory = CameraInventory(base_url, redis_client, resync_interval)
+        self.inventory.start()
     #     self.access_token = ""
     #     self.refresh_token = ""
     # def login(self, account, password):
@@ -24,13 +27,12 @@ class ApiService:
     #     return False
 
     def get_camera_list(self):
-        url = f'{self.base_url}/camera/cameras/all'
-        headers = {}
-        response = requests.get(url, headers=headers)
-        data = response.json()
+        if self.inventory.thread is None:
+            self.inventory.refresh()
+        data = self.inventory.cameras()
         cameralist = []
         
-        # 檢查是否 API 回應是一個列表
+        # 尚未取得清單時回傳空列表
         if isinstance(data, list):
             for camera in data:
                 if camera.get('stream_url') is not None:
@@ -27,6 +27,7 @@ from ultralytics import YOLO
 from config.config import Config
 from ApiService import ApiService
 from image_storage import ImageStorage
+from retention import FileRetentionIndex, RetentionService
 from logging_config import configure_logging
 from model_config import MODEL_CONFIG
 
@@ -51,12 +52,16 @@ class MainApp:
         
         # 初始化目錄和模型
         self.init_dirs()
+        self.init_retention()
         self.init_models()
 
         # API 服務初始化
         api_url = self.config.API_SERVICE_URL or "http://web:5000"
-        self.api_service = ApiService(base_url=api_url)
+        self.api_service = ApiService(base_url=api_url, redis_client=self.r,
+                                      resync_interval=self.config.INVENTORY_RESYNC_INTERVAL)
         self.last_sent_timestamps = {}
+        # 每台攝影機最後處理過的影像 seq
+        self.last_processed_seq = {}
 
         # 設定休眠間隔
         self.SLEEP_INTERVAL = self.config.SLEEP_INTERVAL
@@ -80,7 +85,13 @@ class MainApp:
             )
             # Test connection
             self.r.ping()
-            self.image_storage = ImageStorage(self.r)
+            self.image_storage = ImageStorage(
+                self.r,
+                frame_source=self.config.FRAME_SOURCE,
+                ring_prefix=self.config.FRAME_RING_PREFIX,
+                ring_stale_seconds=self.config.FRAME_RING_STALE_SECONDS,
+                save_codec=self.config.BOXED_IMAGE_CODEC
+            )
             self.logger.info(f"Redis connection established: {self.redis_host}:{self.redis_port}")
         except Exception as e:
             self.logger.error(f"Failed to connect to Redis: {e}")
@@ -113,6 +124,20 @@ class MainApp:
             self.logger.error(f"Failed to initialize directories: {e}")
             raise
 
+    def init_retention(self):
+        """依 IMAGE_RETENTION_DAYS 與容量上限清理 annotated_images，索引啟動時建立一次"""
+        self.annotated_index = FileRetentionIndex(self.ANNOTATED_SAVE_DIR)
+        self.retention = RetentionService(
+            'annotated_images',
+            self.annotated_index,
+            max_age_seconds=self.config.IMAGE_RETENTION_DAYS * 86400,
+            quota_bytes=self.config.ANNOTATED_QUOTA_MB * 1024 * 1024,
+            deletes_per_second=self.config.RETENTION_DELETES_PER_SECOND,
+            interval=self.config.RETENTION_INTERVAL,
+            redis_client=self.r,
+        )
+        self.retention.start()
+
     def init_models(self):
         """Initialize YOLO models and annotators with error handling"""
         start_time = time.time()
@@ -202,25 +227,23 @@ class MainApp:
 
     async def fetch_camera_status(self):
         """
-        從 Redis 獲取所有攝影機的狀態，使用 mget 提高效能。
+        從 Redis 獲取所有攝影機的狀態，以 pipeline 批量讀取 camera:{id} hash。
         """
         start_time = time.time()
         try:
-            # 透過鍵模式一次性獲取所有攝影機相關的狀態鍵
-            camera_status_keys = self.r.keys("camera_*_status")
-            if not camera_status_keys:
+            camera_states = self.image_storage.fetch_camera_states()
+            if not camera_states:
                 self.logger.warning("未發現任何攝影機狀態鍵")
                 return {}
 
-            # 使用 mget 批量獲取所有狀態鍵的值
-            status_values = self.r.mget(camera_status_keys)
-            camera_status = {}
-
-            for key, status in zip(camera_status_keys, status_values):
-                camera_id = int(key.decode("utf-8").split("_")[1])
-                status_decoded = status.decode("utf-8") if status else "False"
-                # 將狀態儲存到字典
-                camera_status[camera_id] = {"alive": status_decoded}
+            camera_status = {
+                camera_id: {
+                    "alive": state.get("status", "False"),
+                    "frozen": state.get("frozen", "False"),
+                    "seq": state.get("seq"),
+                }
+                for camera_id, state in camera_states.items()
+            }
 
             self.logger.debug(f"從 Redis 批量獲取攝影機狀態：{camera_status}")
             self.time_logger.info(
@@ -232,15 +255,30 @@ class MainApp:
             return {}
 
     async def fetch_snapshot(self, session, camera_id):
-        """從 Redis 中獲取指定攝影機的最新影像"""
+        """
+        從共享記憶體或 Redis 中獲取指定攝影機的最新影像，回傳 (image, transform)。
+        設定 INFERENCE_RENDITION 時優先使用預先縮放的影像，transform 為其相對原圖的 (scale_x, scale_y, pad_x, pad_y)。
+        """
         start_time = time.time()
-        redis_key = f"camera_{camera_id}_latest_frame"
         loop = asyncio.get_event_loop()
-        image = await loop.run_in_executor(None, self.image_storage.fetch_image, redis_key)
+        image, transform = None, None
+        if self.config.INFERENCE_RENDITION:
+            image, transform = await loop.run_in_executor(
+                None, self.image_storage.fetch_rendition, camera_id, self.config.INFERENCE_RENDITION
+            )
+        if image is None:
+            image = await loop.run_in_executor(None, self.image_storage.fetch_latest_frame, camera_id)
         self.time_logger.info(
             f"Snapshot for camera {camera_id} fetched in {time.time() - start_time:.2f} seconds"
         )
-        return image
+        return image, transform
+
+    @staticmethod
+    def transform_mask(mask, transform, size):
+        """將原圖座標的遮罩套用與縮放影像相同的縮放與補邊"""
+        scale_x, scale_y, pad_x, pad_y = transform
+        matrix = np.float32([[scale_x, 0, pad_x], [0, scale_y, pad_y]])
+        return cv2.warpAffine(mask, matrix, size, flags=cv2.INTER_NEAREST)
 
     async def fetch_mask(self, session, camera_id):
         """Fetches the mask for the specified camera from the mask endpoint."""
@@ -261,8 +299,10 @@ class MainApp:
 
     async def process_camera(self, session, camera_id, camera_info, model_camera_ids):
         """處理單個攝影機的影像獲取和辨識"""
-        img = await self.fetch_snapshot(session, camera_id)
+        img, transform = await self.fetch_snapshot(session, camera_id)
         mask = await self.fetch_mask(session, camera_id)
+        if img is not None and mask is not None and transform is not None:
+            mask = self.transform_mask(mask, transform, (img.shape[1], img.shape[0]))
         if img is not None:
             self.logger.info(f"Image from camera {camera_id} ready for processing")
             recognition_model = camera_info.get("recognition")
@@ -272,14 +312,15 @@ class MainApp:
                     img,
                     mask,
                     recognition_model,
-                    camera_info
+                    camera_info,
+                    transform=transform
                 )
             else:
                 self.logger.warning(f"No valid recognition model for camera {camera_id}")
         else:
             self.logger.warning(f"No image fetched for camera {camera_id}")
 
-    def call_model_single(self, camera_id, image, mask, model_type, camera_info):
+    def call_model_single(self, camera_id, image, mask, model_type, camera_info, transform=None):
         """使用指定的模型處理單個攝影機的影像"""
         start_time = time.time()
         notify_message = {
@@ -338,6 +379,7 @@ class MainApp:
             notify_message,
             detection_flag=detection_flag,
             label=label,
+            transform=transform,
         )
 
         self.time_logger.info(
@@ -432,6 +474,7 @@ class MainApp:
         notify_message,
         detection_flag,
         label,
+        transform=None,
     ):
         """儲存標註影像並發送通知"""
         start_time = time.time()
@@ -439,6 +482,7 @@ class MainApp:
             self.ANNOTATED_SAVE_DIR, f"{camera_id}_{timestamp}.jpg"
         )
         cv2.imwrite(annotated_img_path, annotated_image)
+        self.annotated_index.track(annotated_img_path, timestamp=timestamp)
         self.logger.info(f"Annotated image saved to {annotated_img_path}")
 
         stream_img_path = os.path.join(self.STREAM_SAVE_DIR, f"{camera_id}.jpg")
@@ -450,6 +494,16 @@ class MainApp:
         )
         redis_key = f"camera_{camera_id}_boxed_image"
         self.image_storage.save_image(redis_key, annotated_image)
+        # 記錄帶框影像相對原圖的轉換，辨識串流據此對齊多邊形
+        transform_key = f"camera_{camera_id}_boxed_transform"
+        pipe = self.r.pipeline(transaction=False)
+        if transform is not None:
+            pipe.set(transform_key, ",".join(str(v) for v in transform))
+        else:
+            pipe.delete(transform_key)
+        # 通知 camera_ctrler 的辨識串流有新影像
+        pipe.publish(f"camera_{camera_id}_boxed_ready", timestamp)
+        pipe.execute()
 
         self.time_logger.info(
             f"Save and notify completed in {time.time() - start_time:.2f} seconds"
@@ -483,7 +537,13 @@ class MainApp:
                 # 為每台攝影機創建處理任務
                 tasks = []
                 for camera_id, status in camera_status.items():
+                    # 畫面凍結或沒有新影像（seq 未變）時不重跑推論
+                    if status["frozen"] == "True":
+                        continue
+                    if status["seq"] is not None and status["seq"] == self.last_processed_seq.get(camera_id):
+                        continue
                     if status["alive"] == "True":
+                        self.last_processed_seq[camera_id] = status["seq"]
                         camera_info = camera_list_by_id.get(camera_id)  # 使用轉換後的字典進行查詢
                         if camera_info:
                             tasks.append(self.process_camera(session, camera_id, camera_info, None))
@@ -86,21 +86,19 @@ class MainApp:
     async def fetch_camera_status(self):
         """
         從 Redis 獲取所有攝影機的狀態 (alive / 非 alive)。
-        狀態鍵命名格式：camera_{id}_status
+        狀態 hash 命名格式：camera:{id}，欄位 status
         """
         try:
-            keys = self.r.keys("camera_*_status")
-            if not keys:
+            camera_states = self.image_storage.fetch_camera_states()
+            if not camera_states:
                 self.logger.warning("Redis 中未發現任何攝影機狀態鍵")
                 return {}
 
-            status_values = self.r.mget(keys)
-            camera_status = {}
-
-            for k, v in zip(keys, status_values):
-                cam_id = k.decode("utf-8").split("_")[1]
-                alive_str = v.decode("utf-8") if v else "False"
-                camera_status[int(cam_id)] = alive_str
+            # 畫面凍結的攝影機視為沒有新影像，不送推論
+            camera_status = {
+                cam_id: "False" if state.get("frozen") == "True" else state.get("status", "False")
+                for cam_id, state in camera_states.items()
+            }
             return camera_status
         except Exception as e:
             self.logger.error(f"fetch_camera_status 時發生錯誤: {e}")
@@ -110,8 +108,7 @@ class MainApp:
         """
         從 Redis 取最新的攝影機影像
         """
-        redis_key = f"camera_{camera_id}_latest_frame"
-        image = self.image_storage.fetch_image(redis_key)
+        image = self.image_storage.fetch_latest_frame(camera_id)
         if image is None:
             self.logger.debug(f"無法獲取攝影機 {camera_id} 的影像")
         return image
@@ -21,6 +21,8 @@ class Config:
     # API Service Configuration
     API_SERVICE_URL: str = os.getenv('API_SERVICE_URL', 'http://backend:5000')
     API_TIMEOUT: int = int(os.getenv('API_TIMEOUT', '30'))
+    # 攝影機清單以 web 服務的變更事件更新，每隔此秒數再以條件式 GET 確認一次
+    INVENTORY_RESYNC_INTERVAL: float = float(os.getenv('INVENTORY_RESYNC_INTERVAL', '60'))
     
     # Model Configuration
     MODEL_PATH_BASE: str = os.getenv('MODEL_PATH_BASE', '/app/models')
@@ -34,6 +36,20 @@ class Config:
     BASE_SAVE_DIR: str = os.getenv('BASE_SAVE_DIR', 'saved_images')
     ENABLE_IMAGE_SAVING: bool = os.getenv('ENABLE_IMAGE_SAVING', 'true').lower() == 'true'
     IMAGE_RETENTION_DAYS: int = int(os.getenv('IMAGE_RETENTION_DAYS', '7'))
+    # annotated_images 容量上限（MB，0 表示不限），超過時由最舊的開始刪除
+    ANNOTATED_QUOTA_MB: int = int(os.getenv('ANNOTATED_QUOTA_MB', '0'))
+    RETENTION_DELETES_PER_SECOND: int = int(os.getenv('RETENTION_DELETES_PER_SECOND', '50'))
+    RETENTION_INTERVAL: float = float(os.getenv('RETENTION_INTERVAL', '60'))
+    
+    # Frame Source Configuration
+    # redis: latest JPEG; shm: shared-memory ring; stream: frame history stream, skipping frames already processed
+    FRAME_SOURCE: str = os.getenv('FRAME_SOURCE', 'redis')
+    FRAME_RING_PREFIX: str = os.getenv('FRAME_RING_PREFIX', 'visionflow_cam')
+    FRAME_RING_STALE_SECONDS: float = float(os.getenv('FRAME_RING_STALE_SECONDS', '5'))
+    # 推論改用 redisv1 預先縮放的影像（RENDITIONS 中的名稱，例如 infer），空字串表示使用原圖
+    INFERENCE_RENDITION: str = os.getenv('INFERENCE_RENDITION', '')
+    # 帶框影像寫入 Redis 時使用的編碼（jpeg | webp | raw | lz4，frame_codec 封裝）
+    BOXED_IMAGE_CODEC: str = os.getenv('BOXED_IMAGE_CODEC', 'jpeg')
     
     # Notification Configuration
     NOTIFICATION_COOLDOWN: int = int(os.getenv('NOTIFICATION_COOLDOWN', '60'))  # seconds
@@ -89,6 +105,21 @@ class Config:
         if cls.MAX_WORKERS < 1:
             errors.append("MAX_WORKERS must be at least 1")
         
+        if cls.IMAGE_RETENTION_DAYS < 0 or cls.ANNOTATED_QUOTA_MB < 0:
+            errors.append("IMAGE_RETENTION_DAYS and ANNOTATED_QUOTA_MB must not be negative")
+        
+        if cls.RETENTION_INTERVAL <= 0:
+            errors.append("RETENTION_INTERVAL must be positive")
+        
+        if cls.INVENTORY_RESYNC_INTERVAL <= 0:
+            errors.append("INVENTORY_RESYNC_INTERVAL must be positive")
+        
+        if cls.FRAME_SOURCE not in ('redis', 'shm', 'stream'):
+            errors.append("FRAME_SOURCE must be 'redis', 'shm' or 'stream'")
+        
+        if cls.BOXED_IMAGE_CODEC not in ('jpeg', 'webp', 'raw', 'lz4'):
+            errors.append("BOXED_IMAGE_CODEC must be one of: jpeg, webp, raw, lz4")
+        
         return errors
     
     @classmethod
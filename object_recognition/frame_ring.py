@@ -0,0 +1,155 @@
+"""
+Shared-Memory Frame Ring (reader side)
+Attaches to the per-camera ring written by the redisv1 ingest worker and
+exposes the newest frame as a NumPy view over shared memory.
+
+The layout must stay in sync with redisv1/frame_ring.py.
+"""
+
+import struct
+import logging
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Tuple, Dict, Any
+
+import numpy as np
+
+MAGIC = b'VFRB'
+VERSION = 1
+
+HEADER_FMT = '<4sIIQQQ'
+HEADER_SIZE = 64
+
+SLOT_FMT = '<QQdIIIQ'
+SLOT_HEADER_SIZE = 64
+
+# 序號未前進時，檢查同名區段是否已被重建的最短間隔（秒）
+GENERATION_CHECK_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def ring_name(prefix: str, camera_id) -> str:
+    """Shared-memory segment name for a camera (must match the writer)."""
+    return f"{prefix}_{camera_id}"
+
+
+class FrameRingReader:
+    """Lock-free reader for one camera's frame ring."""
+
+    def __init__(self, camera_id, prefix: str, stale_seconds: float = 5.0):
+        self.camera_id = camera_id
+        self.name = ring_name(prefix, camera_id)
+        self.stale_seconds = stale_seconds
+        self.shm = None
+        self.slot_count = 0
+        self.slot_capacity = 0
+        self.generation = None
+        self.last_seq = 0
+        self.last_generation_check = 0.0
+
+    def _open(self) -> Optional[shared_memory.SharedMemory]:
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return None
+        # 讀取端不擁有此區段，避免 resource_tracker 在進程結束時把它 unlink 掉
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+    def _attach(self) -> bool:
+        shm = self._open()
+        if shm is None:
+            return False
+
+        magic, version, slot_count, slot_capacity, _, generation = struct.unpack_from(HEADER_FMT, shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            logger.warning(f"Frame ring {self.name} has unexpected header {magic!r} v{version}")
+            shm.close()
+            return False
+
+        self.shm = shm
+        self.slot_count = slot_count
+        self.slot_capacity = slot_capacity
+        self.generation = generation
+        self.last_seq = 0
+        self.last_generation_check = time.monotonic()
+        return True
+
+    def _replaced(self) -> bool:
+        """True when the segment now holding the ring's name is not the one attached."""
+        shm = self._open()
+        if shm is None:
+            return False
+        generation = struct.unpack_from(HEADER_FMT, shm.buf, 0)[5]
+        shm.close()
+        return generation != self.generation
+
+    def detach(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                # 仍有外部持有的 view，交給 GC 處理
+                pass
+            self.shm = None
+
+    def _slot_offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_capacity)
+
+    def read_latest(self, copy: bool = True) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+        """
+        Return (frame, meta) for the newest committed frame, or None.
+
+        With copy=False the frame is a view into shared memory; it stays valid
+        only until the writer laps the ring, which is_current(meta) reports.
+        """
+        if self.shm is None and not self._attach():
+            return None
+
+        latest_seq = struct.unpack_from(HEADER_FMT, self.shm.buf, 0)[4]
+        now = time.monotonic()
+        if latest_seq == self.last_seq and now - self.last_generation_check >= GENERATION_CHECK_INTERVAL:
+            # 序號停止前進時確認寫入端是否已重建同名區段（攝影機搬移或工作器重啟），是則改掛載新的區段
+            self.last_generation_check = now
+            if self._replaced():
+                logger.info(f"Frame ring {self.name} was recreated; re-attaching")
+                self.detach()
+                if not self._attach():
+                    return None
+                latest_seq = struct.unpack_from(HEADER_FMT, self.shm.buf, 0)[4]
+        self.last_seq = latest_seq
+        if latest_seq == 0:
+            return None
+
+        offset = self._slot_offset(latest_seq)
+        seq_begin, seq_end, timestamp, height, width, channels, nbytes = \
+            struct.unpack_from(SLOT_FMT, self.shm.buf, offset)
+        if seq_begin != latest_seq or seq_end != latest_seq:
+            # 寫入端正在覆寫這個 slot
+            return None
+
+        if time.time() - timestamp > self.stale_seconds:
+            # 寫入端可能已重建同名區段，重新掛載
+            self.detach()
+            return None
+
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf,
+                           offset=offset + SLOT_HEADER_SIZE)
+        meta = {'seq': latest_seq, 'timestamp': timestamp, 'offset': offset}
+
+        if copy:
+            frame = frame.copy()
+            if not self.is_current(meta):
+                return None
+        return frame, meta
+
+    def is_current(self, meta: Dict[str, Any]) -> bool:
+        """True while the slot behind meta has not been overwritten."""
+        if self.shm is None:
+            return False
+        return struct.unpack_from('<Q', self.shm.buf, meta['offset'])[0] == meta['seq']
@@ -1,31 +1,46 @@
-import cv2
-import numpy as np
+import time
 import logging
 
+from frame_ring import FrameRingReader
+from frame_codec import encode_frame, decode_frame
+
+RENDITION_VERSION = 1
+
 class ImageStorage:
-    def __init__(self, redis_instance):
+    def __init__(self, redis_instance, frame_source='redis', ring_prefix='visionflow_cam',
+                 ring_stale_seconds=5.0, save_codec='jpeg', save_quality=70):
         self.r = redis_instance
+        self.save_codec = save_codec
+        self.save_quality = save_quality
+        self.frame_source = frame_source
+        self.ring_prefix = ring_prefix
+        self.ring_stale_seconds = ring_stale_seconds
+        self.ring_readers = {}
+        # 每台攝影機最後處理過的歷史串流 ID
+        self.last_history_ids = {}
 
-    def save_image(self, key, image):
-        """將圖片保存到 Redis。"""
-        is_success, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        if is_success:
-            try:
-                self.r.set(key, buffer.tobytes())
-                logging.info(f"Image saved to Redis under key {key}.")
-            except Exception as e:
-                logging.error(f"Failed to save image to Redis: {str(e)}")
-        else:
-            logging.error("Failed to encode image to buffer.")
+    def save_image(self, key, image, codec=None, seq=0, timestamp=None):
+        """將圖片以 frame_codec 封裝（預設 save_codec）保存到 Redis。"""
+        codec = codec or self.save_codec
+        try:
+            data = encode_frame(image, codec, seq, time.time() if timestamp is None else timestamp,
+                                quality=self.save_quality)
+        except Exception as e:
+            logging.error(f"Failed to encode image as {codec}: {str(e)}")
+            return
+        try:
+            self.r.set(key, data)
+            logging.info(f"Image saved to Redis under key {key}.")
+        except Exception as e:
+            logging.error(f"Failed to save image to Redis: {str(e)}")
 
     def fetch_image(self, key):
-        """從 Redis 中獲取圖片。"""
+        """從 Redis 中獲取圖片，依封裝標頭自動選擇解碼器（相容舊的純 JPEG）。"""
         try:
             image_data = self.r.get(key)
             if image_data:
                 logging.info(f"Fetched image data from Redis for key {key}")
-                np_arr = np.frombuffer(image_data, np.uint8)
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                img, _ = decode_frame(image_data)
                 return img
             else:
                 logging.error(f"No image data found in Redis for key {key}")
@@ -33,3 +48,136 @@ class ImageStorage:
         except Exception as e:
             logging.error(f"Error fetching image from Redis for key {key}: {str(e)}")
             return None
+
+    def fetch_ring_frame(self, camera_id, copy=True):
+        """從共享記憶體 ring 讀取最新的原始 BGR 影像，回傳 (frame, meta) 或 None。"""
+        reader = self.ring_readers.get(camera_id)
+        if reader is None:
+            reader = FrameRingReader(camera_id, self.ring_prefix, self.ring_stale_seconds)
+            self.ring_readers[camera_id] = reader
+        try:
+            return reader.read_latest(copy=copy)
+        except Exception as e:
+            logging.error(f"Error reading frame ring for camera {camera_id}: {str(e)}")
+            reader.detach()
+            return None
+
+    def fetch_latest_frame(self, camera_id, copy=True):
+        """
+        獲取攝影機最新影像，shm 模式優先讀共享記憶體，失敗時退回 Redis；
+        stream 模式讀歷史串流，已處理過的影像回傳 None。
+        """
+        if self.frame_source == 'stream':
+            return self.fetch_unseen_frame(camera_id)
+        if self.frame_source == 'shm':
+            result = self.fetch_ring_frame(camera_id, copy=copy)
+            if result is not None:
+                return result[0]
+            logging.debug(f"Frame ring unavailable for camera {camera_id}, falling back to Redis")
+        return self.fetch_image(f"camera_{camera_id}_latest_frame")
+
+    def fetch_rendition(self, camera_id, name):
+        """
+        讀取 redisv1 發布的縮放影像，回傳 (image, (scale_x, scale_y, pad_x, pad_y))；
+        尚未發布時回傳 (None, None)，由呼叫端退回原圖。
+        """
+        try:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.get(f"camera_{camera_id}_{name}_v{RENDITION_VERSION}")
+            pipe.hget(f"camera:{camera_id}", f"{name}_transform")
+            image_data, transform = pipe.execute()
+        except Exception as e:
+            logging.error(f"Error fetching rendition {name} for camera {camera_id}: {str(e)}")
+            return None, None
+        if not image_data or not transform:
+            return None, None
+        img, _ = decode_frame(image_data)
+        values = transform.decode("utf-8").split(",")
+        if len(values) == 3:
+            # 舊格式 "scale,pad_x,pad_y"，水平與垂直比例相同
+            values.insert(1, values[0])
+        scale_x, scale_y, pad_x, pad_y = values
+        return img, (float(scale_x), float(scale_y), int(pad_x), int(pad_y))
+
+    @staticmethod
+    def _history_key(camera_id):
+        return f"camera_{camera_id}_frames"
+
+    def _decode_history(self, entries, decode=True):
+        """把 XRANGE 結果轉成 [{'id', 'seq', 'ts', 'timestamp', 'image'}]，image 預設解碼成 BGR。"""
+        frames = []
+        for entry_id, fields in entries:
+            image = fields.get(b"frame")
+            if decode and image is not None:
+                image, _ = decode_frame(image)
+            frames.append({
+                "id": entry_id.decode("utf-8"),
+                "seq": int(fields.get(b"seq", 0)),
+                "ts": float(fields.get(b"ts", 0)),
+                "timestamp": fields.get(b"timestamp", b"").decode("utf-8"),
+                "image": image,
+            })
+        return frames
+
+    def fetch_history_latest(self, camera_id, decode=True):
+        """讀取歷史串流中最新的一張影像，沒有歷史時回傳 None。"""
+        try:
+            entries = self.r.xrevrange(self._history_key(camera_id), count=1)
+        except Exception as e:
+            logging.error(f"Error reading frame history for camera {camera_id}: {str(e)}")
+            return None
+        frames = self._decode_history(entries, decode)
+        return frames[0] if frames else None
+
+    def fetch_history_since(self, camera_id, last_id="0-0", count=None, decode=True):
+        """
+        讀取 last_id 之後的所有影像（不含 last_id）。
+        串流 ID 在工作器重啟後仍單調遞增，適合當作「已處理到哪裡」的游標；
+        seq 欄位則會隨工作器重啟歸零。
+        """
+        try:
+            entries = self.r.xrange(self._history_key(camera_id), min=f"({last_id}", count=count)
+        except Exception as e:
+            logging.error(f"Error reading frame history for camera {camera_id}: {str(e)}")
+            return []
+        return self._decode_history(entries, decode)
+
+    def fetch_history_range(self, camera_id, start_ts, end_ts, count=None, decode=True):
+        """讀取 [start_ts, end_ts]（epoch 秒）之間發布的影像，用於組成事件片段。"""
+        try:
+            entries = self.r.xrange(
+                self._history_key(camera_id),
+                min=int(start_ts * 1000), max=int(end_ts * 1000), count=count,
+            )
+        except Exception as e:
+            logging.error(f"Error reading frame history for camera {camera_id}: {str(e)}")
+            return []
+        return self._decode_history(entries, decode)
+
+    def fetch_unseen_frame(self, camera_id):
+        """回傳尚未處理過的最新影像；與上次相同時回傳 None，讓辨識略過重複畫面。"""
+        frame = self.fetch_history_latest(camera_id)
+        if frame is None or frame["id"] == self.last_history_ids.get(camera_id):
+            return None
+        self.last_history_ids[camera_id] = frame["id"]
+        return frame["image"]
+
+    def fetch_camera_states(self):
+        """批量讀取所有 camera:{id} 狀態 hash，回傳 {camera_id: {欄位: 值}}。"""
+        camera_keys = []
+        for key in self.r.scan_iter("camera:*", count=500):
+            camera_id = key.decode("utf-8").split(":", 1)[1]
+            if camera_id.isdigit():
+                camera_keys.append((int(camera_id), key))
+        if not camera_keys:
+            return {}
+
+        pipe = self.r.pipeline(transaction=False)
+        for _, key in camera_keys:
+            pipe.hgetall(key)
+        states = pipe.execute()
+
+        return {
+            camera_id: {k.decode("utf-8"): v.decode("utf-8") for k, v in state.items()}
+            for (camera_id, _), state in zip(camera_keys, states)
+        }
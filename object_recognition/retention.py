@@ -0,0 +1,192 @@
+"""
+Retention
+Background deletion of stored images by age and by a byte quota.
+
+The service never lists directories while running. It pops the oldest entry
+from an index, which is any object providing:
+
+    oldest()       -> (timestamp, path, size) of the oldest entry, or None
+    remove(path)   drop an entry after its file was deleted
+    total_bytes()  bytes currently tracked
+
+FileRetentionIndex is the in-memory index used for plain files: one scan on
+startup, then track() as files are written. Entries whose timestamp has not
+passed yet (e.g. a segment still being written) are never deleted.
+
+Deletions are paced by a token bucket, and reclaimed bytes are published to
+the Redis hash retention:{name} (reclaimed_bytes, deleted_files,
+tracked_bytes, updated).
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FileRetentionIndex:
+    """Oldest-first index of the files under one directory, keyed by mtime."""
+
+    def __init__(self, directory, suffixes=('.jpg',)):
+        self.directory = directory
+        self.suffixes = suffixes
+        self.lock = threading.Lock()
+        self.heap = []
+        self.sizes = {}
+        self.bytes = 0
+
+    def rebuild(self):
+        """One scan of the directory tree; called once on startup."""
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(self.suffixes):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        with self.lock:
+            # 保留掃描期間 track() 加入的檔案
+            scanned = {path for _, path, _ in entries}
+            entries.extend(entry for entry in self.heap if entry[1] in self.sizes and entry[1] not in scanned)
+            heapq.heapify(entries)
+            self.heap = entries
+            self.sizes = {path: size for _, path, size in entries}
+            self.bytes = sum(self.sizes.values())
+        logger.info(f"Retention index for {self.directory}: {len(entries)} files, {self.bytes} bytes")
+
+    def track(self, path, size=None, timestamp=None):
+        """Register a file that was just written."""
+        if size is None or timestamp is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            size = st.st_size if size is None else size
+            timestamp = st.st_mtime if timestamp is None else timestamp
+        with self.lock:
+            # 同一路徑被覆寫時只更新大小，堆積中的舊項目刪除時再略過
+            self.bytes += size - self.sizes.get(path, 0)
+            if path not in self.sizes:
+                heapq.heappush(self.heap, (timestamp, path, size))
+            self.sizes[path] = size
+
+    def oldest(self) -> Optional[Tuple[float, str, int]]:
+        with self.lock:
+            while self.heap and self.heap[0][1] not in self.sizes:
+                heapq.heappop(self.heap)
+            if not self.heap:
+                return None
+            timestamp, path, _ = self.heap[0]
+            return timestamp, path, self.sizes[path]
+
+    def remove(self, path):
+        with self.lock:
+            self.bytes -= self.sizes.pop(path, 0)
+            while self.heap and self.heap[0][1] not in self.sizes:
+                heapq.heappop(self.heap)
+
+    def total_bytes(self) -> int:
+        return self.bytes
+
+
+class RetentionService:
+    """Deletes index entries older than max_age or beyond quota, oldest first."""
+
+    def __init__(self, name, index, max_age_seconds=0, quota_bytes=0, deletes_per_second=50,
+                 interval=60, redis_client=None, on_delete=None):
+        self.name = name
+        self.index = index
+        self.max_age_seconds = max_age_seconds
+        self.quota_bytes = quota_bytes
+        self.deletes_per_second = deletes_per_second
+        self.interval = interval
+        self.r = redis_client
+        self.on_delete = on_delete
+        self.stop_event = threading.Event()
+        self.reclaimed_bytes = 0
+        self.deleted_files = 0
+
+    def _over_limit(self, timestamp, now) -> bool:
+        if timestamp > now:
+            return False
+        if self.max_age_seconds and timestamp < now - self.max_age_seconds:
+            return True
+        return bool(self.quota_bytes) and self.index.total_bytes() > self.quota_bytes
+
+    def run_once(self) -> int:
+        """One pass; returns bytes reclaimed."""
+        reclaimed = deleted = 0
+        tokens = float(self.deletes_per_second)
+        last = time.monotonic()
+        while not self.stop_event.is_set():
+            entry = self.index.oldest()
+            if entry is None or not self._over_limit(entry[0], time.time()):
+                break
+            # 令牌桶限制每秒刪除數量，避免與寫入搶磁碟 I/O
+            if self.deletes_per_second:
+                now = time.monotonic()
+                tokens = min(self.deletes_per_second, tokens + (now - last) * self.deletes_per_second)
+                last = now
+                if tokens < 1:
+                    time.sleep((1 - tokens) / self.deletes_per_second)
+                    continue
+                tokens -= 1
+            _, path, size = entry
+            try:
+                os.remove(path)
+                reclaimed += size
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"[{self.name}] Failed to delete {path}: {e}")
+                break
+            self.index.remove(path)
+            if self.on_delete is not None:
+                self.on_delete(path)
+
+        self.reclaimed_bytes += reclaimed
+        self.deleted_files += deleted
+        if deleted:
+            logger.info(f"[{self.name}] Retention removed {deleted} files, reclaimed {reclaimed} bytes")
+        self._publish(reclaimed, deleted)
+        return reclaimed
+
+    def _publish(self, reclaimed, deleted):
+        if self.r is None:
+            return
+        key = f"retention:{self.name}"
+        try:
+            pipe = self.r.pipeline()
+            pipe.hincrby(key, 'reclaimed_bytes', reclaimed)
+            pipe.hincrby(key, 'deleted_files', deleted)
+            pipe.hset(key, mapping={'tracked_bytes': self.index.total_bytes(), 'updated': time.time()})
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"[{self.name}] Failed to publish retention metrics: {e}")
+
+    def run(self):
+        if hasattr(self.index, 'rebuild'):
+            self.index.rebuild()
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"[{self.name}] Retention pass failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True, name=f"retention-{self.name}")
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
@@ -7,14 +7,29 @@ import os
 import sys
 import redis
 import cv2
-import multiprocessing
 import logging
-from time import time, sleep, localtime, strftime
+import threading
+from time import time, thread_time, localtime, strftime
 from datetime import datetime
 from typing import Dict, Any, Optional
 
 # Local imports
 from config import RedisWorkerConfig as Config
+from frame_ring import FrameRingWriter
+from camera_state import CameraStatePublisher
+from ingest_supervisor import IngestSupervisor
+from latest_frame_capture import LatestFrameCapture
+from renditions import parse_renditions, encode_renditions
+from frame_fingerprint import FrameFingerprint
+from capture_backends import CaptureBackend, create_backend, split_backend_url
+from preview_passthrough import PreviewPassthrough
+from reconnect_scheduler import ReconnectScheduler
+from worker_heartbeat import WorkerHeartbeat, worker_connect_slots_key
+from frame_codec import encode_frame, read_header, as_jpeg
+from ingest_metrics import CameraMetrics
+import metrics
+from segment_archive import SegmentWriter
+from stream_probe import StreamProbeCache
 
 # Setup logging
 def setup_logging(log_level: str = "INFO") -> logging.Logger:
@@ -32,19 +47,41 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
 # Initialize configuration and logger
 config = Config()
 logger = setup_logging(config.LOG_LEVEL)
+RENDITION_SPECS = parse_renditions(config.RENDITIONS)
+RECONNECT = ReconnectScheduler(
+    base_delay=config.RECONNECT_BASE_DELAY,
+    max_delay=config.RECONNECT_INTERVAL,
+    max_concurrent_connects=config.MAX_CONCURRENT_CONNECTS,
+    failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+    open_seconds=config.BREAKER_OPEN_SECONDS,
+    max_open_seconds=config.BREAKER_MAX_OPEN_SECONDS,
+    connect_key=worker_connect_slots_key(config.WORKER_ID),
+    connect_slot_ttl=config.CONNECT_SLOT_TTL,
+)
 
-def init_redis_connection() -> redis.Redis:
-    """Initialize Redis connection with error handling"""
+def init_redis_connection(max_connections: Optional[int] = None) -> redis.Redis:
+    """Initialize Redis connection with error handling
+
+    With max_connections set, the client is backed by a blocking pool so it
+    can be shared by all capture threads of an ingest process.
+    """
     try:
-        r = redis.Redis(
+        connection_kwargs = dict(
             host=config.REDIS_HOST,
             port=config.REDIS_PORT,
             db=config.REDIS_DB,
+            password=config.REDIS_PASSWORD,
             decode_responses=False,
             socket_timeout=5,
             socket_connect_timeout=5,
             # retry_on_timeout=True
         )
+        if max_connections:
+            pool = redis.BlockingConnectionPool(max_connections=max_connections, timeout=5,
+                                                **connection_kwargs)
+            r = redis.Redis(connection_pool=pool)
+        else:
+            r = redis.Redis(**connection_kwargs)
         # Test connection
         r.ping()
         logger.info(f"Redis connection established: {config.REDIS_HOST}:{config.REDIS_PORT}")
@@ -53,129 +90,326 @@ def init_redis_connection() -> redis.Redis:
         logger.error(f"Failed to connect to Redis: {e}")
         raise
 
-def fetch_frame(camera_id: str, camera_url: str, worker_key: str, stop_event):
+def init_frame_ring(camera_id: str) -> Optional[FrameRingWriter]:
+    """Create the shared-memory frame ring when the transport uses it"""
+    if config.FRAME_TRANSPORT not in ('shm', 'both'):
+        return None
+    try:
+        slot_capacity = config.MAX_FRAME_WIDTH * config.MAX_FRAME_HEIGHT * 3
+        return FrameRingWriter(camera_id, config.FRAME_RING_SLOTS, slot_capacity, config.FRAME_RING_PREFIX)
+    except Exception as e:
+        logger.error(f"[{camera_id}] Failed to create frame ring, using Redis only: {e}")
+        return None
+
+def init_pooled_redis_connection() -> redis.Redis:
+    """Redis client shared by the capture threads of one ingest process"""
+    return init_redis_connection(max_connections=config.REDIS_MAX_CONNECTIONS)
+
+def open_capture(camera_url: str, camera_id: str, r: redis.Redis) -> CaptureBackend:
+    """Open the capture backend selected by the camera URL (or CAPTURE_BACKEND) with bounded timeouts"""
+    return create_backend(
+        camera_url, camera_id,
+        default=config.CAPTURE_BACKEND,
+        timeout=config.VIDEO_TIMEOUT,
+        probe_cache=StreamProbeCache(r, ttl=config.PROBE_CACHE_TTL),
+        probe_timeout=config.PROBE_TIMEOUT,
+        keyframes_only=config.PYAV_KEYFRAMES_ONLY,
+        replay_fps=config.REPLAY_FPS,
+    )
+
+def start_preview_passthrough(camera_id: str, camera_url: str, r: redis.Redis) -> Optional[PreviewPassthrough]:
+    """Start the compressed-domain preview remuxer for network cameras when enabled"""
+    backend_name, source_url = split_backend_url(camera_url)
+    if not config.PREVIEW_PASSTHROUGH or backend_name in ('file', 'synthetic'):
+        return None
+    # 獨立的停止事件：擷取迴圈因錯誤結束時也一併停止轉封裝
+    preview = PreviewPassthrough(
+        camera_id, source_url, r, threading.Event(),
+        max_fragments=config.PREVIEW_BUFFER_FRAGMENTS,
+        idle_seconds=config.PREVIEW_IDLE_SECONDS,
+        timeout=config.VIDEO_TIMEOUT,
+    )
+    preview.start()
+    return preview
+
+def archive_jpeg(frame, *encoded) -> Optional[bytes]:
+    """JPEG bytes for the segment archive, reusing a JPEG envelope already encoded for publishing"""
+    for data in encoded:
+        if data is not None:
+            header = read_header(data)
+            if header is not None and header.codec == 'jpeg':
+                return as_jpeg(data)
+    ok, buffer = cv2.imencode('.jpg', frame)
+    return buffer.tobytes() if ok else None
+
+def read_target_fps(r: redis.Redis, camera_id: str) -> float:
+    """Per-camera analysis FPS set by the camera controller (0 = every frame)"""
+    try:
+        value = r.get(f'camera_{camera_id}_target_fps')
+        return float(value) if value is not None else config.ANALYSIS_FPS
+    except (ValueError, redis.RedisError):
+        return config.ANALYSIS_FPS
+
+def fetch_frame(camera_id: str, camera_url: str, worker_key: str, stop_event,
+                r: Optional[redis.Redis] = None):
     """
     Enhanced frame fetching function with better error handling and monitoring
     """
-    # Setup per-process logging
+    # Setup per-camera logging
     process_logger = logging.getLogger(f"worker-{camera_id}")
     
-    # Initialize Redis connection for this process
-    try:
-        r = init_redis_connection()
-    except Exception as e:
-        process_logger.error(f"Failed to initialize Redis in worker {camera_id}: {e}")
-        return
+    # Use the shared client of the ingest process, or open a dedicated one
+    if r is None:
+        try:
+            r = init_redis_connection()
+        except Exception as e:
+            process_logger.error(f"Failed to initialize Redis in worker {camera_id}: {e}")
+            return
 
+    state = CameraStatePublisher(r, camera_id, {'url': camera_url},
+                                 history_maxlen=config.FRAME_HISTORY_MAXLEN,
+                                 history_seconds=config.FRAME_HISTORY_SECONDS)
+    ring = init_frame_ring(camera_id)
+    camera_metrics = CameraMetrics(camera_id)
+    fingerprint = None
+    if config.FREEZE_DETECTION:
+        fingerprint = FrameFingerprint(camera_id, config.DUPLICATE_DIFF_THRESHOLD,
+                                       config.FROZEN_AFTER_SECONDS)
+    preview = start_preview_passthrough(camera_id, camera_url, r)
+    archive = SegmentWriter(config.ARCHIVE_DIR, camera_id) if config.ARCHIVE_ENABLED else None
+    last_archive = 0.0
     cap = None
-    reconnect_interval = config.RECONNECT_INTERVAL
+    reader = None
+    reconnect = RECONNECT.camera(camera_id)
+    delivered = False
     frame_count = 0
     last_time = time()
+    last_cpu = thread_time()
+    pending_fps = None
+    target_fps = read_target_fps(r, camera_id)
+    last_target_check = last_time
+    last_publish = 0.0
     consecutive_failures = 0
     max_failures = config.MAX_CONSECUTIVE_FAILURES
 
+    def close_capture():
+        nonlocal cap, reader
+        if reader is not None:
+            reader.release()  # 讀取執行緒會自行釋放 cap
+        elif cap is not None:
+            cap.release()
+        cap = None
+        reader = None
+
     process_logger.info(f"Starting frame capture for camera {camera_id} from {camera_url}")
 
     while not stop_event.is_set():
         try:
             # Initialize or check video capture
-            if cap is None or not cap.isOpened():
+            if cap is None or (reader is None and not cap.isOpened()):
+                close_capture()
+                # 退避加抖動錯開重連時間；熔斷開路期間不嘗試連線
+                if not reconnect.wait(stop_event):
+                    break
                 process_logger.info(f"[{camera_id}] Connecting to camera...")
-                cap = cv2.VideoCapture(camera_url)
+                with RECONNECT.connect_slot(stop_event, r) as acquired:
+                    if not acquired:
+                        break
+                    cap = open_capture(camera_url, camera_id, r)
+                    opened = cap.isOpened()
+                state.set_static(backend=cap.name)
+                camera_metrics.connects.inc()
+                camera_metrics.reset_capture()
                 
-                if not cap.isOpened():
-                    consecutive_failures += 1
+                if not opened:
+                    camera_metrics.connect_failures.inc()
+                    camera_metrics.up.set(0)
+                    reconnect.failure()
+                    state.set_static(**reconnect.status_fields())
                     process_logger.warning(
-                        f"[{camera_id}] Failed to connect to camera. "
-                        f"Retrying in {reconnect_interval}s... "
-                        f"(Failure {consecutive_failures}/{max_failures})"
+                        f"[{camera_id}] Failed to connect to camera "
+                        f"(breaker {reconnect.breaker.state}, {reconnect.total_failures} failures)"
                     )
-                    
-                    if consecutive_failures >= max_failures:
-                        process_logger.error(f"[{camera_id}] Max failures reached. Stopping worker.")
-                        break
-                        
-                    r.set(f'camera_{camera_id}_status', 'False')
-                    sleep(reconnect_interval)
+                    state.publish_status(False)
                     continue
+                delivered = False
+
+                if config.CAPTURE_MODE == 'latest':
+                    reader = LatestFrameCapture(cap, camera_id, config.CAMERA_STOP_TIMEOUT)
 
-            ret, frame = cap.read()
+            grabbed = 1
+            captured_at = None
+            if reader is not None:
+                # 依發布節奏等待，期間讀取執行緒持續丟棄舊影格
+                if target_fps > 0:
+                    wait = last_publish + 1.0 / target_fps - time()
+                    if wait > 0 and stop_event.wait(wait):
+                        break
+                read_start = time()
+                frame, captured_at = reader.read(timeout=config.VIDEO_TIMEOUT)
+                ret = frame is not None
+                grabbed = reader.take_grabbed()
+            elif config.CAPTURE_MODE == 'grab':
+                # grab 模式只解封包、不轉換影像，等需要發布時才 retrieve
+                read_start = time()
+                ret = cap.grab()
+                frame = None
+            else:
+                read_start = time()
+                ret, frame = cap.read()
+            camera_metrics.read_seconds.observe(time() - read_start)
             if not ret:
                 consecutive_failures += 1
+                camera_metrics.read_failures.inc()
+                camera_metrics.up.set(0)
                 process_logger.warning(f"[{camera_id}] Failed to read frame. Retry {consecutive_failures}")
                 
-                if consecutive_failures >= max_failures:
+                if consecutive_failures >= max_failures or (reader is not None and reader.failed):
                     process_logger.error(f"[{camera_id}] Too many frame read failures. Reconnecting...")
-                    cap.release()
-                    cap = None
+                    camera_metrics.reconnects.inc()
+                    # 曾送出影像的連線斷線只加抖動；未送出任何影像則視為連線失敗
+                    if delivered:
+                        reconnect.disconnected()
+                    else:
+                        reconnect.failure()
+                    state.set_static(**reconnect.status_fields())
+                    close_capture()
                     consecutive_failures = 0
                     continue
                     
-                r.set(f'camera_{camera_id}_status', 'False')
-                sleep(1)
+                state.publish_status(False)
+                stop_event.wait(1)
                 continue
 
             # Reset failure counter on successful frame read
             consecutive_failures = 0
-            frame_count += 1
+            if not delivered:
+                delivered = True
+                reconnect.success()
+                state.set_static(**reconnect.status_fields())
+            frame_count += grabbed
+            camera_metrics.frames.inc(grabbed)
+            camera_metrics.up.set(1)
+            camera_metrics.sync_capture(cap.metrics)
             current_time = time()
+            if captured_at is None:
+                captured_at = current_time
             elapsed = current_time - last_time
 
-            # Calculate and update FPS
+            # Calculate FPS; it rides along with the next state update
             if elapsed >= 1.0:
-                fps = frame_count / elapsed
-                r.set(f'camera_{camera_id}_fps', f"{fps:.2f}")
-                process_logger.debug(f"[{camera_id}] Camera FPS: {fps:.2f}")
+                pending_fps = frame_count / elapsed
+                camera_metrics.fps.set(pending_fps)
+                # 各後端共用的解碼成本與丟棄計數，與 FPS 一同寫入狀態 hash；
+                # cpu_pct 為此攝影機執行緒的 CPU 使用率（不含解碼器自身的執行緒與子進程）
+                cpu_now = thread_time()
+                state.set_static(cpu_pct=f"{(cpu_now - last_cpu) / elapsed * 100:.1f}",
+                                 **cap.metrics.snapshot())
+                last_cpu = cpu_now
+                process_logger.debug(f"[{camera_id}] Camera FPS: {pending_fps:.2f}")
                 frame_count = 0
                 last_time = current_time
 
+            if current_time - last_target_check >= config.STATUS_UPDATE_INTERVAL:
+                target_fps = read_target_fps(r, camera_id)
+                last_target_check = current_time
+
+            archive_due = archive is not None and current_time - last_archive >= config.ARCHIVE_INTERVAL
+            publish_due = target_fps <= 0 or current_time - last_publish >= 1.0 / target_fps
+            if not (publish_due or archive_due):
+                continue
+
+            if frame is None:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    process_logger.debug(f"[{camera_id}] Failed to retrieve grabbed frame")
+                    continue
+
             timestamp = current_time + 8 * 3600  # 調整時區（如果需要）
             timestamp_str = strftime("%Y%m%d%H%M%S", localtime(timestamp))
 
-            if frame_count % 100 == 0:
-                folder_path = os.path.join('frames', str(camera_id), timestamp_str[:8], timestamp_str[8:10])
-                os.makedirs(folder_path, exist_ok=True)
-                file_name = f"{timestamp_str}.jpg"
-                file_path = os.path.join(folder_path, file_name)
-
-                # 刪除舊的檔案，只保留最新的一張截圖
-                old_file_path = r.get(f'camera_{camera_id}_latest_frame_path')
-                if old_file_path:
-                    old_file_path = old_file_path.decode('utf-8')
-                    if os.path.exists(old_file_path):
-                        os.remove(old_file_path)
-                        print(f"[{camera_id}] 刪除舊的畫面：{old_file_path}")
-
-                cv2.imwrite(file_path, frame)
-                print(f"[{camera_id}] 儲存畫面：{file_path}")
-                r.set(f'camera_{camera_id}_latest_frame_path', file_path)
-
-            _, buffer = cv2.imencode('.jpg', frame)
-            image_data = buffer.tobytes()
-            r.set(f'camera_{camera_id}_latest_frame', image_data)
-            r.set(f'camera_{camera_id}_status', 'True')
-            r.set(f'camera_{camera_id}_last_timestamp', timestamp_str)
-            r.set(f'camera_{camera_id}_url', camera_url)
+            image_data = history_image = None
+            if publish_due:
+                last_publish = current_time
+                if fingerprint is not None:
+                    duplicate = fingerprint.is_duplicate(frame, current_time)
+                    state.set_static(frozen=str(fingerprint.frozen))
+                    if duplicate:
+                        publish_due = False
+                        camera_metrics.duplicate.inc()
+                        # 靜止畫面仍是存活的攝影機，更新 ring 時間戳，避免讀取端視為寫入端已失效
+                        if ring is not None:
+                            ring.touch(current_time)
+                        # 重複畫面不重新編碼也不發布，seq/timestamp 停留在上一張；只在凍結狀態改變時寫入
+                        if state.has_pending_static:
+                            state.publish_status(True)
+
+            if publish_due:
+                seq = state.seq + 1
+                in_ring = False
+                if ring is not None:
+                    # 無法放入 ring 的影像（非 uint8 或超過 slot 容量）沿用 Redis 的序號
+                    ring_seq = ring.write(frame, current_time)
+                    if ring_seq is not None:
+                        seq, in_ring = ring_seq, True
+                    else:
+                        camera_metrics.ring_skipped.inc()
+
+                # shm 模式下同主機的消費者直接讀 ring，除非要寫歷史串流，否則不編碼；
+                # 未寫入 ring 的影像一律寫入 Redis，讀取端會退回讀取最新影像鍵；
+                # 最新影像與歷史串流使用相同編碼時只編碼一次
+                encode_start = time()
+                if not in_ring or config.FRAME_TRANSPORT == 'both':
+                    image_data = encode_frame(frame, config.FRAME_CODEC, seq, captured_at)
+                if state.history_enabled:
+                    history_image = image_data if image_data is not None and config.HISTORY_CODEC == config.FRAME_CODEC \
+                        else encode_frame(frame, config.HISTORY_CODEC, seq, captured_at)
+                renditions = encode_renditions(frame, RENDITION_SPECS, seq, captured_at) if RENDITION_SPECS else None
+                write_start = time()
+                camera_metrics.encode_seconds.observe(write_start - encode_start)
+                state.set_static(width=frame.shape[1], height=frame.shape[0])
+                frame_age_ms = (write_start - captured_at) * 1000
+                state.publish_frame(image_data, timestamp_str, fps=pending_fps, seq=seq,
+                                    frame_age_ms=frame_age_ms, renditions=renditions,
+                                    history_image=history_image, captured_at=captured_at)
+                published_at = time()
+                camera_metrics.redis_write_seconds.observe(published_at - write_start)
+                camera_metrics.frame_age_seconds.observe(published_at - captured_at)
+                camera_metrics.publish_seconds.observe(published_at - current_time)
+                camera_metrics.published.inc()
+                pending_fps = None
+
+            if archive_due:
+                # 追加到每小時一個的分段檔，不再逐張建立與刪除檔案；
+                # 同一輪已編碼 JPEG 發布時直接沿用
+                last_archive = current_time
+                archive_start = time()
+                jpeg = archive_jpeg(frame, image_data, history_image)
+                if jpeg:
+                    archive.append(jpeg, captured_at)
+                camera_metrics.archive_seconds.observe(time() - archive_start)
 
         except Exception as e:
             print(f"[{camera_id}] 發生例外狀況：{e}")
-            r.set(f'camera_{camera_id}_status', 'False')
+            state.publish_status(False)
             break  # 發生例外時退出迴圈
 
-    cap.release()
+    close_capture()
+    camera_metrics.close()
+    if archive is not None:
+        archive.close()
+    if preview is not None:
+        preview.stop_event.set()
+    if ring is not None:
+        ring.close()
 
-def monitor_cameras(worker_key, camera_urls):
-    processes = []
+def parse_camera_urls(camera_urls) -> Dict[str, str]:
+    """Parse worker_N_urls members ('id|url') into {camera_id: camera_url}"""
+    cameras = {}
     for url in camera_urls:
-        url_parts = url.decode('utf-8').split('|')
-        camera_id = url_parts[0]
-        camera_url = url_parts[1]
-        print(f"啟動攝影機進程，ID：{camera_id}，URL：{camera_url}")
-        stop_event = multiprocessing.Event()
-        process = multiprocessing.Process(target=fetch_frame, args=(camera_id, camera_url, worker_key, stop_event))
-        process.start()
-        processes.append((process, stop_event))
-    return processes
+        camera_id, camera_url = url.decode('utf-8').split('|', 1)
+        cameras[camera_id] = camera_url
+    return cameras
 
 def main():
     worker_id = os.getenv('WORKER_ID')
@@ -189,27 +423,38 @@ def main():
     pubsub = r.pubsub()
     pubsub.subscribe([f'{worker_key}_update'])
 
-    current_urls = set(r.smembers(worker_key))
-    processes = monitor_cameras(worker_key, current_urls)
+    supervisor = IngestSupervisor(
+        worker_key,
+        target=fetch_frame,
+        redis_factory=init_pooled_redis_connection,
+        process_count=config.get_ingest_process_count(),
+        cameras_per_process=config.MAX_CONCURRENT_CAMERAS,
+        stop_timeout=config.CAMERA_STOP_TIMEOUT,
+        metrics_interval=config.METRICS_PUSH_INTERVAL if config.METRICS_ENABLED else 0
+    )
+    supervisor.start()
+    if config.METRICS_ENABLED:
+        metrics.serve(config.METRICS_PORT, supervisor.collect_metrics)
+    supervisor.reconcile(parse_camera_urls(r.smembers(worker_key)))
+    # 向攝影機控制器註冊並定期心跳，控制器依各工作器容量分配攝影機
+    heartbeat = WorkerHeartbeat(r, worker_id, supervisor.capacity,
+                                config.WORKER_HEARTBEAT_INTERVAL, config.WORKER_HEARTBEAT_TTL)
 
     try:
-        for message in pubsub.listen():
-            if message['type'] == 'message':
-                new_urls = set(r.smembers(worker_key))
-                if new_urls != current_urls:
-                    print("檢測到攝影機列表更新，重新啟動進程")
-                    for _, stop_event in processes:
-                        stop_event.set()
-                    for process, _ in processes:
-                        process.join()
-                    processes = monitor_cameras(worker_key, new_urls)
-                    current_urls = new_urls
+        while True:
+            heartbeat.maybe_beat()
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            supervisor.check_processes()
+            supervisor.collect_metrics()
+            if message and message['type'] == 'message':
+                # 只處理新增、移除或 URL 變更的攝影機，其餘串流不受影響
+                summary = supervisor.reconcile(parse_camera_urls(r.smembers(worker_key)))
+                if any(summary.values()):
+                    print(f"檢測到攝影機列表更新：{summary}")
     finally:
+        heartbeat.unregister()
         pubsub.close()
-        for _, stop_event in processes:
-            stop_event.set()
-        for process, _ in processes:
-            process.join()
+        supervisor.stop()
 
 if __name__ == "__main__":
     main()
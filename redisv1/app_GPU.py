@@ -1,142 +1,55 @@
 import os
 import redis
-import cv2
 import threading
-import subprocess
-import numpy as np
 import time
-from time import sleep, localtime, strftime
+from time import localtime, strftime
+
+from config import RedisWorkerConfig as Config
+from camera_state import CameraStatePublisher
+from capture_backends import create_backend, split_backend_url
+from stream_probe import StreamProbeCache
+from frame_codec import encode_frame
+from reconnect_scheduler import ReconnectScheduler
+from worker_heartbeat import WorkerHeartbeat, worker_connect_slots_key
 
 # 初始化 Redis 連線
 redis_host = 'redis'
 redis_port = 6379
 r = redis.Redis(host=redis_host, port=redis_port, db=0)
 
+config = Config()
+probe_cache = StreamProbeCache(r, ttl=config.PROBE_CACHE_TTL)
+# 所有攝影機線程共用的重連排程（退避、連線數上限、熔斷）；每台攝影機的狀態跨線程重啟保留
+reconnect_scheduler = ReconnectScheduler(
+    base_delay=config.RECONNECT_BASE_DELAY,
+    max_delay=config.RECONNECT_INTERVAL,
+    max_concurrent_connects=config.MAX_CONCURRENT_CONNECTS,
+    failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+    open_seconds=config.BREAKER_OPEN_SECONDS,
+    max_open_seconds=config.BREAKER_MAX_OPEN_SECONDS,
+    connect_key=worker_connect_slots_key(config.WORKER_ID),
+    connect_slot_ttl=config.CONNECT_SLOT_TTL,
+)
+camera_reconnects = {}
+
 camera_threads = {}  # 用來存放 camera_id 與對應的執行控制
 camera_threads_lock = threading.Lock()  # 用於保護 camera_threads 的線程鎖
 
-def get_camera_resolution_ffmpeg(camera_id, camera_url, resolution_event, resolution_data, stop_event, max_retries=3):
-    """
-    使用 FFmpeg 取得攝影機的解析度，在獲取後通知主線程。
-    """
-    retry_count = 0
-    while retry_count < max_retries and not stop_event.is_set():
-        try:
-            # FFmpeg 命令，用來取得解析度
-            ffmpeg_cmd = [
-                'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height', '-of', 'csv=p=0',
-                camera_url
-            ]
-            # 執行命令並獲取解析度輸出
-            result = subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            resolution = result.stdout.strip()
-            
-            if resolution:
-                width, height = map(int, resolution.split(','))
-                print(f"[{camera_id}] 解析度檢測：{width}x{height} for {camera_url}")
-                resolution_data['width'] = width
-                resolution_data['height'] = height
-                resolution_event.set()  # 通知解析度已取得
-                return
-            else:
-                print(f"[{camera_id}] 解析度檢測失敗，無法取得輸出：重試 {retry_count + 1}/{max_retries}")
-        except Exception as e:
-            print(f"[{camera_id}] 解析度取得失敗 ({retry_count + 1}/{max_retries}): {e}")
-        
-        retry_count += 1
-        sleep(2)  # 每次重試間隔
-        
-    # 重試次數達到上限，設定狀態為 False
-    print(f"[{camera_id}] 無法取得攝影機解析度，請檢查連接設定。")
-    r.set(f'camera_{camera_id}_status', 'False')
-    resolution_event.set()  # 即使失敗也需要設定事件，避免主線程一直等待
-
-def fetch_frame(camera_id, camera_url, stop_event, width, height, max_retries=3):
+def fetch_frame(camera_id, camera_url, stop_event, max_retries=3):
     """
-    使用 FFmpeg 獲取影像幀，若達到最大重試次數則切換到 OpenCV。
+    使用 FFmpeg 管線後端獲取影像幀，若達到最大重試次數則切換到 OpenCV 後端。
+    URL 帶有 "<backend>+" 前綴時固定使用該後端，不做切換。
+
+    解析度優先取自 Redis 的探測快取；沒有快取時直接從這個 FFmpeg 進程的
+    串流資訊讀取，不再另外啟動 ffprobe。
     """
     try:
-        retry_count = 0
-        frame_size = width * height * 3  # 根據像素格式調整
-
-        while not stop_event.is_set():
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-rtsp_transport', 'tcp',
-                '-loglevel', 'error',
-                'timeout','1000000',
-                '-flags','low_delay',
-                '-fflags','nobuffer',
-                '-i', camera_url,
-                '-vf', 'fps=1',
-                '-f', 'rawvideo',
-                '-pix_fmt', 'bgr24',  # 使用 'bgr24' 格式
-                'pipe:'
-            ]
-
-            try:
-                process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print(f"[{camera_id}] [GPU] 嘗試使用 FFmpeg 連接到攝影機。")
-                print(f"[{camera_id}] [GPU] 成功連接")
-            except Exception as e:
-                print(f"[{camera_id}] [GPU] 無法啟動 FFmpeg 進程: {e}")
-                retry_count += 1
-                sleep(2)
-                continue
-
-            stderr_thread = threading.Thread(target=read_stderr, args=(camera_id, process.stderr))
-            
-            stderr_thread.start()
-
-            while not stop_event.is_set():
-                try:
-                    raw_frame = process.stdout.read(frame_size)
-                    if not raw_frame:
-                        print(f"[{camera_id}] [GPU] 無法從 FFmpeg 讀取影像幀，可能連線中斷。")
-                        retry_count += 1
-                        if retry_count >= max_retries:
-                            print(f"[{camera_id}] [GPU] 已達到最大重試次數。切換到使用 OpenCV。")
-                            process.terminate()
-                            process.wait()
-                            # 呼叫 OpenCV 方法
-                            fetch_frame_opencv(camera_id, camera_url, stop_event)
-                            return
-                        break
-
-                    retry_count = 0  # 成功讀取影像後重置重試次數
-                    
-                    frame = np.frombuffer(raw_frame, np.uint8).reshape((height, width, 3))
-                    
-                    # 保存最新影像
-                    current_time = time.time()
-                    timestamp_str = strftime("%Y%m%d%H%M%S", localtime(current_time + 8 * 3600))
-                    _, buffer = cv2.imencode('.jpg', frame)
-                    image_data = buffer.tobytes()
-                    r.set(f'camera_{camera_id}_latest_frame', image_data)
-                    r.set(f'camera_{camera_id}_status', 'True')
-                    r.set(f'camera_{camera_id}_last_timestamp', timestamp_str)
-                    r.set(f'camera_{camera_id}_url', camera_url)
-
-                except Exception as e:
-                    print(f"[{camera_id}] [GPU] 出現錯誤: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    retry_count += 1
-                    if retry_count >= max_retries:
-                        print(f"[{camera_id}] [GPU] 已達到最大重試次數。切換到使用 OpenCV。")
-                        process.terminate()
-                        process.wait()
-                        # 呼叫 OpenCV 方法
-                        fetch_frame_opencv(camera_id, camera_url, stop_event)
-                        return
-                    break
-
-            if process:
-                process.terminate()
-                process.wait()
-                print(f"[{camera_id}] [GPU] 停止獲取影像幀。")
-
+        # default=None：只有未指定前綴的 URL 才會得到 None，明確指定 ffmpeg+ 時不切換
+        backend_name, _ = split_backend_url(camera_url, default=None)
+        run_capture(camera_id, camera_url, stop_event, 'ffmpeg', max_retries)
+        if backend_name is None and not stop_event.is_set():
+            print(f"[{camera_id}] [GPU] 已達到最大重試次數。切換到使用 OpenCV。")
+            fetch_frame_opencv(camera_id, camera_url, stop_event)
     except Exception as e:
         print(f"[{camera_id}] [GPU] 未處理的異常: {e}")
         import traceback
@@ -145,87 +58,115 @@ def fetch_frame(camera_id, camera_url, stop_event, width, height, max_retries=3)
 
 def fetch_frame_opencv(camera_id, camera_url, stop_event):
     """
-    使用 OpenCV 直接從攝影機讀取影像。
+    使用 OpenCV 後端直接從攝影機讀取影像。
     """
-    print(f"[{camera_id}] [CPU] 使用 OpenCV 連接到攝影機。")
-    cap = cv2.VideoCapture(camera_url)
-
-    if not cap.isOpened():
-        print(f"[{camera_id}] [CPU] 無法使用 OpenCV 打開攝影機。")
-        r.set(f'camera_{camera_id}_status', 'False')
-        return
-
-    while not stop_event.is_set():
-        ret, frame = cap.read()
-        if not ret:
-            print(f"[{camera_id}] [CPU] 使用 OpenCV 讀取影像失敗，嘗試重新連接。")
-            cap.release()
-            time.sleep(2)
-            cap = cv2.VideoCapture(camera_url)
-            if not cap.isOpened():
-                print(f"[{camera_id}] [CPU] 無法重新連接攝影機。")
-                r.set(f'camera_{camera_id}_status', 'False')
-                stop_event.set()
-                break
-            continue
-
-        # 保存最新影像
-        current_time = time.time()
-        timestamp_str = strftime("%Y%m%d%H%M%S", localtime(current_time + 8 * 3600))
-        _, buffer = cv2.imencode('.jpg', frame)
-        image_data = buffer.tobytes()
-        r.set(f'camera_{camera_id}_latest_frame', image_data)
-        r.set(f'camera_{camera_id}_status', 'True')
-        r.set(f'camera_{camera_id}_last_timestamp', timestamp_str)
-        r.set(f'camera_{camera_id}_url', camera_url)
-
-    cap.release()
+    _, url = split_backend_url(camera_url)
+    run_capture(camera_id, url, stop_event, 'opencv', max_retries=1)
     print(f"[{camera_id}] [CPU] 停止使用 OpenCV 獲取影像。")
 
-def read_stderr(camera_id, stderr_pipe):
+def run_capture(camera_id, camera_url, stop_event, default_backend, max_retries):
     """
-    持續讀取 FFmpeg 的錯誤輸出並打印。
+    以指定的擷取後端持續讀取並發布影像；連續 max_retries 次連線或讀取失敗時返回。
     """
-    for line in iter(stderr_pipe.readline, b''):
-        print(f"[{camera_id}] [GPU] FFmpeg 錯誤輸出：{line.decode('utf-8').strip()}")
+    state = CameraStatePublisher(r, camera_id, {'url': camera_url},
+                                 history_maxlen=config.FRAME_HISTORY_MAXLEN,
+                                 history_seconds=config.FRAME_HISTORY_SECONDS)
+    reconnect = camera_reconnects.setdefault(camera_id, reconnect_scheduler.camera(camera_id))
+    retry_count = 0
+
+    while not stop_event.is_set() and retry_count < max_retries:
+        # 以退避加抖動取代固定間隔重試；熔斷開路期間不連線
+        if not reconnect.wait(stop_event):
+            break
+        with reconnect_scheduler.connect_slot(stop_event, r) as acquired:
+            if not acquired:
+                break
+            cap = create_backend(
+                camera_url, camera_id,
+                default=default_backend,
+                timeout=config.VIDEO_TIMEOUT,
+                probe_cache=probe_cache,
+                probe_timeout=config.PROBE_TIMEOUT,
+                output_fps=1,
+                keyframes_only=config.PYAV_KEYFRAMES_ONLY,
+                replay_fps=config.REPLAY_FPS,
+            )
+            opened = cap.isOpened()
+        if not opened:
+            print(f"[{camera_id}] [{cap.name}] 無法連接到攝影機（熔斷狀態 {reconnect.breaker.state}）。")
+            cap.release()
+            reconnect.failure()
+            state.set_static(**reconnect.status_fields())
+            state.publish_status(False)
+            retry_count += 1
+            continue
+
+        print(f"[{camera_id}] [{cap.name}] 成功連接到攝影機。")
+        state.set_static(backend=cap.name)
+        last_metrics = time.time()
+        delivered = False
+
+        while not stop_event.is_set():
+            try:
+                ret, frame = cap.read()
+                if not ret:
+                    print(f"[{camera_id}] [{cap.name}] 無法讀取影像幀，可能連線中斷。")
+                    if delivered:
+                        reconnect.disconnected()
+                    else:
+                        reconnect.failure()
+                    state.set_static(**reconnect.status_fields())
+                    state.publish_status(False)
+                    retry_count += 1
+                    break
+
+                retry_count = 0  # 成功讀取影像後重置重試次數
+                if not delivered:
+                    delivered = True
+                    reconnect.success()
+                    state.set_static(**reconnect.status_fields())
+
+                # 保存最新影像
+                current_time = time.time()
+                if current_time - last_metrics >= 1.0:
+                    state.set_static(**cap.metrics.snapshot())
+                    last_metrics = current_time
+                timestamp_str = strftime("%Y%m%d%H%M%S", localtime(current_time + 8 * 3600))
+                image_data = encode_frame(frame, config.FRAME_CODEC, state.seq + 1, current_time)
+                history_image = image_data if config.HISTORY_CODEC == config.FRAME_CODEC \
+                    else encode_frame(frame, config.HISTORY_CODEC, state.seq + 1, current_time)
+                state.publish_frame(image_data, timestamp_str, history_image=history_image)
+
+            except Exception as e:
+                print(f"[{camera_id}] [{cap.name}] 出現錯誤: {e}")
+                import traceback
+                traceback.print_exc()
+                reconnect.disconnected()
+                retry_count += 1
+                break
+
+        cap.release()
+        print(f"[{camera_id}] [{cap.name}] 停止獲取影像幀。")
 
 def get_resolution_and_start_fetching(camera_id, camera_url, stop_event):
     """
-    獲取攝影機解析度並開始獲取影像。
+    從探測快取取得攝影機解析度並開始獲取影像。
     """
     try:
         # 如果 stop_event 已被設置，則清除它
         if stop_event.is_set():
             stop_event.clear()
-        resolution_event = threading.Event()
-        resolution_data = {}
-        # 啟動取得解析度的線程
-        resolution_thread = threading.Thread(
-            target=get_camera_resolution_ffmpeg,
-            args=(camera_id, camera_url, resolution_event, resolution_data, stop_event)
+        # 解析度由 FFmpeg 後端自探測快取或串流資訊取得
+        fetch_thread = threading.Thread(
+            target=fetch_frame,
+            args=(camera_id, camera_url, stop_event)
         )
-        resolution_thread.start()
-        # 等待解析度取得或停止事件
-        while not resolution_event.is_set() and not stop_event.is_set():
-            time.sleep(0.1)
-        # 如果成功獲取解析度，啟動影像獲取線程
-        if 'width' in resolution_data and 'height' in resolution_data:
-            width = resolution_data['width']
-            height = resolution_data['height']
-            fetch_thread = threading.Thread(
-                target=fetch_frame,
-                args=(camera_id, camera_url, stop_event, width, height)
-            )
-            fetch_thread.start()
-            with camera_threads_lock:
-                camera_threads[camera_id]['fetch_thread'] = fetch_thread
-            fetch_thread.join()
-        else:
-            print(f"[{camera_id}] 無法取得解析度，改用 OpenCV 直接連接。")
-            # 呼叫 OpenCV 方法
-            fetch_frame_opencv(camera_id, camera_url, stop_event)
+        fetch_thread.start()
+        with camera_threads_lock:
+            camera_threads[camera_id]['fetch_thread'] = fetch_thread
+        fetch_thread.join()
     except Exception as e:
-        print(f"[{camera_id}] 在取得解析度時發生錯誤: {e}")
+        print(f"[{camera_id}] 在啟動影像獲取時發生錯誤: {e}")
         import traceback
         traceback.print_exc()
         # 呼叫 OpenCV 方法
@@ -315,8 +256,11 @@ def monitor_cameras():
     manage_camera_threads(camera_data)
 
     last_camera_data = camera_data.copy()  # 記錄最後一次的攝影機清單
+    heartbeat = WorkerHeartbeat(r, worker_id, config.MAX_CONCURRENT_CAMERAS,
+                                config.WORKER_HEARTBEAT_INTERVAL, config.WORKER_HEARTBEAT_TTL)
 
     while True:
+        heartbeat.maybe_beat()
         # 設置消息超時，避免阻塞主程序
         message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
 
@@ -0,0 +1,162 @@
+"""
+Camera State Publisher
+Collapses the per-frame Redis writes of an ingest worker into one pipelined
+transaction: the frame key plus a single camera:{id} hash, and optionally an
+entry in the camera's short-term frame history stream.
+
+Hash fields:
+    status     'True' / 'False'
+    timestamp  last frame time, %Y%m%d%H%M%S
+    seq        frame sequence number
+    fps        measured capture FPS (written when a new sample is available)
+    frame_age_ms  capture-to-publish age of the published frame
+    url        stream URL (static, written only when it changes)
+    backend    capture backend name (static)
+    decode_ms, dropped  capture cost per delivered frame and dropped-frame count (static)
+    cpu_pct    CPU usage of the camera's capture thread (static)
+    frozen     'True' while the stream keeps repeating the same picture (static)
+    breaker    reconnect circuit breaker state: closed / open / half_open (static)
+    retry_at   epoch seconds of the next attempt while the breaker is open, else 0 (static)
+    connect_failures  failed connects since the worker started (static)
+    worker     id of the ingest worker the controller assigned, empty while orphaned
+               (written by camera_ctrler/camera_manager.py)
+    width, height    full frame size (static)
+    renditions       comma-separated rendition names (static)
+    {name}_transform "scale_x,scale_y,pad_x,pad_y" of each rendition
+
+History stream camera_{id}_frames (entry IDs are the ms publish time):
+    seq        frame sequence number
+    ts         capture time (epoch seconds)
+    timestamp  %Y%m%d%H%M%S
+    frame      encoded frame (frame_codec envelope)
+
+Channel camera_{id}_frame_ready receives the seq of every published frame, in
+the same transaction, so the camera controller's stream broadcasters wake on
+new frames instead of polling.
+"""
+
+import logging
+from time import time
+from typing import Optional, Dict, Any, Tuple
+
+from renditions import rendition_key
+
+logger = logging.getLogger(__name__)
+
+
+def camera_state_key(camera_id) -> str:
+    """Redis hash holding the live state of a camera."""
+    return f'camera:{camera_id}'
+
+
+def camera_frame_key(camera_id) -> str:
+    """Redis key holding the latest encoded frame of a camera."""
+    return f'camera_{camera_id}_latest_frame'
+
+
+def camera_frame_channel(camera_id) -> str:
+    """Pub/Sub channel notified after each new frame of a camera."""
+    return f'camera_{camera_id}_frame_ready'
+
+
+def camera_history_key(camera_id) -> str:
+    """Redis stream holding the short-term frame history of a camera."""
+    return f'camera_{camera_id}_frames'
+
+
+class CameraStatePublisher:
+    """Per-camera writer that batches frame and state updates."""
+
+    def __init__(self, redis_client, camera_id, static_fields: Optional[Dict[str, Any]] = None,
+                 history_maxlen: int = 0, history_seconds: float = 0):
+        self.r = redis_client
+        self.camera_id = camera_id
+        self.state_key = camera_state_key(camera_id)
+        self.frame_key = camera_frame_key(camera_id)
+        self.history_key = camera_history_key(camera_id)
+        self.frame_channel = camera_frame_channel(camera_id)
+        # 歷史串流的保留上限：筆數與時間（秒），皆為 0 表示停用
+        self.history_maxlen = history_maxlen
+        self.history_seconds = history_seconds
+        self.seq = 0
+        self._static = dict(static_fields or {})
+        # 尚未寫入 Redis 的靜態欄位，只在變更時才帶上
+        self._pending_static = dict(self._static)
+
+    @property
+    def history_enabled(self) -> bool:
+        return self.history_maxlen > 0 or self.history_seconds > 0
+
+    @property
+    def has_pending_static(self) -> bool:
+        return bool(self._pending_static)
+
+    def set_static(self, **fields):
+        """Update static fields; only changed values are written on the next publish."""
+        for name, value in fields.items():
+            if self._static.get(name) != value:
+                self._static[name] = value
+                self._pending_static[name] = value
+
+    def publish_frame(self, image_data: Optional[bytes], timestamp_str: str,
+                      fps: Optional[float] = None, seq: Optional[int] = None,
+                      frame_age_ms: Optional[float] = None,
+                      renditions: Optional[Dict[str, Tuple[bytes, str]]] = None,
+                      history_image: Optional[bytes] = None,
+                      captured_at: Optional[float] = None) -> int:
+        """Write the frame (if any), its renditions, history entry and the state hash in one round trip."""
+        self.seq = seq if seq is not None else self.seq + 1
+        mapping = {
+            'status': 'True',
+            'timestamp': timestamp_str,
+            'seq': self.seq,
+        }
+        if fps is not None:
+            mapping['fps'] = f"{fps:.2f}"
+        if frame_age_ms is not None:
+            mapping['frame_age_ms'] = f"{frame_age_ms:.1f}"
+        if renditions:
+            self.set_static(renditions=','.join(renditions))
+            for name, (_, transform) in renditions.items():
+                mapping[f'{name}_transform'] = transform
+        mapping.update(self._pending_static)
+
+        pipe = self.r.pipeline(transaction=True)
+        if image_data is not None:
+            pipe.set(self.frame_key, image_data)
+        for name, (data, _) in (renditions or {}).items():
+            pipe.set(rendition_key(self.camera_id, name), data)
+        pipe.hset(self.state_key, mapping=mapping)
+        if history_image is not None and self.history_enabled:
+            self._append_history(pipe, history_image, timestamp_str, captured_at)
+        if image_data is not None or renditions:
+            pipe.publish(self.frame_channel, self.seq)
+        pipe.execute()
+
+        self._pending_static.clear()
+        return self.seq
+
+    def _append_history(self, pipe, image_data: bytes, timestamp_str: str,
+                        captured_at: Optional[float]):
+        now = time()
+        fields = {
+            'seq': self.seq,
+            'ts': f"{captured_at if captured_at is not None else now:.3f}",
+            'timestamp': timestamp_str,
+            'frame': image_data,
+        }
+        # 近似修剪（~）讓 Redis 以整個 macro node 為單位刪除，成本遠低於精確修剪
+        if self.history_maxlen > 0:
+            pipe.xadd(self.history_key, fields, maxlen=self.history_maxlen, approximate=True)
+        else:
+            pipe.xadd(self.history_key, fields)
+        if self.history_seconds > 0:
+            min_id = int((now - self.history_seconds) * 1000)
+            pipe.xtrim(self.history_key, minid=min_id, approximate=True)
+
+    def publish_status(self, alive: bool):
+        """Write the status field alone (connect failures, read errors)."""
+        mapping = {'status': 'True' if alive else 'False'}
+        mapping.update(self._pending_static)
+        self.r.hset(self.state_key, mapping=mapping)
+        self._pending_static.clear()
@@ -0,0 +1,497 @@
+"""
+Capture Backends
+One capture interface over the ways a worker can pull frames, so the ingest
+loop does not care where pixels come from and every backend reports the same
+cost metrics.
+
+Backends expose the cv2.VideoCapture subset the workers already use
+(isOpened, grab, retrieve, read, release) and are looked up by name:
+
+    opencv   cv2.VideoCapture (CAP_FFMPEG) with bounded open/read timeouts
+    ffmpeg   ffmpeg subprocess writing bgr24 rawvideo to a pipe
+    pyav     PyAV demux/decode with threaded decoding (optional dependency)
+    file     loops a local video file or a directory of images at a fixed FPS
+    synthetic  generated moving-object frames or a looped file (load testing)
+
+A camera selects its backend with a "<name>+" URL prefix
+(e.g. pyav+rtsp://host/stream); unprefixed URLs use the worker default,
+file:// URLs always replay and synthetic:// URLs are always generated.
+"""
+
+import glob
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from pipe_frame_reader import PipeFrameReader
+from stream_probe import StreamInfoParser
+from synthetic_source import SyntheticFrameGenerator, parse_synthetic_url
+
+try:
+    import av
+except ImportError:  # PyAV 為選用套件
+    av = None
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_BACKENDS: Dict[str, Callable] = {}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def register_backend(name: str):
+    """Class decorator adding a backend to the registry."""
+    def decorator(cls):
+        cls.name = name
+        CAPTURE_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def split_backend_url(camera_url: str, default: str = 'opencv') -> Tuple[str, str]:
+    """Split an optional '<backend>+' prefix off a camera URL."""
+    name, sep, rest = camera_url.partition('+')
+    if sep and name in CAPTURE_BACKENDS:
+        return name, rest
+    if camera_url.startswith('file://'):
+        return 'file', camera_url[len('file://'):]
+    if camera_url.startswith('synthetic://'):
+        return 'synthetic', camera_url
+    return default, camera_url
+
+
+def create_backend(camera_url: str, camera_id, default: str = 'opencv', **options) -> 'CaptureBackend':
+    """Instantiate the backend selected by the URL (or the default) and open it."""
+    name, url = split_backend_url(camera_url, default)
+    backend_cls = CAPTURE_BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Unknown capture backend '{name}'")
+    return backend_cls(url, camera_id, **options)
+
+
+def _process_cpu_seconds(pid: int) -> float:
+    """user+system CPU time of a child process from /proc (0 when unavailable)."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+class FramePacer:
+    """Sleeps so that successive calls are spaced at a fixed rate, without drift."""
+
+    def __init__(self, fps: float):
+        self.interval = 1.0 / fps
+        self._next_due = time.monotonic()
+
+    def wait(self):
+        wait = self._next_due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        # 落後超過一格時不追趕，避免恢復後連續爆發
+        self._next_due = max(self._next_due + self.interval, time.monotonic() - self.interval)
+
+
+class CaptureMetrics:
+    """
+    Counters shared by all backends.
+
+    decode time is CPU time (this thread plus any decoder subprocess) spent
+    obtaining frames, so backends can be compared per delivered frame
+    regardless of how long they wait on the network.
+    """
+
+    def __init__(self):
+        self.grabbed = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.decode_seconds = 0.0
+        self._window_delivered = 0
+        self._window_decode = 0.0
+
+    def add_decode(self, seconds: float):
+        self.decode_seconds += seconds
+        self._window_decode += seconds
+
+    def deliver(self):
+        self.delivered += 1
+        self._window_delivered += 1
+
+    def snapshot(self) -> Dict[str, str]:
+        """Metrics for the camera state hash; decode_ms covers frames since the last call."""
+        decode_ms = self._window_decode * 1000 / self._window_delivered if self._window_delivered else 0.0
+        self._window_delivered = 0
+        self._window_decode = 0.0
+        return {'decode_ms': f"{decode_ms:.2f}", 'dropped': str(self.dropped)}
+
+
+class CaptureBackend:
+    """Base class; subclasses implement _grab() and _retrieve()."""
+
+    name = 'base'
+
+    def __init__(self, url: str, camera_id, **options):
+        self.url = url
+        self.camera_id = camera_id
+        self.metrics = CaptureMetrics()
+
+    def isOpened(self) -> bool:
+        raise NotImplementedError
+
+    def _grab(self) -> bool:
+        raise NotImplementedError
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def _cpu_time(self) -> float:
+        return time.thread_time()
+
+    def grab(self) -> bool:
+        start = self._cpu_time()
+        ok = self._grab()
+        self.metrics.add_decode(self._cpu_time() - start)
+        if ok:
+            self.metrics.grabbed += 1
+        return ok
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Return the last grabbed frame. The caller owns the array: backends must
+        not reuse it for later grab() calls, because LatestFrameCapture keeps
+        grabbing while the publisher encodes the frame it handed out.
+        """
+        start = self._cpu_time()
+        frame = self._retrieve()
+        self.metrics.add_decode(self._cpu_time() - start)
+        if frame is None:
+            self.metrics.dropped += 1
+            return False, None
+        self.metrics.deliver()
+        return True, frame
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+
+@register_backend('opencv')
+class OpenCVBackend(CaptureBackend):
+    """cv2.VideoCapture; grab() demuxes/decodes, retrieve() colour-converts."""
+
+    def __init__(self, url: str, camera_id, timeout: float = 10, **options):
+        super().__init__(url, camera_id)
+        timeout_ms = timeout * 1000
+        # 限制開啟與讀取逾時，避免卡住的串流佔住執行緒
+        self.cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+        ])
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def _grab(self) -> bool:
+        return self.cap.grab()
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        ok, frame = self.cap.retrieve()
+        return frame if ok else None
+
+    def release(self):
+        self.cap.release()
+
+
+@register_backend('ffmpeg')
+class FFmpegPipeBackend(CaptureBackend):
+    """
+    ffmpeg subprocess decoding to bgr24 rawvideo on stdout.
+
+    The frame size comes from the probe cache, or from ffmpeg's own stream
+    banner on a cache miss; a size change mid-stream invalidates the cache and
+    ends the capture so the caller reconnects.
+    """
+
+    def __init__(self, url: str, camera_id, timeout: float = 10, probe_cache=None,
+                 probe_timeout: float = 10, output_fps: float = 0, **options):
+        super().__init__(url, camera_id)
+        self.probe_cache = probe_cache
+        self.process = None
+        self.reader: Optional[PipeFrameReader] = None
+        self.size = None
+        self._frame = None
+        self._child_cpu = 0.0
+
+        cmd = [
+            'ffmpeg',
+            '-hide_banner', '-nostats',
+            '-rtsp_transport', 'tcp',
+            '-loglevel', 'info',  # info 等級才會輸出串流資訊（解析度、編碼、fps）
+            '-timeout', str(int(timeout * 1000000)),
+            '-flags', 'low_delay',
+            '-fflags', 'nobuffer',
+            '-i', url,
+        ]
+        if output_fps > 0:
+            cmd += ['-vf', f'fps={output_fps}']
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:']
+
+        try:
+            # bufsize=0：stdout 為 raw pipe，readinto 直接寫入預先配置的緩衝區
+            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except Exception as e:
+            logger.error(f"[{camera_id}] Failed to start ffmpeg: {e}")
+            return
+
+        self.stream_info = StreamInfoParser()
+        self._stderr_thread = threading.Thread(target=self._read_stderr, name=f"ffmpeg-{camera_id}",
+                                               daemon=True)
+        self._stderr_thread.start()
+
+        probe = probe_cache.get(url) if probe_cache is not None else None
+        if probe is None:
+            # 沒有快取：等待 ffmpeg 印出輸出串流資訊（進程提早結束則不再等待）
+            deadline = time.time() + probe_timeout
+            while not self.stream_info.ready.wait(timeout=0.2):
+                if self.process.poll() is not None or time.time() >= deadline:
+                    break
+            probe = self.stream_info.as_probe()
+            if probe is None:
+                logger.warning(f"[{camera_id}] ffmpeg did not report a stream size")
+                self.release()
+                return
+            if probe_cache is not None:
+                probe_cache.put(url, probe)
+
+        self.size = (probe['width'], probe['height'])
+        self.reader = PipeFrameReader(self.process.stdout, *self.size, camera_id=camera_id)
+
+    def _read_stderr(self):
+        for line in iter(self.process.stderr.readline, b''):
+            text = line.decode('utf-8', errors='replace').strip()
+            self.stream_info.feed(text)
+            logger.debug(f"[{self.camera_id}] ffmpeg: {text}")
+
+    def _cpu_time(self) -> float:
+        # 解碼在子進程中進行，一併計入 ffmpeg 的 CPU 時間
+        if self.process is not None:
+            self._child_cpu = _process_cpu_seconds(self.process.pid) or self._child_cpu
+        return time.thread_time() + self._child_cpu
+
+    def isOpened(self) -> bool:
+        return self.reader is not None and self.process.poll() is None
+
+    def _grab(self) -> bool:
+        if self.reader is None:
+            return False
+        dropped = self.reader.short_reads
+        self._frame = self.reader.read()
+        self.metrics.dropped += self.reader.short_reads - dropped
+
+        # 快取的解析度與實際輸出不符時作廢快取，由呼叫端重新連線
+        if self.stream_info.ready.is_set() and self.stream_info.size != self.size:
+            logger.warning(f"[{self.camera_id}] Stream size changed to {self.stream_info.size}")
+            if self.probe_cache is not None:
+                self.probe_cache.invalidate(self.url)
+            self._frame = None
+        if self._frame is None and self.probe_cache is not None:
+            self.probe_cache.invalidate(self.url)
+        return self._frame is not None
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        frame, self._frame = self._frame, None
+        # 交出的影像移出緩衝池，之後的 grab() 不會覆寫呼叫端仍在編碼的影像
+        if frame is not None and self.reader is not None:
+            self.reader.detach(frame)
+        return frame
+
+    def release(self):
+        process, self.process = self.process, None
+        self.reader = None
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+@register_backend('pyav')
+class PyAVBackend(CaptureBackend):
+    """
+    PyAV demux/decode. Decoding runs on FFmpeg's frame/slice threads; grab()
+    decodes one frame and retrieve() converts it to BGR. With
+    keyframes_only the decoder skips non-key packets entirely, which suits
+    cameras analysed at well under the GOP rate.
+    """
+
+    def __init__(self, url: str, camera_id, timeout: float = 10,
+                 keyframes_only: bool = False, **options):
+        super().__init__(url, camera_id)
+        self.container = None
+        self._frames = None
+        self._frame = None
+        if av is None:
+            logger.error(f"[{camera_id}] PyAV backend requested but the 'av' package is not installed")
+            return
+        try:
+            self.container = av.open(url, options={'rtsp_transport': 'tcp'}, timeout=timeout)
+            self.stream = self.container.streams.video[0]
+            self.stream.thread_type = 'AUTO'
+            if keyframes_only:
+                self.stream.codec_context.skip_frame = 'NONKEY'
+            self._frames = self._decode()
+        except Exception as e:
+            logger.error(f"[{camera_id}] PyAV failed to open stream: {e}")
+            self.release()
+
+    def _decode(self):
+        for packet in self.container.demux(self.stream):
+            if packet.dts is None:
+                continue
+            try:
+                frames = packet.decode()
+            except Exception as e:
+                # 單一損壞封包不中斷串流，只計入丟棄
+                self.metrics.dropped += 1
+                logger.debug(f"[{self.camera_id}] PyAV decode error: {e}")
+                continue
+            yield from frames
+
+    def isOpened(self) -> bool:
+        return self._frames is not None
+
+    def _grab(self) -> bool:
+        if self._frames is None:
+            return False
+        try:
+            self._frame = next(self._frames)
+            return True
+        except StopIteration:
+            self._frames = None
+        except Exception as e:
+            logger.warning(f"[{self.camera_id}] PyAV demux failed: {e}")
+            self._frames = None
+        return False
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        if self._frame is None:
+            return None
+        frame, self._frame = self._frame, None
+        return frame.to_ndarray(format='bgr24')
+
+    def release(self):
+        self._frames = None
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+@register_backend('file')
+class FileReplayBackend(CaptureBackend):
+    """
+    Replays a local video file, or a directory of images in name order, in a
+    loop and paced at replay_fps (0 = the file's own FPS), so a worker sees
+    it like a live camera.
+    """
+
+    def __init__(self, url: str, camera_id, replay_fps: float = 0, **options):
+        super().__init__(url, camera_id)
+        self.cap = None
+        self.images = []
+        self._index = 0
+        self._frame = None
+        if os.path.isdir(url):
+            self.images = sorted(p for p in glob.glob(os.path.join(url, '*'))
+                                 if p.lower().endswith(IMAGE_EXTENSIONS))
+            native_fps = 0
+        else:
+            self.cap = cv2.VideoCapture(url)
+            native_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.pacer = FramePacer(replay_fps or native_fps or 25)
+
+    def isOpened(self) -> bool:
+        return bool(self.images) or (self.cap is not None and self.cap.isOpened())
+
+    def _grab(self) -> bool:
+        self.pacer.wait()
+        if self.images:
+            self._frame = self.images[self._index]
+            self._index = (self._index + 1) % len(self.images)
+            return True
+        if self.cap is None:
+            return False
+        if self.cap.grab():
+            self._frame = True
+            return True
+        # 播放到結尾時從頭開始
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._frame = True if self.cap.grab() else None
+        return self._frame is not None
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        if self._frame is None:
+            return None
+        if self.images:
+            return cv2.imread(self._frame)
+        ok, frame = self.cap.retrieve()
+        return frame if ok else None
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+@register_backend('synthetic')
+class SyntheticBackend(CaptureBackend):
+    """
+    synthetic://moving generates frames in-process at the requested size and
+    FPS; synthetic://file loops a local file through FileReplayBackend.
+    """
+
+    def __init__(self, url: str, camera_id, **options):
+        super().__init__(url, camera_id)
+        params = parse_synthetic_url(url)
+        fps = float(params.get('fps', 25))
+        self.replay = None
+        self.generator = None
+        if params['kind'] == 'file':
+            self.replay = FileReplayBackend(params.get('path', ''), camera_id, replay_fps=fps)
+        else:
+            self.generator = SyntheticFrameGenerator(
+                int(params.get('width', 1280)), int(params.get('height', 720)),
+                int(params.get('objects', 4)), seed=camera_id
+            )
+            self.pacer = FramePacer(fps)
+
+    def isOpened(self) -> bool:
+        return self.generator is not None or self.replay.isOpened()
+
+    def _grab(self) -> bool:
+        if self.replay is not None:
+            return self.replay._grab()
+        self.pacer.wait()
+        return True
+
+    def _retrieve(self) -> Optional[np.ndarray]:
+        if self.replay is not None:
+            return self.replay._retrieve()
+        # 產生器重複使用同一個緩衝區，交給呼叫端的影像需另外複製
+        return self.generator.next_frame().copy()
+
+    def release(self):
+        if self.replay is not None:
+            self.replay.release()
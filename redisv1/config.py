@@ -22,14 +22,46 @@ class RedisWorkerConfig:
     WORKER_ID: int = int(os.getenv('WORKER_ID', '1'))
     NUM_WORKERS: int = int(os.getenv('NUM_WORKERS', '3'))
     WORKER_TIMEOUT: int = int(os.getenv('WORKER_TIMEOUT', '30'))
+    # Registration with the camera controller: the worker:{id}:lease is renewed
+    # every WORKER_HEARTBEAT_INTERVAL seconds and expires after WORKER_HEARTBEAT_TTL,
+    # which bounds how long cameras of a dead worker stay down
+    WORKER_HEARTBEAT_INTERVAL: float = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', '2'))
+    WORKER_HEARTBEAT_TTL: float = float(os.getenv('WORKER_HEARTBEAT_TTL', '6'))
     
     # Camera Configuration
     RECONNECT_INTERVAL: int = int(os.getenv('RECONNECT_INTERVAL', '30'))
+    # Reconnect scheduling: full-jitter exponential backoff from RECONNECT_BASE_DELAY
+    # up to RECONNECT_INTERVAL, at most MAX_CONCURRENT_CONNECTS captures opening at
+    # once per worker (all ingest processes together; a slot left by a process
+    # that died frees itself after CONNECT_SLOT_TTL seconds), and a per-camera circuit breaker that stops retrying for
+    # BREAKER_OPEN_SECONDS (doubling up to BREAKER_MAX_OPEN_SECONDS) after
+    # BREAKER_FAILURE_THRESHOLD consecutive failures
+    RECONNECT_BASE_DELAY: float = float(os.getenv('RECONNECT_BASE_DELAY', '1'))
+    MAX_CONCURRENT_CONNECTS: int = int(os.getenv('MAX_CONCURRENT_CONNECTS', '4'))
+    CONNECT_SLOT_TTL: float = float(os.getenv('CONNECT_SLOT_TTL', '60'))
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+    BREAKER_OPEN_SECONDS: float = float(os.getenv('BREAKER_OPEN_SECONDS', '60'))
+    BREAKER_MAX_OPEN_SECONDS: float = float(os.getenv('BREAKER_MAX_OPEN_SECONDS', '600'))
     FRAME_FETCH_INTERVAL: float = float(os.getenv('FRAME_FETCH_INTERVAL', '0.1'))
+    # grab: drain every packet with grab(), decode/encode only at the analysis FPS;
+    # read: decode every frame with read();
+    # latest: a reader thread drains the stream and the publisher takes the newest frame
+    CAPTURE_MODE: str = os.getenv('CAPTURE_MODE', 'grab')
+    # Default capture backend (opencv | ffmpeg | pyav | file); a camera URL can
+    # override it with a "<backend>+" prefix, e.g. pyav+rtsp://...
+    CAPTURE_BACKEND: str = os.getenv('CAPTURE_BACKEND', 'opencv')
+    PYAV_KEYFRAMES_ONLY: bool = os.getenv('PYAV_KEYFRAMES_ONLY', 'false').lower() == 'true'
+    REPLAY_FPS: float = float(os.getenv('REPLAY_FPS', '0'))  # file backend, 0 = native FPS
+    # Default frames per second published per camera (0 = every frame);
+    # overridden per camera by camera_{id}_target_fps
+    ANALYSIS_FPS: float = float(os.getenv('ANALYSIS_FPS', '0'))
     STATUS_UPDATE_INTERVAL: int = int(os.getenv('STATUS_UPDATE_INTERVAL', '5'))
+    CAMERA_STOP_TIMEOUT: float = float(os.getenv('CAMERA_STOP_TIMEOUT', '5'))
     
     # Video Processing
     VIDEO_TIMEOUT: int = int(os.getenv('VIDEO_TIMEOUT', '30'))
+    PROBE_CACHE_TTL: int = int(os.getenv('PROBE_CACHE_TTL', '86400'))
+    PROBE_TIMEOUT: float = float(os.getenv('PROBE_TIMEOUT', '15'))
     FRAME_BUFFER_SIZE: int = int(os.getenv('FRAME_BUFFER_SIZE', '5'))
     MAX_FRAME_WIDTH: int = int(os.getenv('MAX_FRAME_WIDTH', '1920'))
     MAX_FRAME_HEIGHT: int = int(os.getenv('MAX_FRAME_HEIGHT', '1080'))
@@ -39,8 +71,64 @@ class RedisWorkerConfig:
     STORAGE_PATH: str = os.getenv('STORAGE_PATH', '/app/storage')
     RETENTION_HOURS: int = int(os.getenv('RETENTION_HOURS', '24'))
     
+    # Frame Transport
+    # redis: encoded frames in camera_{id}_latest_frame; shm: raw frames in a shared-memory ring only;
+    # both: ring for co-located consumers plus encoded frames for cross-host consumers.
+    # Workers and readers must share /dev/shm (e.g. ipc: host in docker-compose).
+    FRAME_TRANSPORT: str = os.getenv('FRAME_TRANSPORT', 'redis')
+    FRAME_RING_SLOTS: int = int(os.getenv('FRAME_RING_SLOTS', '4'))
+    FRAME_RING_PREFIX: str = os.getenv('FRAME_RING_PREFIX', 'visionflow_cam')
+    
+    # Downscaled frame products published with every frame, name:WxH:mode:quality
+    # (e.g. infer:640x640:letterbox:90,preview:960x540:fit:75,thumb:320x180:fit:60)
+    RENDITIONS: str = os.getenv('RENDITIONS', '')
+    
+    # Duplicate-frame suppression: frames whose 64x36 luma thumbnail differs from the
+    # last published one by at most DUPLICATE_DIFF_THRESHOLD (mean abs diff) are not
+    # published; after FROZEN_AFTER_SECONDS of duplicates the camera is marked frozen.
+    # Off by default: enabling it stops seq/timestamp updates while a scene is static
+    FREEZE_DETECTION: bool = os.getenv('FREEZE_DETECTION', 'false').lower() == 'true'
+    DUPLICATE_DIFF_THRESHOLD: float = float(os.getenv('DUPLICATE_DIFF_THRESHOLD', '0.5'))
+    FROZEN_AFTER_SECONDS: float = float(os.getenv('FROZEN_AFTER_SECONDS', '10'))
+    
+    # Frame codecs per key class (jpeg | webp | raw | lz4), stored in the
+    # frame_codec envelope: camera_{id}_latest_frame and the history stream
+    FRAME_CODEC: str = os.getenv('FRAME_CODEC', 'jpeg')
+    HISTORY_CODEC: str = os.getenv('HISTORY_CODEC', 'jpeg')
+    
+    # On-disk archive: one JPEG every ARCHIVE_INTERVAL seconds appended to
+    # ARCHIVE_DIR/{camera_id}/{YYYYMMDD}/{HH}.seg (see segment_archive.py).
+    # 預設關閉：開啟後每台攝影機每 ARCHIVE_INTERVAL 秒多一次編碼與磁碟寫入
+    ARCHIVE_ENABLED: bool = os.getenv('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_DIR: str = os.getenv('ARCHIVE_DIR', 'frames')
+    ARCHIVE_INTERVAL: float = float(os.getenv('ARCHIVE_INTERVAL', '1'))
+    
+    # Compressed-domain preview: remux the camera stream to fMP4 fragments
+    # (camera_{id}_preview) while a viewer is registered, without decoding.
+    # The remuxer opens a second RTSP session beside the capture thread, which
+    # keeps decoding; combine with ANALYSIS_FPS so that decode only runs at the
+    # recognition rate, and make sure the camera accepts two clients.
+    PREVIEW_PASSTHROUGH: bool = os.getenv('PREVIEW_PASSTHROUGH', 'false').lower() == 'true'
+    PREVIEW_BUFFER_FRAGMENTS: int = int(os.getenv('PREVIEW_BUFFER_FRAGMENTS', '30'))
+    PREVIEW_IDLE_SECONDS: float = float(os.getenv('PREVIEW_IDLE_SECONDS', '30'))
+    
+    # Short-term frame history (Redis Stream camera_{id}_frames), trimmed by
+    # entry count and/or age in seconds; both 0 disables the stream
+    FRAME_HISTORY_MAXLEN: int = int(os.getenv('FRAME_HISTORY_MAXLEN', '0'))
+    FRAME_HISTORY_SECONDS: float = float(os.getenv('FRAME_HISTORY_SECONDS', '0'))
+    
     # Performance
+    # Cameras are packed into INGEST_PROCESSES processes (0 = one per CPU core),
+    # each running at most MAX_CONCURRENT_CAMERAS capture threads
+    INGEST_PROCESSES: int = int(os.getenv('INGEST_PROCESSES', '0'))
     MAX_CONCURRENT_CAMERAS: int = int(os.getenv('MAX_CONCURRENT_CAMERAS', '10'))
+    
+    # Prometheus /metrics endpoint served by the supervisor process; ingest
+    # processes push their per-camera metrics every METRICS_PUSH_INTERVAL seconds
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '9108'))
+    METRICS_PUSH_INTERVAL: float = float(os.getenv('METRICS_PUSH_INTERVAL', '5'))
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv('REDIS_MAX_CONNECTIONS', '16'))
     MEMORY_LIMIT_MB: int = int(os.getenv('MEMORY_LIMIT_MB', '512'))
     
     # Error Handling
@@ -77,17 +165,82 @@ class RedisWorkerConfig:
         if cls.WORKER_ID > cls.NUM_WORKERS:
             errors.append("WORKER_ID cannot be greater than NUM_WORKERS")
         
+        if cls.WORKER_HEARTBEAT_INTERVAL <= 0 or cls.WORKER_HEARTBEAT_TTL <= cls.WORKER_HEARTBEAT_INTERVAL:
+            errors.append("WORKER_HEARTBEAT_TTL must be greater than WORKER_HEARTBEAT_INTERVAL (> 0)")
+        
         # Validate intervals
         if cls.RECONNECT_INTERVAL <= 0:
             errors.append("RECONNECT_INTERVAL must be positive")
         
+        if cls.RECONNECT_BASE_DELAY <= 0:
+            errors.append("RECONNECT_BASE_DELAY must be positive")
+        
+        if cls.MAX_CONCURRENT_CONNECTS < 0 or cls.BREAKER_FAILURE_THRESHOLD < 0:
+            errors.append("MAX_CONCURRENT_CONNECTS and BREAKER_FAILURE_THRESHOLD cannot be negative")
+        
+        if cls.CONNECT_SLOT_TTL <= 0:
+            errors.append("CONNECT_SLOT_TTL must be positive")
+        
+        if cls.BREAKER_OPEN_SECONDS <= 0 or cls.BREAKER_MAX_OPEN_SECONDS < cls.BREAKER_OPEN_SECONDS:
+            errors.append("BREAKER_OPEN_SECONDS must be positive and not exceed BREAKER_MAX_OPEN_SECONDS")
+        
         if cls.FRAME_FETCH_INTERVAL <= 0:
             errors.append("FRAME_FETCH_INTERVAL must be positive")
         
+        if cls.CAPTURE_MODE not in ('grab', 'read', 'latest'):
+            errors.append("CAPTURE_MODE must be one of: grab, read, latest")
+        
+        if cls.CAPTURE_BACKEND not in ('opencv', 'ffmpeg', 'pyav', 'file'):
+            errors.append("CAPTURE_BACKEND must be one of: opencv, ffmpeg, pyav, file")
+        
+        if cls.ANALYSIS_FPS < 0:
+            errors.append("ANALYSIS_FPS cannot be negative")
+        
+        if cls.CAMERA_STOP_TIMEOUT <= 0:
+            errors.append("CAMERA_STOP_TIMEOUT must be positive")
+        
+        # Validate frame transport
+        if cls.FRAME_TRANSPORT not in ('redis', 'shm', 'both'):
+            errors.append("FRAME_TRANSPORT must be one of: redis, shm, both")
+        
+        if cls.FRAME_RING_SLOTS < 2:
+            errors.append("FRAME_RING_SLOTS must be at least 2")
+        
+        if cls.DUPLICATE_DIFF_THRESHOLD < 0:
+            errors.append("DUPLICATE_DIFF_THRESHOLD cannot be negative")
+        
+        if cls.FROZEN_AFTER_SECONDS <= 0:
+            errors.append("FROZEN_AFTER_SECONDS must be positive")
+        
+        for name in ('FRAME_CODEC', 'HISTORY_CODEC'):
+            if getattr(cls, name) not in ('jpeg', 'webp', 'raw', 'lz4'):
+                errors.append(f"{name} must be one of: jpeg, webp, raw, lz4")
+        
+        if cls.ARCHIVE_INTERVAL <= 0:
+            errors.append("ARCHIVE_INTERVAL must be positive")
+        
+        if cls.PREVIEW_BUFFER_FRAGMENTS < 1:
+            errors.append("PREVIEW_BUFFER_FRAGMENTS must be at least 1")
+        
+        if cls.FRAME_HISTORY_MAXLEN < 0 or cls.FRAME_HISTORY_SECONDS < 0:
+            errors.append("FRAME_HISTORY_MAXLEN and FRAME_HISTORY_SECONDS cannot be negative")
+        
         # Validate performance limits
         if cls.MAX_CONCURRENT_CAMERAS < 1:
             errors.append("MAX_CONCURRENT_CAMERAS must be at least 1")
         
+        if cls.INGEST_PROCESSES < 0:
+            errors.append("INGEST_PROCESSES cannot be negative")
+        
+        if cls.METRICS_ENABLED and not (1 <= cls.METRICS_PORT <= 65535):
+            errors.append("METRICS_PORT must be between 1 and 65535")
+        
+        if cls.METRICS_PUSH_INTERVAL <= 0:
+            errors.append("METRICS_PUSH_INTERVAL must be positive")
+        
+        if cls.REDIS_MAX_CONNECTIONS < 1:
+            errors.append("REDIS_MAX_CONNECTIONS must be at least 1")
+        
         if cls.MEMORY_LIMIT_MB < 64:
             errors.append("MEMORY_LIMIT_MB must be at least 64")
         
@@ -166,6 +319,13 @@ class RedisWorkerConfig:
         
         return logger
     
+    @classmethod
+    def get_ingest_process_count(cls) -> int:
+        """Number of ingest processes to run (defaults to the CPU count)."""
+        if cls.INGEST_PROCESSES > 0:
+            return cls.INGEST_PROCESSES
+        return os.cpu_count() or 1
+    
     @classmethod
     def get_worker_name(cls) -> str:
         """Get formatted worker name."""
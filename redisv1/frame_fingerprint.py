@@ -0,0 +1,60 @@
+"""
+Frame Fingerprint
+Detects duplicate frames and frozen streams from a tiny luma thumbnail, so a
+camera that keeps sending the same picture is neither re-encoded nor
+re-published.
+
+The frame is area-resized to a small BGR thumbnail first and only then
+converted to grey, so the cost is independent of the stream resolution.
+"""
+
+import logging
+from typing import Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = (64, 36)
+
+
+class FrameFingerprint:
+    """Per-camera duplicate/freeze detector."""
+
+    def __init__(self, camera_id, diff_threshold: float = 0.5, frozen_after: float = 10.0):
+        self.camera_id = camera_id
+        # 縮圖亮度的平均絕對差低於此值視為同一張畫面（吸收解碼雜訊）
+        self.diff_threshold = diff_threshold
+        self.frozen_after = frozen_after
+        self.frozen = False
+        self.last_change = None
+        self.duplicates = 0
+        self._last: Optional[np.ndarray] = None
+
+    @staticmethod
+    def thumbnail(frame: np.ndarray) -> np.ndarray:
+        small = cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def is_duplicate(self, frame: np.ndarray, now: float) -> bool:
+        """Compare with the last distinct frame and update the frozen flag."""
+        thumb = self.thumbnail(frame)
+        if self._last is not None and self._last.shape == thumb.shape:
+            diff = cv2.absdiff(thumb, self._last).mean()
+            if diff <= self.diff_threshold:
+                self.duplicates += 1
+                if not self.frozen and now - self.last_change >= self.frozen_after:
+                    self.frozen = True
+                    logger.warning(f"[{self.camera_id}] Stream frozen for {now - self.last_change:.1f}s")
+                return True
+
+        if self.frozen:
+            logger.info(f"[{self.camera_id}] Stream recovered after {self.duplicates} duplicate frames")
+        self._last = thumb
+        self.last_change = now
+        self.duplicates = 0
+        self.frozen = False
+        return False
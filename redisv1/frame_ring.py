@@ -0,0 +1,126 @@
+"""
+Shared-Memory Frame Ring (writer side)
+Publishes raw BGR frames to a per-camera shared-memory ring so co-located
+consumers can skip the JPEG encode -> Redis -> decode round trip.
+
+Layout (little endian):
+    ring header  : magic, version, slot_count, slot_capacity, latest_seq, generation
+    slot[i]      : slot header (seq_begin, seq_end, timestamp, height, width,
+                   channels, nbytes) followed by slot_capacity bytes of pixels
+
+A slot is consistent when seq_begin == seq_end. The writer bumps seq_begin
+before touching the pixels and seq_end afterwards, so readers can detect a
+torn or overwritten slot without any locking.
+"""
+
+import struct
+import logging
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b'VFRB'
+VERSION = 1
+
+HEADER_FMT = '<4sIIQQQ'
+HEADER_SIZE = 64
+LATEST_SEQ_OFFSET = struct.calcsize('<4sIIQ')
+
+SLOT_FMT = '<QQdIIIQ'
+SLOT_HEADER_SIZE = 64
+
+logger = logging.getLogger(__name__)
+
+
+def ring_name(prefix: str, camera_id) -> str:
+    """Shared-memory segment name for a camera (must match the reader)."""
+    return f"{prefix}_{camera_id}"
+
+
+class FrameRingWriter:
+    """Single-producer ring of raw frames for one camera."""
+
+    def __init__(self, camera_id, slot_count: int, slot_capacity: int, prefix: str):
+        self.camera_id = camera_id
+        self.slot_count = slot_count
+        self.slot_capacity = slot_capacity
+        self.name = ring_name(prefix, camera_id)
+        self.seq = 0
+        self._oversize_warned = False
+
+        size = HEADER_SIZE + slot_count * (SLOT_HEADER_SIZE + slot_capacity)
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # 上一個進程異常結束時殘留的區段，回收後重建
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+
+        # generation 讓讀取端可以分辨同名但已重建的區段
+        self.generation = time.time_ns()
+        struct.pack_into(HEADER_FMT, self.shm.buf, 0,
+                         MAGIC, VERSION, slot_count, slot_capacity, 0, self.generation)
+        logger.info(f"[{camera_id}] Frame ring {self.name} created "
+                    f"({slot_count} slots x {slot_capacity} bytes)")
+
+    def _slot_offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_capacity)
+
+    def write(self, frame: np.ndarray, timestamp: float) -> Optional[int]:
+        """Copy a uint8 frame into the next slot and return its sequence number."""
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_capacity:
+            if not self._oversize_warned:
+                logger.warning(f"[{self.camera_id}] Frame {frame.shape} {frame.dtype} "
+                               f"does not fit ring slot ({self.slot_capacity} bytes, see MAX_FRAME_WIDTH/"
+                               f"MAX_FRAME_HEIGHT); publishing such frames through Redis only")
+                self._oversize_warned = True
+            return None
+
+        seq = self.seq + 1
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        # 先標記寫入中，再複製像素，最後提交
+        struct.pack_into('<Q', buf, offset, seq)
+        dst = np.ndarray(frame.shape, dtype=np.uint8, buffer=buf,
+                         offset=offset + SLOT_HEADER_SIZE)
+        np.copyto(dst, frame)
+        del dst
+        struct.pack_into(SLOT_FMT, buf, offset,
+                         seq, seq, timestamp, height, width, channels, frame.nbytes)
+        struct.pack_into('<Q', buf, LATEST_SEQ_OFFSET, seq)
+
+        self.seq = seq
+        return seq
+
+    def touch(self, timestamp: float):
+        """
+        Refresh the newest slot's timestamp without copying pixels, for frames
+        skipped as duplicates: readers treat an old timestamp as a dead writer.
+        """
+        if self.seq == 0:
+            return
+        # timestamp 位於 slot 標頭的 seq_begin、seq_end 之後
+        struct.pack_into('<d', self.shm.buf, self._slot_offset(self.seq) + 16, timestamp)
+
+    def close(self):
+        """Release the segment and unlink it unless another writer has taken the name over."""
+        self.shm.close()
+        try:
+            current = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        generation = struct.unpack_from(HEADER_FMT, current.buf, 0)[5]
+        current.close()
+        if generation == self.generation:
+            current.unlink()
+        else:
+            # 攝影機已搬到其他執行緒/進程，新的區段不屬於這裡
+            resource_tracker.unregister(current._name, 'shared_memory')
@@ -0,0 +1,72 @@
+"""
+Ingest Metrics
+Metric families recorded by fetch_frame, one series per camera.
+"""
+
+import metrics
+
+FRAMES = metrics.counter('visionflow_frames_total', 'Frames read from the camera')
+FRAMES_PUBLISHED = metrics.counter('visionflow_frames_published_total', 'Frames published to Redis')
+FRAMES_DUPLICATE = metrics.counter('visionflow_frames_duplicate_total', 'Frames skipped as duplicates of the previous one')
+FRAMES_RING_SKIPPED = metrics.counter('visionflow_frames_ring_skipped_total',
+                                      'Frames that did not fit the shared-memory ring and went to Redis only')
+FRAMES_DROPPED = metrics.counter('visionflow_frames_dropped_total', 'Frames dropped by the capture backend')
+READ_FAILURES = metrics.counter('visionflow_read_failures_total', 'Failed frame reads')
+CONNECTS = metrics.counter('visionflow_connects_total', 'Capture open attempts')
+CONNECT_FAILURES = metrics.counter('visionflow_connect_failures_total', 'Capture open attempts that failed')
+RECONNECTS = metrics.counter('visionflow_reconnects_total', 'Captures closed after repeated read failures')
+UP = metrics.gauge('visionflow_camera_up', '1 while the camera delivers frames')
+FPS = metrics.gauge('visionflow_capture_fps', 'Frames read per second')
+
+READ_SECONDS = metrics.histogram('visionflow_read_seconds', 'Wall time of one read/grab call, including waiting on the stream')
+DECODE_SECONDS = metrics.histogram('visionflow_decode_seconds', 'CPU time spent decoding frames since the previous read')
+ENCODE_SECONDS = metrics.histogram('visionflow_encode_seconds', 'Time to encode the latest frame, history entry and renditions')
+ARCHIVE_SECONDS = metrics.histogram('visionflow_archive_seconds', 'Time to encode and append one frame to the segment archive')
+REDIS_WRITE_SECONDS = metrics.histogram('visionflow_redis_write_seconds', 'Latency of the per-frame Redis pipeline')
+FRAME_AGE_SECONDS = metrics.histogram('visionflow_frame_age_seconds', 'Capture-to-publish age of published frames')
+PUBLISH_SECONDS = metrics.histogram('visionflow_publish_seconds', 'Time from a frame being read to it being published')
+
+
+class CameraMetrics:
+    """Children of every family bound to one camera, looked up once per camera."""
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.frames = FRAMES.labels(camera_id, self)
+        self.published = FRAMES_PUBLISHED.labels(camera_id, self)
+        self.duplicate = FRAMES_DUPLICATE.labels(camera_id, self)
+        self.ring_skipped = FRAMES_RING_SKIPPED.labels(camera_id, self)
+        self.dropped = FRAMES_DROPPED.labels(camera_id, self)
+        self.read_failures = READ_FAILURES.labels(camera_id, self)
+        self.connects = CONNECTS.labels(camera_id, self)
+        self.connect_failures = CONNECT_FAILURES.labels(camera_id, self)
+        self.reconnects = RECONNECTS.labels(camera_id, self)
+        self.up = UP.labels(camera_id, self)
+        self.fps = FPS.labels(camera_id, self)
+        self.read_seconds = READ_SECONDS.labels(camera_id, self)
+        self.decode_seconds = DECODE_SECONDS.labels(camera_id, self)
+        self.encode_seconds = ENCODE_SECONDS.labels(camera_id, self)
+        self.archive_seconds = ARCHIVE_SECONDS.labels(camera_id, self)
+        self.redis_write_seconds = REDIS_WRITE_SECONDS.labels(camera_id, self)
+        self.frame_age_seconds = FRAME_AGE_SECONDS.labels(camera_id, self)
+        self.publish_seconds = PUBLISH_SECONDS.labels(camera_id, self)
+        self._decode_total = 0.0
+        self._dropped_total = 0
+
+    def sync_capture(self, capture_metrics):
+        """Fold the backend's cumulative decode time and drop count into the histograms/counters."""
+        decode = capture_metrics.decode_seconds - self._decode_total
+        if decode > 0:
+            self.decode_seconds.observe(decode)
+        self._decode_total = capture_metrics.decode_seconds
+        if capture_metrics.dropped > self._dropped_total:
+            self.dropped.inc(capture_metrics.dropped - self._dropped_total)
+        self._dropped_total = capture_metrics.dropped
+
+    def reset_capture(self):
+        """A new capture starts its backend counters from zero."""
+        self._decode_total = 0.0
+        self._dropped_total = 0
+
+    def close(self):
+        metrics.remove_camera(self.camera_id, owner=self)
@@ -0,0 +1,241 @@
+"""
+Ingest Supervisor
+Packs many cameras into a small, fixed pool of ingest processes. Each process
+runs one capture thread per camera (cv2 releases the GIL while decoding) and
+shares a single pooled Redis client between its threads. Processes push
+their metrics snapshot to the supervisor every metrics_interval seconds.
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Commands sent from the supervisor to an ingest process
+CMD_START = 'start'
+CMD_STOP = 'stop'
+CMD_SHUTDOWN = 'shutdown'
+
+
+def ingest_process_main(index: int, commands, target: Callable, worker_key: str,
+                        redis_factory: Callable, stop_timeout: float,
+                        metrics_queue=None, metrics_interval: float = 5.0):
+    """
+    Entry point of one ingest process.
+
+    Runs target(camera_id, camera_url, worker_key, stop_event, redis_client)
+    in a thread per camera until a shutdown command arrives. Stopping a camera
+    never blocks the command loop: the thread is signalled and reaped later,
+    and abandoned once stop_timeout expires.
+    """
+    proc_logger = logging.getLogger(f"ingest-{index}")
+    r = redis_factory()
+    cameras: Dict[str, Dict] = {}
+    stopping: List[Dict] = []
+
+    def stop_camera(camera_id):
+        entry = cameras.pop(camera_id, None)
+        if entry is None:
+            return
+        entry['stop_event'].set()
+        entry['deadline'] = time.monotonic() + stop_timeout
+        stopping.append(entry)
+
+    def reap_stopping():
+        now = time.monotonic()
+        for entry in list(stopping):
+            if not entry['thread'].is_alive():
+                stopping.remove(entry)
+            elif now >= entry['deadline']:
+                # 執行緒卡在 cap.read() 等阻塞呼叫，放棄等待（daemon 執行緒會隨進程結束）
+                proc_logger.warning(f"[{entry['camera_id']}] Capture thread did not stop "
+                                    f"within {stop_timeout}s; abandoning it")
+                stopping.remove(entry)
+
+    proc_logger.info(f"Ingest process {index} started")
+    last_push = 0.0
+    while True:
+        reap_stopping()
+        if metrics_queue is not None and time.monotonic() - last_push >= metrics_interval:
+            last_push = time.monotonic()
+            try:
+                metrics_queue.put_nowait((index, metrics.snapshot()))
+            except queue.Full:
+                pass
+        try:
+            command = commands.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+        action = command[0]
+        if action == CMD_START:
+            _, camera_id, camera_url = command
+            stop_camera(camera_id)
+            stop_event = threading.Event()
+            thread = threading.Thread(
+                target=target,
+                args=(camera_id, camera_url, worker_key, stop_event, r),
+                name=f"camera-{camera_id}",
+                daemon=True
+            )
+            thread.start()
+            cameras[camera_id] = {'camera_id': camera_id, 'thread': thread,
+                                  'stop_event': stop_event, 'camera_url': camera_url}
+            proc_logger.info(f"[{camera_id}] Capture thread started ({len(cameras)} cameras in process {index})")
+        elif action == CMD_STOP:
+            _, camera_id = command
+            stop_camera(camera_id)
+            proc_logger.info(f"[{camera_id}] Capture thread stopping")
+        elif action == CMD_SHUTDOWN:
+            for camera_id in list(cameras):
+                stop_camera(camera_id)
+            while stopping:
+                reap_stopping()
+                time.sleep(0.1)
+            break
+
+    proc_logger.info(f"Ingest process {index} exited")
+
+
+class IngestSupervisor:
+    """Assigns cameras to a fixed pool of ingest processes."""
+
+    def __init__(self, worker_key: str, target: Callable, redis_factory: Callable,
+                 process_count: int, cameras_per_process: int, stop_timeout: float = 5.0,
+                 metrics_interval: float = 0):
+        self.worker_key = worker_key
+        self.target = target
+        self.redis_factory = redis_factory
+        self.process_count = process_count
+        self.cameras_per_process = cameras_per_process
+        self.stop_timeout = stop_timeout
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * process_count
+        self.queues: List[Optional[multiprocessing.Queue]] = [None] * process_count
+        # camera_id -> (process index, camera_url)
+        self.assignments: Dict[str, tuple] = {}
+        # 各進程最近一次回報的指標快照（metrics_interval 為 0 時不收集）
+        self.metrics_interval = metrics_interval
+        self.metrics_queue = multiprocessing.Queue(maxsize=process_count * 4) if metrics_interval else None
+        self.metric_snapshots: Dict[int, Dict] = {}
+        self.metrics_lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.process_count * self.cameras_per_process
+
+    def _spawn(self, index: int):
+        commands = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=ingest_process_main,
+            args=(index, commands, self.target, self.worker_key,
+                  self.redis_factory, self.stop_timeout,
+                  self.metrics_queue, self.metrics_interval),
+            name=f"ingest-{index}",
+            daemon=False
+        )
+        process.start()
+        self.processes[index] = process
+        self.queues[index] = commands
+
+    def start(self):
+        for index in range(self.process_count):
+            self._spawn(index)
+        logger.info(f"Started {self.process_count} ingest processes "
+                    f"({self.cameras_per_process} cameras each, capacity {self.capacity})")
+
+    def _load(self) -> List[int]:
+        load = [0] * self.process_count
+        for index, _ in self.assignments.values():
+            load[index] += 1
+        return load
+
+    def assign(self, camera_id: str, camera_url: str) -> bool:
+        """Start a camera on the least loaded process; False when at capacity."""
+        if camera_id in self.assignments:
+            self.unassign(camera_id)
+        load = self._load()
+        index = min(range(self.process_count), key=lambda i: load[i])
+        if load[index] >= self.cameras_per_process:
+            logger.error(f"[{camera_id}] Ingest capacity exhausted ({self.capacity} cameras); "
+                         f"raise INGEST_PROCESSES or MAX_CONCURRENT_CAMERAS")
+            return False
+        self.queues[index].put((CMD_START, camera_id, camera_url))
+        self.assignments[camera_id] = (index, camera_url)
+        return True
+
+    def unassign(self, camera_id: str):
+        entry = self.assignments.pop(camera_id, None)
+        if entry is not None:
+            self.queues[entry[0]].put((CMD_STOP, camera_id))
+
+    def reconcile(self, desired: Dict[str, str]) -> Dict[str, int]:
+        """
+        Bring the running cameras in line with desired {camera_id: camera_url}.
+
+        Only added, removed and URL-changed cameras are touched; cameras that
+        did not fit last time are retried as additions.
+        """
+        current = {camera_id: url for camera_id, (_, url) in self.assignments.items()}
+        removed = current.keys() - desired.keys()
+        added = desired.keys() - current.keys()
+        changed = {camera_id for camera_id in desired.keys() & current.keys()
+                   if desired[camera_id] != current[camera_id]}
+
+        for camera_id in removed:
+            self.unassign(camera_id)
+        for camera_id in changed:
+            # URL 變更時原地重啟，保留原本的進程分配
+            index = self.assignments[camera_id][0]
+            self.queues[index].put((CMD_START, camera_id, desired[camera_id]))
+            self.assignments[camera_id] = (index, desired[camera_id])
+        for camera_id in added:
+            self.assign(camera_id, desired[camera_id])
+
+        summary = {'added': len(added), 'removed': len(removed), 'changed': len(changed)}
+        if any(summary.values()):
+            logger.info(f"Reconciled cameras: {summary}")
+        return summary
+
+    def collect_metrics(self) -> List[Dict]:
+        """Drain pushed snapshots; returns the latest snapshot of every process."""
+        if self.metrics_queue is None:
+            return []
+        with self.metrics_lock:
+            while True:
+                try:
+                    index, snap = self.metrics_queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.metric_snapshots[index] = snap
+            return list(self.metric_snapshots.values())
+
+    def check_processes(self):
+        """Respawn dead ingest processes and hand their cameras back."""
+        for index, process in enumerate(self.processes):
+            if process is None or process.is_alive():
+                continue
+            logger.error(f"Ingest process {index} exited with code {process.exitcode}; respawning")
+            with self.metrics_lock:
+                self.metric_snapshots.pop(index, None)
+            self._spawn(index)
+            for camera_id, (assigned, camera_url) in self.assignments.items():
+                if assigned == index:
+                    self.queues[index].put((CMD_START, camera_id, camera_url))
+
+    def stop(self):
+        for commands in self.queues:
+            if commands is not None:
+                commands.put((CMD_SHUTDOWN,))
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=self.stop_timeout + 5)
+                if process.is_alive():
+                    logger.warning(f"{process.name} did not exit in time; terminating")
+                    process.terminate()
+        self.assignments.clear()
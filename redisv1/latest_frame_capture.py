@@ -0,0 +1,91 @@
+"""
+Latest-Frame Capture
+Background reader that keeps a cv2.VideoCapture drained so the publisher
+always gets the newest frame instead of whatever is queued in OpenCV's
+internal buffer.
+
+The reader thread grab()s every packet as it arrives and only retrieve()s
+(colour-converts) when the publisher has asked for a frame, so the stream is
+never allowed to back up and conversion cost follows the publish cadence.
+"""
+
+import logging
+import threading
+from time import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameCapture:
+    """Owns a capture and hands out its freshest frame with the capture time."""
+
+    def __init__(self, cap, camera_id, stop_timeout: float = 5.0):
+        self.cap = cap
+        self.camera_id = camera_id
+        self.stop_timeout = stop_timeout
+        self.failed = False
+
+        self._cond = threading.Condition()
+        self._want = False
+        self._frame: Optional[np.ndarray] = None
+        self._captured_at = 0.0
+        self._seq = 0
+        self._grabbed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"reader-{camera_id}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ok = self.cap.grab()
+                captured_at = time()
+                if not ok:
+                    logger.warning(f"[{self.camera_id}] Reader thread failed to grab frame")
+                    break
+
+                with self._cond:
+                    self._grabbed += 1
+                    want = self._want
+                if not want:
+                    continue
+
+                ok, frame = self.cap.retrieve()
+                with self._cond:
+                    if ok:
+                        self._frame = frame
+                        self._captured_at = captured_at
+                        self._seq += 1
+                        self._want = False
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self.failed = not self._stop.is_set()
+                self._cond.notify_all()
+            # 只在讀取執行緒內釋放，避免與 grab() 併發
+            self.cap.release()
+
+    def read(self, timeout: float) -> Tuple[Optional[np.ndarray], Optional[float]]:
+        """Wait for the next fresh frame; returns (frame, captured_at) or (None, None)."""
+        with self._cond:
+            seq = self._seq
+            self._want = True
+            self._cond.wait_for(lambda: self._seq != seq or self.failed, timeout)
+            if self._seq == seq:
+                return None, None
+            return self._frame, self._captured_at
+
+    def take_grabbed(self) -> int:
+        """Number of packets grabbed since the last call (for FPS measurement)."""
+        with self._cond:
+            grabbed, self._grabbed = self._grabbed, 0
+            return grabbed
+
+    def release(self):
+        self._stop.set()
+        self._thread.join(timeout=self.stop_timeout)
+        if self._thread.is_alive():
+            logger.warning(f"[{self.camera_id}] Reader thread still blocked after {self.stop_timeout}s")
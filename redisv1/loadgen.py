@@ -0,0 +1,141 @@
+"""
+Ingest Load Generator
+Registers N synthetic cameras on a worker through worker_{id}_urls and
+reports what the worker sustains: publish FPS, capture-thread CPU per camera,
+Redis network bytes per second and capture-to-publish latency.
+
+Usage:
+    python loadgen.py --worker-id 1 --cameras 50 --width 1920 --height 1080 --fps 25
+    python loadgen.py --worker-id 1 --cameras 20 --source /data/clip.mp4 --duration 300
+
+Camera IDs start at --id-base (default 900000) so they never collide with
+real cameras; they are removed again on exit unless --keep is given.
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+from urllib.parse import urlencode
+
+import redis
+
+from config import RedisWorkerConfig as Config
+
+
+def synthetic_url(args) -> str:
+    params = {'fps': args.fps}
+    if args.source:
+        return f"synthetic://file?{urlencode(dict(params, path=args.source))}"
+    params.update(width=args.width, height=args.height, objects=args.objects)
+    return f"synthetic://moving?{urlencode(params)}"
+
+
+def register_cameras(r: redis.Redis, worker_key: str, members: List[str]) -> int:
+    """SADD the members and notify the worker; returns how many were (re)added."""
+    added = r.sadd(worker_key, *members)
+    if added:
+        r.publish(f'{worker_key}_update', 'updated')
+    return added
+
+
+def unregister_cameras(r: redis.Redis, worker_key: str, members: List[str], camera_ids: List[int]):
+    r.srem(worker_key, *members)
+    r.publish(f'{worker_key}_update', 'updated')
+    pipe = r.pipeline(transaction=False)
+    for camera_id in camera_ids:
+        pipe.delete(f'camera:{camera_id}', f'camera_{camera_id}_latest_frame')
+    pipe.execute()
+
+
+def sample_states(r: redis.Redis, camera_ids: List[int]) -> Dict[int, Dict[str, str]]:
+    pipe = r.pipeline(transaction=False)
+    for camera_id in camera_ids:
+        pipe.hgetall(f'camera:{camera_id}')
+    return {
+        camera_id: {k.decode(): v.decode() for k, v in state.items()}
+        for camera_id, state in zip(camera_ids, pipe.execute())
+    }
+
+
+def redis_net_bytes(r: redis.Redis) -> int:
+    stats = r.info('stats')
+    return stats['total_net_input_bytes'] + stats['total_net_output_bytes']
+
+
+def report(elapsed, previous, current, net_bytes, camera_count):
+    """Print one sample line; FPS comes from seq deltas, so it counts only published frames."""
+    fps, cpu, latency = [], [], []
+    for camera_id, state in current.items():
+        before = previous.get(camera_id, {})
+        if 'seq' in state and 'seq' in before:
+            fps.append(max(0, int(state['seq']) - int(before['seq'])) / elapsed)
+        if 'cpu_pct' in state:
+            cpu.append(float(state['cpu_pct']))
+        if 'frame_age_ms' in state:
+            latency.append(float(state['frame_age_ms']))
+
+    live = sum(1 for state in current.values() if state.get('status') == 'True')
+    line = [f"live {live}/{camera_count}"]
+    if fps:
+        line.append(f"fps/cam mean {statistics.mean(fps):.1f} min {min(fps):.1f} total {sum(fps):.0f}")
+    if cpu:
+        line.append(f"cpu/cam {statistics.mean(cpu):.1f}%")
+    if latency:
+        latency.sort()
+        p95 = latency[min(len(latency) - 1, int(len(latency) * 0.95))]
+        line.append(f"latency p50 {statistics.median(latency):.0f}ms p95 {p95:.0f}ms")
+    line.append(f"redis {net_bytes / elapsed / 1e6:.2f} MB/s")
+    print(" | ".join(line), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a redisv1 worker with synthetic cameras")
+    parser.add_argument('--worker-id', type=int, required=True)
+    parser.add_argument('--cameras', type=int, default=10)
+    parser.add_argument('--id-base', type=int, default=900000)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=25)
+    parser.add_argument('--objects', type=int, default=4)
+    parser.add_argument('--source', help="loop this video file instead of generated frames")
+    parser.add_argument('--duration', type=float, default=60, help="seconds, 0 = until interrupted")
+    parser.add_argument('--interval', type=float, default=5, help="seconds between samples")
+    parser.add_argument('--keep', action='store_true', help="leave the cameras registered on exit")
+    args = parser.parse_args()
+
+    config = Config()
+    r = redis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB,
+                    password=config.REDIS_PASSWORD)
+    worker_key = f'worker_{args.worker_id}_urls'
+    camera_ids = list(range(args.id_base, args.id_base + args.cameras))
+    url = synthetic_url(args)
+    members = [f'{camera_id}|{url}' for camera_id in camera_ids]
+
+    register_cameras(r, worker_key, members)
+    print(f"已註冊 {args.cameras} 台合成攝影機至 {worker_key}：{url}", flush=True)
+
+    started = time.time()
+    previous = sample_states(r, camera_ids)
+    last_sample, last_bytes = time.time(), redis_net_bytes(r)
+    try:
+        while not args.duration or time.time() - started < args.duration:
+            time.sleep(args.interval)
+            # camera_ctrler 同步時可能清掉工作器清單，缺少時重新註冊
+            if register_cameras(r, worker_key, members):
+                print("工作器清單被重設，已重新註冊合成攝影機", flush=True)
+
+            now, net_bytes = time.time(), redis_net_bytes(r)
+            current = sample_states(r, camera_ids)
+            report(now - last_sample, previous, current, net_bytes - last_bytes, args.cameras)
+            previous, last_sample, last_bytes = current, now, net_bytes
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not args.keep:
+            unregister_cameras(r, worker_key, members, camera_ids)
+            print("已移除合成攝影機", flush=True)
+
+
+if __name__ == "__main__":
+    main()
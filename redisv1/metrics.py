@@ -0,0 +1,182 @@
+"""
+Metrics
+Minimal per-camera counters, gauges and histograms rendered in the Prometheus
+text exposition format, without a client library dependency.
+
+Recording is a dict lookup done once per camera plus an add (and a bisect for
+histograms) per observation, cheap enough to stay on in production. Each
+ingest process records into its own registry and ships snapshot() to the
+supervisor, which merges the snapshots of all processes in render() and
+serves them on /metrics (see serve()).
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> Family, in registration order
+REGISTRY: Dict[str, 'Family'] = {}
+
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return [list(self.counts), self.sum]
+
+
+class Family:
+    """One metric name with a child per camera."""
+
+    def __init__(self, name, help_text, kind, buckets=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.buckets = tuple(buckets) if buckets else None
+        self.children = {}
+        # camera_id -> 最近取得該序列的擁有者（例如 CameraMetrics）
+        self.owners = {}
+        REGISTRY[name] = self
+
+    def labels(self, camera_id, owner=None):
+        camera_id = str(camera_id)
+        if owner is not None:
+            self.owners[camera_id] = owner
+        child = self.children.get(camera_id)
+        if child is None:
+            if self.kind == 'histogram':
+                child = HistogramChild(self.buckets)
+            elif self.kind == 'gauge':
+                child = GaugeChild()
+            else:
+                child = CounterChild()
+            self.children[camera_id] = child
+        return child
+
+
+def counter(name, help_text) -> Family:
+    return Family(name, help_text, 'counter')
+
+
+def gauge(name, help_text) -> Family:
+    return Family(name, help_text, 'gauge')
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS) -> Family:
+    return Family(name, help_text, 'histogram', buckets)
+
+
+def remove_camera(camera_id, owner=None):
+    """
+    Drop a camera's series, e.g. when it stops or moves to another process.
+    With an owner, only series still owned by it are dropped, so a thread that
+    exits after its replacement started does not take the replacement's series.
+    """
+    camera_id = str(camera_id)
+    for family in REGISTRY.values():
+        if owner is not None and family.owners.get(camera_id) is not owner:
+            continue
+        family.children.pop(camera_id, None)
+        family.owners.pop(camera_id, None)
+
+
+def snapshot() -> Dict[str, Dict[str, object]]:
+    """Picklable copy of this process' registry: {name: {camera_id: value}}."""
+    return {name: {camera_id: child.snapshot() for camera_id, child in list(family.children.items())}
+            for name, family in REGISTRY.items()}
+
+
+def _format(value) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(snapshots: List[Dict[str, Dict[str, object]]]) -> str:
+    """Merge process snapshots and render them in Prometheus text format."""
+    lines = []
+    for name, family in REGISTRY.items():
+        merged = {}
+        for snap in snapshots:
+            for camera_id, value in snap.get(name, {}).items():
+                if family.kind == 'histogram':
+                    counts, total = merged.get(camera_id, ([0] * (len(family.buckets) + 1), 0.0))
+                    merged[camera_id] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                elif family.kind == 'counter':
+                    merged[camera_id] = merged.get(camera_id, 0.0) + value
+                else:
+                    merged[camera_id] = value
+        lines.append(f"# HELP {name} {family.help}")
+        lines.append(f"# TYPE {name} {family.kind}")
+        for camera_id in sorted(merged, key=lambda c: (len(c), c)):
+            value = merged[camera_id]
+            if family.kind != 'histogram':
+                lines.append(f'{name}{{camera="{camera_id}"}} {_format(value)}')
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(family.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{camera="{camera_id}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{camera="{camera_id}"}} {repr(float(total))}')
+            lines.append(f'{name}_count{{camera="{camera_id}"}} {cumulative}')
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int, collect: Callable[[], List[Dict[str, Dict[str, object]]]], host: str = '0.0.0.0'):
+    """Serve GET /metrics from a daemon thread; collect() returns the snapshots to merge."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render(collect()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # 抓取頻繁，不寫入存取紀錄
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    logger.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return server
@@ -0,0 +1,59 @@
+"""
+Pipe Frame Reader
+Reads fixed-size rawvideo frames from an ffmpeg stdout pipe straight into a
+small pool of preallocated NumPy buffers with readinto(), so no per-frame
+bytes object is allocated and a short read can never be mistaken for a frame.
+
+A frame returned by read() is overwritten pool_size reads later unless the
+caller detach()es it, which hands the buffer over and puts a new one in the
+pool.
+"""
+
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PipeFrameReader:
+    """Exact-framing reader over a binary stream of bgr24 frames."""
+
+    def __init__(self, stream, width: int, height: int, channels: int = 3,
+                 pool_size: int = 2, camera_id=None):
+        self.stream = stream
+        self.camera_id = camera_id
+        self.frame_size = width * height * channels
+        self.short_reads = 0
+        # 輪流使用的緩衝區：回傳的 frame 在下 pool_size - 1 次讀取前保持有效
+        self._buffers = [np.empty((height, width, channels), dtype=np.uint8)
+                         for _ in range(pool_size)]
+        self._views = [memoryview(buffer).cast('B') for buffer in self._buffers]
+        self._index = 0
+
+    def read(self) -> Optional[np.ndarray]:
+        """Fill the next buffer with exactly one frame; None on EOF or a truncated frame."""
+        view = self._views[self._index]
+        filled = 0
+        while filled < self.frame_size:
+            n = self.stream.readinto(view[filled:])
+            if not n:
+                if filled:
+                    self.short_reads += 1
+                    logger.warning(f"[{self.camera_id}] Discarding truncated frame "
+                                   f"({filled}/{self.frame_size} bytes)")
+                return None
+            filled += n
+
+        frame = self._buffers[self._index]
+        self._index = (self._index + 1) % len(self._buffers)
+        return frame
+
+    def detach(self, frame: np.ndarray):
+        """Take frame out of the pool so later reads never write into it."""
+        for i, buffer in enumerate(self._buffers):
+            if buffer is frame:
+                self._buffers[i] = np.empty_like(buffer)
+                self._views[i] = memoryview(self._buffers[i]).cast('B')
+                return
@@ -0,0 +1,187 @@
+"""
+Preview Passthrough
+Remuxes a camera's compressed stream into fragmented MP4 without decoding
+(ffmpeg -c copy) and buffers the fragments in Redis for live viewers, so
+preview does not depend on the worker decoding and JPEG-encoding every frame.
+
+Redis keys:
+    camera_{id}_preview_init     ftyp+moov initialisation segment
+    camera_{id}_preview          stream of moof+mdat fragments (field 'data'),
+                                 each starting on a keyframe
+    camera_{id}_preview_viewers  refreshed with a TTL by preview consumers
+
+The remuxer only runs while the viewers key exists and stops after
+idle_seconds without one, so an unwatched camera costs nothing here. The init
+segment and fragments are deleted when a session starts and when it stops, so
+a viewer never pairs a new init segment with fragments of an older session.
+
+Limitation: the remuxer opens its own RTSP session next to the capture thread,
+which keeps decoding at its own rate; a watched camera therefore serves two
+sessions. The passthrough saves the per-frame JPEG encode for preview, not the
+decode, and cameras with a session limit need room for the second client.
+"""
+
+import logging
+import struct
+import subprocess
+import threading
+import time
+from typing import Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 一次 -c copy 不解碼；每個關鍵影格切一個 fragment，瀏覽器可從任一 fragment 開始播放
+FMP4_FLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+
+def preview_init_key(camera_id) -> str:
+    return f'camera_{camera_id}_preview_init'
+
+
+def preview_stream_key(camera_id) -> str:
+    return f'camera_{camera_id}_preview'
+
+
+def preview_viewers_key(camera_id) -> str:
+    return f'camera_{camera_id}_preview_viewers'
+
+
+def _read_exact(stream, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            return b''
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def iter_mp4_boxes(stream) -> Iterator[Tuple[bytes, bytes]]:
+    """Yield (box type, full box bytes) for each top-level MP4 box on a stream."""
+    while True:
+        header = _read_exact(stream, 8)
+        if not header:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        if size == 1:
+            extended = _read_exact(stream, 8)
+            if not extended:
+                return
+            header += extended
+            size = struct.unpack('>Q', extended)[0]
+        elif size == 0:
+            # 延伸到串流結尾的 box 不會出現在分段輸出中
+            logger.warning(f"Unbounded MP4 box {box_type!r} in fragmented output")
+            return
+        body = _read_exact(stream, size - len(header))
+        if len(body) != size - len(header):
+            return
+        yield box_type, header + body
+
+
+class PreviewPassthrough(threading.Thread):
+    """Per-camera remux thread, started lazily while someone is watching."""
+
+    def __init__(self, camera_id, camera_url: str, redis_client, stop_event,
+                 max_fragments: int = 30, idle_seconds: float = 30, timeout: float = 10):
+        super().__init__(name=f"preview-{camera_id}", daemon=True)
+        self.camera_id = camera_id
+        self.camera_url = camera_url
+        self.r = redis_client
+        self.stop_event = stop_event
+        self.max_fragments = max_fragments
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self.init_key = preview_init_key(camera_id)
+        self.stream_key = preview_stream_key(camera_id)
+        self.viewers_key = preview_viewers_key(camera_id)
+        self.process = None
+
+    def has_viewers(self) -> bool:
+        try:
+            return bool(self.r.exists(self.viewers_key))
+        except Exception as e:
+            logger.warning(f"[{self.camera_id}] Failed to check preview viewers: {e}")
+            return False
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.has_viewers():
+                self._remux()
+            self.stop_event.wait(1)
+
+    def _start_ffmpeg(self):
+        cmd = [
+            'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+            '-rtsp_transport', 'tcp',
+            '-timeout', str(int(self.timeout * 1000000)),
+            '-i', self.camera_url,
+            '-map', '0:v:0', '-c', 'copy', '-an',
+            '-f', 'mp4', '-movflags', FMP4_FLAGS,
+            'pipe:',
+        ]
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _clear(self):
+        # 清掉上一段工作階段的 init segment 與 fragment，避免觀看者混用
+        try:
+            self.r.delete(self.init_key, self.stream_key)
+        except Exception as e:
+            logger.warning(f"[{self.camera_id}] Failed to clear preview keys: {e}")
+
+    def _remux(self):
+        logger.info(f"[{self.camera_id}] Starting preview passthrough")
+        self._clear()
+        try:
+            self.process = self._start_ffmpeg()
+        except Exception as e:
+            logger.error(f"[{self.camera_id}] Failed to start preview remux: {e}")
+            return
+
+        watcher = threading.Thread(target=self._watch_viewers, name=f"preview-watch-{self.camera_id}",
+                                   daemon=True)
+        watcher.start()
+        init, moof = [], None
+        try:
+            for box_type, data in iter_mp4_boxes(self.process.stdout):
+                if box_type in (b'ftyp', b'moov'):
+                    init.append(data)
+                    if box_type == b'moov':
+                        self.r.set(self.init_key, b''.join(init))
+                        init = []
+                elif box_type == b'moof':
+                    moof = data
+                elif box_type == b'mdat' and moof is not None:
+                    self.r.xadd(self.stream_key, {'data': moof + data},
+                                maxlen=self.max_fragments, approximate=True)
+                    moof = None
+        except Exception as e:
+            logger.error(f"[{self.camera_id}] Preview passthrough failed: {e}")
+        finally:
+            self._stop_ffmpeg()
+            watcher.join(timeout=2)
+            self._clear()
+            logger.info(f"[{self.camera_id}] Preview passthrough stopped")
+
+    def _watch_viewers(self):
+        """Stop ffmpeg when the camera is stopped or nobody has watched for idle_seconds."""
+        last_seen = time.time()
+        while self.process is not None and self.process.poll() is None:
+            if self.stop_event.wait(1):
+                break
+            if self.has_viewers():
+                last_seen = time.time()
+            elif time.time() - last_seen >= self.idle_seconds:
+                break
+        self._stop_ffmpeg()
+
+    def _stop_ffmpeg(self):
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
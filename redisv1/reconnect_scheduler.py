@@ -0,0 +1,197 @@
+"""
+Reconnect Scheduler
+Spreads camera reconnects out in time so a network outage does not end in a
+synchronized reconnect storm against the NVRs:
+
+    backoff          exponential with full jitter, uniform(0, min(max, base * 2^attempt))
+    connect limit    at most N captures opening at once per worker, across all
+                     of its ingest processes: a Redis sorted set of slot tokens
+                     scored by expiry, so a slot held by a process that died is
+                     reclaimed after slot_ttl instead of leaking
+    circuit breaker  after `failure_threshold` consecutive failures a camera
+                     stops trying for an open period (doubling up to a cap),
+                     then gets a single half-open trial
+
+The breaker state is written to the camera:{id} hash via status_fields().
+"""
+
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# 先清除逾期的連線名額，未達上限時以到期時間為分數加入；回傳 1 表示取得
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+if redis.call('zcard', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('zadd', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('pexpire', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """Per-camera breaker over connect attempts."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float, max_open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0.0
+
+    def allow(self, now: float) -> bool:
+        if self.state == OPEN and now >= self.opened_until:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+            open_for = min(self.max_open_seconds, self.open_seconds * 2 ** self.trips)
+            # 開路時間也加上抖動，避免同時跳脫的攝影機同時進入半開
+            self.opened_until = now + open_for * random.uniform(0.5, 1.0)
+            self.state = OPEN
+            self.trips += 1
+            self.failures = 0
+
+
+class CameraReconnect:
+    """Reconnect state of one camera."""
+
+    def __init__(self, scheduler: 'ReconnectScheduler', camera_id):
+        self.scheduler = scheduler
+        self.camera_id = camera_id
+        self.attempt = 0
+        self.total_failures = 0
+        self.jitter_next = False
+        self.breaker = CircuitBreaker(scheduler.failure_threshold, scheduler.open_seconds,
+                                      scheduler.max_open_seconds)
+
+    def wait(self, stop_event) -> bool:
+        """Sleep until the next attempt is allowed; False when stop_event was set."""
+        now = time.time()
+        if not self.breaker.allow(now):
+            # 開路期間不嘗試連線，期滿後進入半開狀態只試一次
+            if stop_event.wait(self.breaker.opened_until - now):
+                return False
+            self.breaker.allow(time.time())
+            return True
+        if self.attempt == 0 and not self.jitter_next:
+            return not stop_event.is_set()
+        self.jitter_next = False
+        return not stop_event.wait(self.scheduler.backoff(self.attempt))
+
+    def success(self):
+        """The capture delivered a frame."""
+        self.attempt = 0
+        self.breaker.record_success()
+
+    def failure(self):
+        """A connect failed, or a connection dropped before delivering frames."""
+        self.attempt += 1
+        self.total_failures += 1
+        before = self.breaker.state
+        self.breaker.record_failure(time.time())
+        if self.breaker.state == OPEN and before != OPEN:
+            logger.warning(f"[{self.camera_id}] Circuit breaker open for "
+                           f"{self.breaker.opened_until - time.time():.0f}s after repeated connect failures")
+
+    def disconnected(self):
+        """A working stream dropped; the next connect is still jittered."""
+        self.jitter_next = True
+
+    def status_fields(self) -> Dict[str, str]:
+        return {
+            'breaker': self.breaker.state,
+            'retry_at': f"{self.breaker.opened_until:.0f}" if self.breaker.state == OPEN else '0',
+            'connect_failures': str(self.total_failures),
+        }
+
+
+class ConnectLimit:
+    """Worker-wide connect slots in the Redis sorted set `key` (token -> expiry)."""
+
+    def __init__(self, key: str, limit: int, slot_ttl: float):
+        self.key = key
+        self.limit = limit
+        self.slot_ttl = slot_ttl
+        self._acquire = None
+
+    def try_acquire(self, redis_client, token: str) -> bool:
+        if self._acquire is None:
+            self._acquire = redis_client.register_script(ACQUIRE_SLOT_SCRIPT)
+        now = time.time()
+        acquired = self._acquire(
+            keys=[self.key],
+            args=[now, self.limit, now + self.slot_ttl, token, int(self.slot_ttl * 2000)],
+            client=redis_client)
+        return bool(acquired)
+
+    def release(self, redis_client, token: str):
+        redis_client.zrem(self.key, token)
+
+
+class ReconnectScheduler:
+    """Backoff policy and connect limit shared by all cameras of a worker."""
+
+    def __init__(self, base_delay: float, max_delay: float, max_concurrent_connects: int,
+                 failure_threshold: int, open_seconds: float, max_open_seconds: float,
+                 connect_key: str = 'connect_slots', connect_slot_ttl: float = 60):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.connect_limit = ConnectLimit(connect_key, max_concurrent_connects, connect_slot_ttl) \
+            if max_concurrent_connects > 0 else None
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** min(attempt, 16)))
+
+    def camera(self, camera_id) -> CameraReconnect:
+        return CameraReconnect(self, camera_id)
+
+    @contextmanager
+    def connect_slot(self, stop_event, redis_client, poll: float = 0.5):
+        """Hold one of the worker's connect slots; yields False if stopped while waiting."""
+        limit = self.connect_limit
+        if limit is None:
+            yield True
+            return
+        token = uuid.uuid4().hex
+        while True:
+            try:
+                if limit.try_acquire(redis_client, token):
+                    break
+            except redis.RedisError as e:
+                logger.warning(f"Failed to acquire connect slot: {e}")
+            if stop_event.wait(poll):
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            try:
+                limit.release(redis_client, token)
+            except redis.RedisError as e:
+                # 名額會在 slot_ttl 後自動失效
+                logger.warning(f"Failed to release connect slot: {e}")
@@ -0,0 +1,105 @@
+"""
+Frame Renditions
+Produces the configured set of downscaled frame products once per published
+frame so that every consumer can fetch the smallest image it needs.
+
+Spec format (RENDITIONS): comma-separated name:WIDTHxHEIGHT:mode:quality, e.g.
+    infer:640x640:letterbox:90,preview:960x540:fit:75,thumb:320x180:fit:60
+
+Modes:
+    fit        keep aspect ratio inside WIDTHxHEIGHT, never upscale
+    letterbox  fit and pad to exactly WIDTHxHEIGHT (YOLO-style grey bars)
+    stretch    resize to exactly WIDTHxHEIGHT
+
+Renditions are stored JPEG-encoded in the frame_codec envelope.
+
+Every rendition carries a transform "scale_x,scale_y,pad_x,pad_y" so that a
+point in the full frame maps to (x * scale_x + pad_x, y * scale_y + pad_y);
+the two scales differ only for stretch.
+"""
+
+import logging
+from typing import Dict, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+from frame_codec import encode_frame
+
+logger = logging.getLogger(__name__)
+
+# 版本號寫進 Redis 鍵名，格式變更時舊的消費者不會讀到不相容的資料
+RENDITION_VERSION = 1
+RENDITION_MODES = ('fit', 'letterbox', 'stretch')
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+class RenditionSpec(NamedTuple):
+    name: str
+    width: int
+    height: int
+    mode: str
+    quality: int
+
+
+def rendition_key(camera_id, name: str) -> str:
+    """Redis key of one rendition of a camera's latest frame."""
+    return f'camera_{camera_id}_{name}_v{RENDITION_VERSION}'
+
+
+def parse_renditions(spec: str) -> List[RenditionSpec]:
+    """Parse the RENDITIONS setting; raises ValueError on malformed entries."""
+    renditions = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        parts = entry.split(':')
+        if len(parts) != 4:
+            raise ValueError(f"Invalid rendition '{entry}', expected name:WxH:mode:quality")
+        name, size, mode, quality = parts
+        width, height = (int(v) for v in size.lower().split('x'))
+        if mode not in RENDITION_MODES:
+            raise ValueError(f"Invalid rendition mode '{mode}' in '{entry}'")
+        renditions.append(RenditionSpec(name, width, height, mode, int(quality)))
+    return renditions
+
+
+def render(frame: np.ndarray, spec: RenditionSpec) -> Tuple[np.ndarray, Tuple[float, float, int, int]]:
+    """Resize a frame for one rendition and return (image, (scale_x, scale_y, pad_x, pad_y))."""
+    height, width = frame.shape[:2]
+
+    if spec.mode == 'stretch':
+        image = cv2.resize(frame, (spec.width, spec.height), interpolation=cv2.INTER_AREA)
+        # 非等比縮放，水平與垂直比例分開記錄
+        return image, (spec.width / width, spec.height / height, 0, 0)
+
+    scale = min(spec.width / width, spec.height / height)
+    if spec.mode == 'fit':
+        scale = min(scale, 1.0)
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    image = frame if new_size == (width, height) else \
+        cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+
+    if spec.mode == 'letterbox':
+        pad_x = (spec.width - new_size[0]) // 2
+        pad_y = (spec.height - new_size[1]) // 2
+        image = cv2.copyMakeBorder(
+            image, pad_y, spec.height - new_size[1] - pad_y,
+            pad_x, spec.width - new_size[0] - pad_x,
+            cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR
+        )
+        return image, (scale, scale, pad_x, pad_y)
+    return image, (scale, scale, 0, 0)
+
+
+def encode_renditions(frame: np.ndarray, specs: List[RenditionSpec], seq: int = 0,
+                      timestamp: float = 0.0) -> Dict[str, Tuple[bytes, str]]:
+    """Render and JPEG-encode every rendition; returns {name: (envelope, transform)}."""
+    products = {}
+    for spec in specs:
+        image, (scale_x, scale_y, pad_x, pad_y) = render(frame, spec)
+        try:
+            data = encode_frame(image, 'jpeg', seq, timestamp, quality=spec.quality)
+        except ValueError:
+            logger.warning(f"Failed to encode rendition {spec.name}")
+            continue
+        products[spec.name] = (data, f"{scale_x:.6f},{scale_y:.6f},{pad_x},{pad_y}")
+    return products
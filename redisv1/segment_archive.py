@@ -0,0 +1,133 @@
+"""
+Segment Archive
+Append-only per-camera, per-hour archive of JPEG frames, replacing one file
+per frame on disk.
+
+Path: {base_dir}/{camera_id}/{YYYYMMDD}/{HH}.seg (local time of the frame)
+
+Layout (little endian):
+    header   'VFSG', u16 version, 10 reserved bytes               (16 bytes)
+    records  u32 length, f64 timestamp, then `length` JPEG bytes  (repeated)
+    footer   index entries f64 timestamp, u64 offset, u32 length  (repeated)
+             u64 index offset, u32 entry count, 'VFIX'            (16 bytes)
+
+The footer is written when a segment is closed (hour rollover or worker
+stop). A segment without a footer (current hour, or after a crash) is still
+readable by scanning its records; the writer rebuilds the index the same way
+and truncates any torn tail before appending again.
+
+The writer never deletes segments: retention is owned by camera_ctrler's
+RetentionService over its archive index (IMAGE_RETENTION_HOURS, ARCHIVE_QUOTA_MB).
+"""
+
+import logging
+import os
+import struct
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b'VFSG'
+INDEX_MAGIC = b'VFIX'
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct('<4sH10x')
+RECORD_HEADER = struct.Struct('<Id')
+INDEX_ENTRY = struct.Struct('<dQI')
+TRAILER = struct.Struct('<QI4s')
+
+# (timestamp, offset of the JPEG bytes, length)
+IndexEntry = Tuple[float, int, int]
+
+
+def segment_path(base_dir: str, camera_id, timestamp: float) -> str:
+    """Segment file holding frames captured in the hour of timestamp."""
+    t = time.localtime(timestamp)
+    return os.path.join(base_dir, str(camera_id), time.strftime('%Y%m%d', t), f"{time.strftime('%H', t)}.seg")
+
+
+def read_footer(f, file_size: int) -> Optional[Tuple[int, List[IndexEntry]]]:
+    """Return (index offset, entries) from a closed segment, or None without a footer."""
+    if file_size < SEGMENT_HEADER.size + TRAILER.size:
+        return None
+    f.seek(file_size - TRAILER.size)
+    index_offset, count, magic = TRAILER.unpack(f.read(TRAILER.size))
+    if magic != INDEX_MAGIC or index_offset + count * INDEX_ENTRY.size + TRAILER.size != file_size:
+        return None
+    f.seek(index_offset)
+    data = f.read(count * INDEX_ENTRY.size)
+    return index_offset, [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(count)]
+
+
+def scan_records(f, file_size: int) -> Tuple[int, List[IndexEntry]]:
+    """Rebuild the index by walking records; returns (end of last complete record, entries)."""
+    entries = []
+    position = SEGMENT_HEADER.size
+    f.seek(position)
+    while position + RECORD_HEADER.size <= file_size:
+        length, timestamp = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        data_offset = position + RECORD_HEADER.size
+        if length == 0 or data_offset + length > file_size:
+            break
+        entries.append((timestamp, data_offset, length))
+        position = data_offset + length
+        f.seek(position)
+    return position, entries
+
+
+class SegmentWriter:
+    """Appends one camera's frames to the segment of the current hour."""
+
+    def __init__(self, base_dir: str, camera_id):
+        self.base_dir = base_dir
+        self.camera_id = camera_id
+        self.path: Optional[str] = None
+        self._file = None
+        self._index: List[IndexEntry] = []
+
+    def _open(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            f = open(path, 'r+b')
+            size = os.fstat(f.fileno()).st_size
+            footer = read_footer(f, size)
+            if footer is not None:
+                end, self._index = footer
+            else:
+                end, self._index = scan_records(f, size)
+                if end != size:
+                    logger.warning(f"[{self.camera_id}] Truncating torn tail of {path} at {end}/{size}")
+            # 移除舊的索引或殘缺紀錄後接續寫入
+            f.truncate(max(end, SEGMENT_HEADER.size))
+            f.seek(0, os.SEEK_END)
+        else:
+            f = open(path, 'w+b')
+            f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION))
+            self._index = []
+        self._file = f
+        self.path = path
+
+    def append(self, jpeg: bytes, timestamp: float):
+        path = segment_path(self.base_dir, self.camera_id, timestamp)
+        if path != self.path:
+            self.close()
+            self._open(path)
+        offset = self._file.tell()
+        self._file.write(RECORD_HEADER.pack(len(jpeg), timestamp))
+        self._file.write(jpeg)
+        self._file.flush()
+        self._index.append((timestamp, offset + RECORD_HEADER.size, len(jpeg)))
+
+    def close(self):
+        """Write the index footer and close the current segment."""
+        if self._file is None:
+            return
+        try:
+            index_offset = self._file.tell()
+            self._file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in self._index))
+            self._file.write(TRAILER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        finally:
+            self._file.close()
+            self._file = None
+            self.path = None
+            self._index = []
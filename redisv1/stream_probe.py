@@ -0,0 +1,115 @@
+"""
+Stream Probe
+Caches per-URL stream properties (width, height, codec, fps) in Redis and
+parses them from the decoding ffmpeg process's own stream banner, so a
+(re)connect never needs a separate ffprobe run.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+_SIZE_RE = re.compile(r'\b(\d{2,5})x(\d{2,5})\b')
+_FPS_RE = re.compile(r'(\d+(?:\.\d+)?) fps')
+_CODEC_RE = re.compile(r'Video: (\w+)')
+
+
+def stream_probe_key(camera_url: str) -> str:
+    """Redis hash caching the probe result of a stream URL."""
+    digest = hashlib.sha1(camera_url.encode('utf-8')).hexdigest()
+    return f'stream_probe:{digest}'
+
+
+class StreamProbeCache:
+    """Redis-backed cache of stream properties keyed by URL."""
+
+    def __init__(self, redis_client, ttl: int = 86400):
+        self.r = redis_client
+        self.ttl = ttl
+
+    def get(self, camera_url: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = self.r.hgetall(stream_probe_key(camera_url))
+        except Exception as e:
+            logger.warning(f"Failed to read probe cache: {e}")
+            return None
+        if not data:
+            return None
+        data = {k.decode(): v.decode() for k, v in data.items()}
+        try:
+            return {
+                'width': int(data['width']),
+                'height': int(data['height']),
+                'codec': data.get('codec', ''),
+                'fps': float(data['fps']) if data.get('fps') else None,
+            }
+        except (KeyError, ValueError):
+            self.invalidate(camera_url)
+            return None
+
+    def put(self, camera_url: str, probe: Dict[str, Any]):
+        mapping = {k: v for k, v in probe.items() if v is not None}
+        key = stream_probe_key(camera_url)
+        pipe = self.r.pipeline(transaction=True)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, camera_url: str):
+        self.r.delete(stream_probe_key(camera_url))
+
+
+class StreamInfoParser:
+    """
+    Extracts stream properties from ffmpeg's info-level stderr banner.
+
+    The input stream line supplies codec and fps; the output stream line
+    gives the exact rawvideo size written to the pipe.
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.codec: Optional[str] = None
+        self.fps: Optional[float] = None
+        self.input_size = None
+        self.output_size = None
+        self._in_output = False
+
+    def feed(self, line: str):
+        if self.ready.is_set():
+            return
+        if line.startswith('Output #'):
+            self._in_output = True
+            return
+        if 'Stream #' not in line or 'Video:' not in line:
+            return
+
+        size = _SIZE_RE.search(line)
+        if self._in_output:
+            if size:
+                self.output_size = (int(size.group(1)), int(size.group(2)))
+                self.ready.set()
+            return
+
+        if size:
+            self.input_size = (int(size.group(1)), int(size.group(2)))
+        codec = _CODEC_RE.search(line)
+        if codec:
+            self.codec = codec.group(1)
+        fps = _FPS_RE.search(line)
+        if fps:
+            self.fps = float(fps.group(1))
+
+    @property
+    def size(self):
+        return self.output_size or self.input_size
+
+    def as_probe(self) -> Optional[Dict[str, Any]]:
+        if self.size is None:
+            return None
+        width, height = self.size
+        return {'width': width, 'height': height, 'codec': self.codec, 'fps': self.fps}
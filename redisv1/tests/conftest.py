@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 服務內的模組以檔名互相匯入（與容器內的工作目錄相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+
+from frame_codec import HEADER, MAGIC, as_jpeg, decode_frame, encode_frame, read_header
+
+
+def gradient(height=48, width=64):
+    # 平滑的漸層，讓有損編碼的誤差維持很小
+    y, x = np.mgrid[0:height, 0:width]
+    return np.dstack([x * 4, y * 5, (x + y) * 2]).astype(np.uint8)
+
+
+@pytest.mark.parametrize('codec', ['raw', 'lz4'])
+@pytest.mark.parametrize('frame', [
+    gradient(),
+    gradient()[:, :, 0],
+    (gradient().astype(np.uint16) * 257),
+    np.linspace(0, 1, 48 * 64 * 3, dtype=np.float32).reshape(48, 64, 3),
+], ids=['bgr', 'gray', 'uint16', 'float32'])
+def test_lossless_round_trip(codec, frame):
+    decoded, header = decode_frame(encode_frame(frame, codec, seq=7, timestamp=1700000000.5))
+    assert header.codec == codec
+    assert decoded.dtype == frame.dtype
+    np.testing.assert_array_equal(decoded, frame)
+
+
+@pytest.mark.parametrize('codec', ['jpeg', 'webp'])
+def test_lossy_round_trip(codec):
+    frame = gradient()
+    decoded, header = decode_frame(encode_frame(frame, codec, quality=95))
+    assert header.codec == codec
+    assert decoded.shape == frame.shape
+    assert np.abs(decoded.astype(int) - frame).mean() < 4
+
+
+def test_header_fields():
+    data = encode_frame(gradient(), 'lz4', seq=2 ** 40, timestamp=1700000000.25)
+    assert data[:4] == MAGIC
+    header = read_header(data)
+    assert header.shape == (48, 64, 3)
+    assert header.dtype == np.uint8
+    assert header.seq == 2 ** 40
+    assert header.timestamp == 1700000000.25
+
+
+def test_unknown_version_is_not_an_envelope():
+    data = bytearray(encode_frame(gradient(), 'raw'))
+    data[4] = 99
+    assert read_header(bytes(data)) is None
+
+
+def test_bare_jpeg_is_still_readable():
+    frame = gradient()
+    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+    decoded, header = decode_frame(jpeg)
+    assert header is None
+    assert decoded.shape == frame.shape
+
+
+def test_as_jpeg_passes_jpeg_through():
+    data = encode_frame(gradient(), 'jpeg')
+    assert as_jpeg(data) == data[HEADER.size:]
+    bare = cv2.imencode('.jpg', gradient())[1].tobytes()
+    assert as_jpeg(bare) is bare
+
+
+def test_as_jpeg_transcodes_other_codecs():
+    jpeg = as_jpeg(encode_frame(gradient(), 'lz4'))
+    assert jpeg[:2] == b'\xff\xd8'
+    assert cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).shape == (48, 64, 3)
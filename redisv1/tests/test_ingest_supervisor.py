@@ -0,0 +1,113 @@
+import queue
+import threading
+
+from ingest_supervisor import CMD_SHUTDOWN, CMD_START, CMD_STOP, IngestSupervisor, ingest_process_main
+
+
+def make_supervisor(process_count=2, cameras_per_process=2):
+    supervisor = IngestSupervisor('worker_1_urls', target=None, redis_factory=None,
+                                  process_count=process_count, cameras_per_process=cameras_per_process)
+    # 不啟動真正的進程，只檢查送往各進程的指令
+    supervisor.queues = [queue.Queue() for _ in range(process_count)]
+    return supervisor
+
+
+def drain(commands):
+    items = []
+    while not commands.empty():
+        items.append(commands.get_nowait())
+    return items
+
+
+def test_assign_balances_across_processes():
+    supervisor = make_supervisor()
+    for camera_id in ('1', '2', '3', '4'):
+        assert supervisor.assign(camera_id, f'rtsp://cam/{camera_id}')
+    assert supervisor._load() == [2, 2]
+    assert drain(supervisor.queues[0]) == [(CMD_START, '1', 'rtsp://cam/1'), (CMD_START, '3', 'rtsp://cam/3')]
+
+
+def test_assign_refuses_when_capacity_exhausted():
+    supervisor = make_supervisor(process_count=1, cameras_per_process=1)
+    assert supervisor.assign('1', 'rtsp://cam/1')
+    assert not supervisor.assign('2', 'rtsp://cam/2')
+    assert '2' not in supervisor.assignments
+    assert drain(supervisor.queues[0]) == [(CMD_START, '1', 'rtsp://cam/1')]
+
+
+def test_reconcile_only_touches_differences():
+    supervisor = make_supervisor()
+    supervisor.reconcile({'1': 'rtsp://cam/1', '2': 'rtsp://cam/2', '3': 'rtsp://cam/3'})
+    index_of_2 = supervisor.assignments['2'][0]
+    for commands in supervisor.queues:
+        drain(commands)
+
+    summary = supervisor.reconcile({'2': 'rtsp://cam/2b', '3': 'rtsp://cam/3', '4': 'rtsp://cam/4'})
+
+    assert summary == {'added': 1, 'removed': 1, 'changed': 1}
+    # URL 變更的攝影機留在原本的進程
+    assert supervisor.assignments['2'] == (index_of_2, 'rtsp://cam/2b')
+    sent = [command for commands in supervisor.queues for command in drain(commands)]
+    assert sorted(sent) == sorted([(CMD_STOP, '1'), (CMD_START, '2', 'rtsp://cam/2b'),
+                                   (CMD_START, '4', 'rtsp://cam/4')])
+
+
+def test_reconcile_retries_cameras_that_did_not_fit():
+    supervisor = make_supervisor(process_count=1, cameras_per_process=1)
+    desired = {'1': 'rtsp://cam/1', '2': 'rtsp://cam/2'}
+    supervisor.reconcile(desired)
+    assert len(supervisor.assignments) == 1
+
+    dropped = next(iter(supervisor.assignments))
+    del desired[dropped]
+    supervisor.reconcile(desired)
+    assert list(supervisor.assignments) == list(desired)
+
+
+class DeadProcess:
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+def test_check_processes_hands_cameras_back_to_respawned_process(monkeypatch):
+    supervisor = make_supervisor()
+    supervisor.assign('1', 'rtsp://cam/1')
+    supervisor.assign('2', 'rtsp://cam/2')
+    dead_index = supervisor.assignments['1'][0]
+    supervisor.processes = [None] * supervisor.process_count
+    supervisor.processes[dead_index] = DeadProcess()
+
+    def spawn(index):
+        supervisor.processes[index] = None
+        supervisor.queues[index] = queue.Queue()
+    monkeypatch.setattr(supervisor, '_spawn', spawn)
+
+    supervisor.check_processes()
+    assert drain(supervisor.queues[dead_index]) == [(CMD_START, '1', 'rtsp://cam/1')]
+
+
+def test_ingest_process_runs_one_thread_per_camera():
+    started = {}
+    stop_events = {}
+
+    def target(camera_id, camera_url, worker_key, stop_event, redis_client):
+        started[camera_id] = (camera_url, worker_key, redis_client)
+        stop_events[camera_id] = stop_event
+        stop_event.wait()
+
+    commands = queue.Queue()
+    process = threading.Thread(target=ingest_process_main,
+                               args=(0, commands, target, 'worker_1_urls', lambda: 'redis', 1.0))
+    process.start()
+    commands.put((CMD_START, '1', 'rtsp://cam/1'))
+    commands.put((CMD_START, '2', 'rtsp://cam/2'))
+    commands.put((CMD_STOP, '1'))
+    commands.put((CMD_SHUTDOWN,))
+    process.join(timeout=5)
+
+    assert not process.is_alive()
+    assert started == {'1': ('rtsp://cam/1', 'worker_1_urls', 'redis'),
+                       '2': ('rtsp://cam/2', 'worker_1_urls', 'redis')}
+    assert all(event.is_set() for event in stop_events.values())
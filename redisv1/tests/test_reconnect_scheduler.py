@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+import reconnect_scheduler
+from reconnect_scheduler import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ReconnectScheduler
+
+
+def make_scheduler(max_concurrent_connects=0, **kwargs):
+    return ReconnectScheduler(base_delay=1.0, max_delay=30.0, max_concurrent_connects=max_concurrent_connects,
+                              failure_threshold=3, open_seconds=10.0, max_open_seconds=40.0, **kwargs)
+
+
+@pytest.mark.parametrize('attempt, ceiling', [(0, 1.0), (1, 2.0), (3, 8.0), (5, 30.0), (1000, 30.0)])
+def test_backoff_is_full_jitter_under_the_cap(monkeypatch, attempt, ceiling):
+    scheduler = make_scheduler()
+    monkeypatch.setattr(reconnect_scheduler.random, 'uniform', lambda a, b: (a, b))
+    assert scheduler.backoff(attempt) == (0, ceiling)
+
+
+def test_backoff_samples_stay_in_bounds():
+    scheduler = make_scheduler()
+    delays = [scheduler.backoff(4) for _ in range(1000)]
+    assert all(0 <= delay <= 16.0 for delay in delays)
+    # 完全抖動：延遲分散在整個區間
+    assert min(delays) < 4.0 < 12.0 < max(delays)
+
+
+def test_breaker_opens_after_the_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=10.0, max_open_seconds=40.0)
+    for _ in range(2):
+        breaker.record_failure(100.0)
+        assert breaker.state == CLOSED
+    breaker.record_failure(100.0)
+    assert breaker.state == OPEN
+    assert 105.0 <= breaker.opened_until <= 110.0
+    assert not breaker.allow(104.9)
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=10.0, max_open_seconds=40.0)
+    breaker.record_failure(100.0)
+    assert breaker.allow(breaker.opened_until)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.trips == 0
+
+
+def test_breaker_open_period_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(reconnect_scheduler.random, 'uniform', lambda a, b: b)
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=10.0, max_open_seconds=40.0)
+    for _ in range(3):
+        breaker.record_failure(0.0)
+    periods = [breaker.opened_until]
+    for _ in range(3):
+        # 半開試連失敗一次就再次開路
+        now = breaker.opened_until
+        assert breaker.allow(now)
+        breaker.record_failure(now)
+        assert breaker.state == OPEN
+        periods.append(breaker.opened_until - now)
+    assert periods == [10.0, 20.0, 40.0, 40.0]
+
+
+def test_camera_status_fields():
+    camera = make_scheduler().camera(1)
+    for _ in range(3):
+        camera.failure()
+    fields = camera.status_fields()
+    assert fields['breaker'] == OPEN
+    assert fields['connect_failures'] == '3'
+    assert int(fields['retry_at']) > 0
+
+
+def test_connect_slot_without_limit():
+    with make_scheduler().connect_slot(threading.Event(), redis_client=None) as acquired:
+        assert acquired
+
+
+def test_connect_slots_are_shared_through_redis():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    r = fakeredis.FakeRedis()
+    # 同一工作器的兩個進程各自持有排程器，但共用 Redis 中的名額
+    first = make_scheduler(max_concurrent_connects=1, connect_key='worker:1:connecting')
+    second = make_scheduler(max_concurrent_connects=1, connect_key='worker:1:connecting')
+    stop_event = threading.Event()
+
+    with first.connect_slot(stop_event, r) as acquired:
+        assert acquired
+        assert r.zcard('worker:1:connecting') == 1
+        assert not second.connect_limit.try_acquire(r, 'other')
+        stop_event.set()
+        with second.connect_slot(stop_event, r, poll=0.01) as waited:
+            assert not waited
+
+    assert r.zcard('worker:1:connecting') == 0
+    assert second.connect_limit.try_acquire(r, 'other')
+
+
+def test_expired_slots_are_reclaimed():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    r = fakeredis.FakeRedis()
+    limit = make_scheduler(max_concurrent_connects=1, connect_slot_ttl=0.05).connect_limit
+    assert limit.try_acquire(r, 'dead-process')
+    assert not limit.try_acquire(r, 'live')
+    time.sleep(0.1)
+    assert limit.try_acquire(r, 'live')
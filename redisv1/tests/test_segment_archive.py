@@ -0,0 +1,85 @@
+import mmap
+import os
+
+from segment_archive import (INDEX_ENTRY, INDEX_MAGIC, TRAILER, SegmentWriter, read_footer, scan_records,
+                             segment_path)
+
+T0 = 1700000000.0
+FRAMES = [(T0 + i, bytes([i]) * (100 + i)) for i in range(5)]
+
+
+def write_frames(base_dir, frames=FRAMES, close=True):
+    writer = SegmentWriter(str(base_dir), 3)
+    for timestamp, jpeg in frames:
+        writer.append(jpeg, timestamp)
+    path = writer.path
+    if close:
+        writer.close()
+    return writer, path
+
+
+def read_index(path):
+    with open(path, 'rb') as f:
+        return read_footer(f, os.path.getsize(path))
+
+
+def read_payloads(path, entries):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [mm[offset:offset + length] for _, offset, length in entries]
+
+
+def test_footer_is_read_back_through_mmap(tmp_path):
+    _, path = write_frames(tmp_path)
+    assert path == segment_path(str(tmp_path), 3, T0)
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert mm[-4:] == INDEX_MAGIC
+        _, entries = read_footer(f, len(mm))
+    assert [timestamp for timestamp, _, _ in entries] == [timestamp for timestamp, _ in FRAMES]
+    assert read_payloads(path, entries) == [jpeg for _, jpeg in FRAMES]
+
+
+def test_open_segment_is_indexed_by_scanning(tmp_path):
+    writer, path = write_frames(tmp_path, close=False)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        assert read_footer(f, size) is None
+        end, entries = scan_records(f, size)
+    assert end == size
+    assert entries == writer._index
+    writer.close()
+
+
+def test_reopen_appends_after_the_old_footer(tmp_path):
+    write_frames(tmp_path, FRAMES[:3])
+    _, path = write_frames(tmp_path, FRAMES[3:])
+    _, entries = read_index(path)
+    assert [timestamp for timestamp, _, _ in entries] == [timestamp for timestamp, _ in FRAMES]
+    # 舊的索引已被截掉，不會殘留在紀錄之間
+    with open(path, 'rb') as f:
+        _, scanned = scan_records(f, entries[-1][1] + entries[-1][2])
+    assert scanned == entries
+
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    writer, path = write_frames(tmp_path, FRAMES[:3], close=False)
+    writer._file.write(b'\x10\x00\x00\x00partial')
+    writer._file.close()
+    writer._file = None
+
+    _, path = write_frames(tmp_path, FRAMES[3:])
+    _, entries = read_index(path)
+    assert len(entries) == len(FRAMES)
+    assert read_payloads(path, entries) == [jpeg for _, jpeg in FRAMES]
+
+
+def test_hour_rollover_closes_the_previous_segment(tmp_path):
+    writer = SegmentWriter(str(tmp_path), 3)
+    writer.append(b'a' * 10, T0)
+    first = writer.path
+    writer.append(b'b' * 10, T0 + 3600)
+    assert writer.path != first
+    _, entries = read_index(first)
+    assert len(entries) == 1
+    assert os.path.getsize(first) == entries[0][1] + 10 + INDEX_ENTRY.size + TRAILER.size
+    writer.close()
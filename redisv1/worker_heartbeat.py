@@ -0,0 +1,83 @@
+"""
+Worker Heartbeat
+Registers an ingest worker with the camera controller, which shards cameras
+across the workers holding a live lease by rendezvous hashing weighted by
+capacity (camera_ctrler/shard_assignment.py).
+
+Keys:
+    workers             set of every worker id that has registered
+    worker:{id}:lease   token lease (lease.py); the worker is alive while it exists.
+                        When it expires the controller moves the worker's cameras
+                        to other workers within a few seconds, and hands them back
+                        once the lease is taken again.
+    worker:{id}         hash {capacity, heartbeat}, expiring with the lease
+    worker:{id}:connecting
+                        sorted set of the worker's connect slots
+                        (reconnect_scheduler.py), shared by its ingest processes
+"""
+
+import logging
+from time import time
+
+from lease import Lease
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = 'workers'
+
+
+def worker_state_key(worker_id) -> str:
+    return f'worker:{worker_id}'
+
+
+def worker_lease_key(worker_id) -> str:
+    return f'worker:{worker_id}:lease'
+
+
+def worker_connect_slots_key(worker_id) -> str:
+    return f'worker:{worker_id}:connecting'
+
+
+class WorkerHeartbeat:
+    """Periodically renews the worker's lease so the controller keeps cameras assigned here."""
+
+    def __init__(self, redis_client, worker_id, capacity: int, interval: float, ttl: float):
+        self.r = redis_client
+        self.worker_id = str(worker_id)
+        self.key = worker_state_key(worker_id)
+        self.lease = Lease(redis_client, worker_lease_key(worker_id), ttl)
+        self.capacity = capacity
+        self.interval = interval
+        self.ttl = ttl
+        self.last_beat = 0.0
+
+    def beat(self):
+        if not self.lease.renew():
+            # 另一個使用相同 WORKER_ID 的進程持有租約，不覆寫它的登記
+            logger.error(f"Worker {self.worker_id} lease is held by another process; "
+                         f"check for duplicate WORKER_ID")
+            return
+        pipe = self.r.pipeline(transaction=True)
+        pipe.hset(self.key, mapping={'capacity': self.capacity, 'heartbeat': f"{time():.3f}"})
+        pipe.pexpire(self.key, int(self.ttl * 1000))
+        pipe.sadd(WORKERS_KEY, self.worker_id)
+        pipe.execute()
+
+    def maybe_beat(self):
+        """Call from the worker's main loop; beats once per interval."""
+        if time() - self.last_beat < self.interval:
+            return
+        self.last_beat = time()
+        try:
+            self.beat()
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} heartbeat failed: {e}")
+
+    def unregister(self):
+        """Graceful shutdown: release the lease so cameras move right away."""
+        try:
+            if self.lease.held:
+                self.r.delete(self.key)
+            self.lease.release()
+        except Exception as e:
+            logger.warning(f"Worker {self.worker_id} failed to unregister: {e}")
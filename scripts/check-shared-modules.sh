@@ -0,0 +1,39 @@
+#!/bin/bash
+
+# 共用模組一致性檢查
+# 每個服務以自己的目錄作為 Docker 建構內容，共用模組因此在各服務各放一份；
+# 此腳本確認每組副本內容完全相同，修改時需同步更新所有副本
+
+set -e
+
+cd "$(dirname "$0")/.."
+
+# 顏色定義
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+NC='\033[0m'
+
+# 模組名稱與持有副本的服務
+SHARED_MODULES=(
+    "retention.py camera_ctrler object_recognition"
+    "lease.py redisv1 camera_ctrler"
+    "camera_inventory.py camera_ctrler object_recognition"
+    "frame_codec.py redisv1 camera_ctrler object_recognition"
+)
+
+failed=0
+for entry in "${SHARED_MODULES[@]}"; do
+    read -r module first rest <<< "$entry"
+    for service in $rest; do
+        if ! cmp -s "$first/$module" "$service/$module"; then
+            echo -e "${RED}[ERROR]${NC} $service/$module 與 $first/$module 不一致"
+            failed=1
+        fi
+    done
+done
+
+if [ "$failed" -ne 0 ]; then
+    echo -e "${RED}[ERROR]${NC} 請將修改同步到所有副本"
+    exit 1
+fi
+echo -e "${GREEN}[SUCCESS]${NC} 共用模組副本一致"
@@ -0,0 +1,26 @@
+"""camera analysis_fps
+
+Revision ID: 3f1c2a7b9d10
+Revises: d9b7f6e1cdb6
+Create Date: 2026-10-18 09:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7b9d10'
+down_revision = 'd9b7f6e1cdb6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('camera', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('analysis_fps', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('camera', schema=None) as batch_op:
+        batch_op.drop_column('analysis_fps')
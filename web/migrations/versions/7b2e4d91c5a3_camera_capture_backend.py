@@ -0,0 +1,26 @@
+"""camera capture_backend
+
+Revision ID: 7b2e4d91c5a3
+Revises: 3f1c2a7b9d10
+Create Date: 2026-10-18 13:47:05.518320
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4d91c5a3'
+down_revision = '3f1c2a7b9d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('camera', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('capture_backend', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('camera', schema=None) as batch_op:
+        batch_op.drop_column('capture_backend')
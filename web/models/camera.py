@@ -6,6 +6,10 @@ class Camera(db.Model):
     name = db.Column(db.String(100), nullable=False)
     stream_url = db.Column(db.Text, nullable=False)
     recognition = db.Column(db.String(255))
+    # 送往辨識的影格率（每秒張數），None 表示使用工作器預設值
+    analysis_fps = db.Column(db.Float, nullable=True)
+    # 擷取後端（opencv / ffmpeg / pyav / file），None 表示使用工作器預設值
+    capture_backend = db.Column(db.String(20), nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     # 新增 user_id，來關聯 User 模型
@@ -1,13 +1,18 @@
 import jwt
 import datetime
+import hashlib
 from flask import Blueprint, request, jsonify, current_app
 from extensions import db
 from models.camera import Camera
 from models.user import User
+from services.camera_events import camera_to_dict, inventory_version, publish_camera_event
 from .auth_routes import token_required
 
 camera_bp = Blueprint('camera_bp', __name__)
 
+# redisv1 工作器支援的擷取後端
+CAPTURE_BACKENDS = ('opencv', 'ffmpeg', 'pyav', 'file')
+
 @camera_bp.route('/cameras', methods=['GET'])
 @token_required
 def get_cameras(current_user):
@@ -22,6 +27,8 @@ def get_cameras(current_user):
                 'name': camera.name,
                 'stream_url': camera.stream_url,
                 'recognition': camera.recognition,
+                'analysis_fps': camera.analysis_fps,
+                'capture_backend': camera.capture_backend,
                 'created_at': camera.created_at.isoformat() if hasattr(camera, 'created_at') and camera.created_at else None,
                 'updated_at': camera.updated_at.isoformat() if hasattr(camera, 'updated_at') and camera.updated_at else None
             }
@@ -49,7 +56,7 @@ def update_camera(current_user, camera_id):
             return jsonify({'message': 'No data provided'}), 400
         
         # 更新允許的欄位
-        allowed_fields = ['name', 'stream_url', '']
+        allowed_fields = ['name', 'stream_url', 'analysis_fps', 'capture_backend']
         updated_fields = []
         
         for field in allowed_fields:
@@ -64,6 +71,17 @@ def update_camera(current_user, camera_id):
                     if existing_camera:
                         return jsonify({'message': 'Camera name already exists'}), 400
                 
+                if field == 'analysis_fps' and data[field] is not None:
+                    try:
+                        data[field] = float(data[field])
+                    except (TypeError, ValueError):
+                        return jsonify({'message': 'analysis_fps must be a number'}), 400
+                    if data[field] < 0:
+                        return jsonify({'message': 'analysis_fps cannot be negative'}), 400
+                
+                if field == 'capture_backend' and data[field] not in (None, *CAPTURE_BACKENDS):
+                    return jsonify({'message': f"capture_backend must be one of: {', '.join(CAPTURE_BACKENDS)}"}), 400
+                
                 if hasattr(camera, field):
                     setattr(camera, field, data[field])
                     updated_fields.append(field)
@@ -76,6 +94,7 @@ def update_camera(current_user, camera_id):
             camera.updated_at = datetime.datetime.utcnow()
         
         db.session.commit()
+        publish_camera_event('upsert', camera)
         
         current_app.logger.info(f"Camera {camera_id} updated by user {current_user.username}: {updated_fields}")
         return jsonify({
@@ -85,7 +104,9 @@ def update_camera(current_user, camera_id):
                 'id': camera.id,
                 'name': camera.name,
                 'stream_url': camera.stream_url,
-                'recognition': camera.recognition
+                'recognition': camera.recognition,
+                'analysis_fps': camera.analysis_fps,
+                'capture_backend': camera.capture_backend
             }
         }), 200
         
@@ -129,6 +150,7 @@ def add_camera(current_user):
         
         db.session.add(new_camera)
         db.session.commit()
+        publish_camera_event('upsert', new_camera)
         
         current_app.logger.info(f"New camera '{data['name']}' added by user {current_user.username}")
         return jsonify({
@@ -159,6 +181,7 @@ def delete_camera(current_user, camera_id):
         camera_name = camera.name
         db.session.delete(camera)
         db.session.commit()
+        publish_camera_event('delete', camera_id=camera_id)
         
         current_app.logger.info(f"Camera '{camera_name}' deleted by user {current_user.username}")
         return jsonify({'message': 'Camera deleted successfully'}), 200
@@ -170,23 +193,24 @@ def delete_camera(current_user, camera_id):
 
 @camera_bp.route('/cameras/all', methods=['GET'])
 def get_all_cameras():
-    """獲取所有攝影機（供系統內部使用）"""
+    """
+    獲取所有攝影機（供系統內部使用）
+    ETag 為庫存版本加上內容雜湊，消費者以 If-None-Match 重新同步，沒有變動時回傳 304
+    """
     try:
-        cameras = Camera.query.all()
-        camera_list = []
-        
-        for camera in cameras:
-            camera_data = {
-                'id': camera.id,
-                'name': camera.name,
-                'stream_url': camera.stream_url,
-                'recognition': camera.recognition,
-                'user_id': camera.user_id
-            }
-            camera_list.append(camera_data)
+        # 先讀版本再查詢：內容只會比版本新，之後收到的事件重複套用也無妨
+        version = inventory_version()
+        cameras = Camera.query.order_by(Camera.id).all()
+        camera_list = [camera_to_dict(camera) for camera in cameras]
         
         current_app.logger.debug(f"All cameras requested: {len(camera_list)} cameras")
-        return jsonify(camera_list), 200
+        response = jsonify(camera_list)
+        if version is not None:
+            response.headers['X-Inventory-Version'] = str(version)
+        # 版本遞增失敗（Redis 中斷）時內容雜湊仍會改變，避免消費者誤收 304
+        digest = hashlib.sha1(response.get_data()).hexdigest()[:16]
+        response.set_etag(f"{version if version is not None else 'none'}-{digest}")
+        return response.make_conditional(request)
         
     except Exception as e:
         current_app.logger.error(f"Error fetching all cameras: {str(e)}")
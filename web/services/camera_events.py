@@ -0,0 +1,78 @@
+"""
+Camera inventory change events.
+
+Every create, update and delete of a camera bumps a monotonically increasing
+inventory version (Redis INCR on cameras:version) and publishes the change on
+the cameras:events channel:
+
+    {"version": 12, "op": "upsert", "camera": {...same fields as /camera/cameras/all}}
+    {"version": 13, "op": "delete", "id": 7}
+
+GET /camera/cameras/all carries the version as its ETag, so consumers that
+missed an event (version gap, reconnect) resync with an If-None-Match GET and
+get a 304 when nothing changed.
+"""
+
+import json
+
+import redis
+from flask import current_app
+
+VERSION_KEY = 'cameras:version'
+EVENTS_CHANNEL = 'cameras:events'
+
+_redis_client = None
+
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis(
+            host=current_app.config.get('REDIS_HOST', 'redis'),
+            port=current_app.config.get('REDIS_PORT', 6379),
+            db=current_app.config.get('REDIS_DB', 0),
+            socket_timeout=5,
+            socket_connect_timeout=5
+        )
+    return _redis_client
+
+
+def camera_to_dict(camera):
+    """Camera fields shared by /camera/cameras/all and the change events."""
+    return {
+        'id': camera.id,
+        'name': camera.name,
+        'stream_url': camera.stream_url,
+        'recognition': camera.recognition,
+        'analysis_fps': camera.analysis_fps,
+        'capture_backend': camera.capture_backend,
+        'user_id': camera.user_id
+    }
+
+
+def inventory_version():
+    """Current inventory version, None when Redis is unavailable."""
+    try:
+        return int(get_redis().get(VERSION_KEY) or 0)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Failed to read camera inventory version: {e}")
+        return None
+
+
+def publish_camera_event(op, camera=None, camera_id=None):
+    """
+    Publish a committed camera change. Failures are logged only: consumers
+    fall back to the conditional GET and pick the change up on resync.
+    """
+    event = {'op': op}
+    if op == 'delete':
+        event['id'] = camera_id
+    else:
+        event['camera'] = camera_to_dict(camera)
+    try:
+        r = get_redis()
+        event['version'] = r.incr(VERSION_KEY)
+        r.publish(EVENTS_CHANNEL, json.dumps(event))
+        current_app.logger.debug(f"Camera inventory version {event['version']}: {op}")
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Failed to publish camera {op} event: {e}")